@@ -1,21 +1,22 @@
-import re
 from db_config import get_connection
+import charge_totals
+import rollups
+import scheduling
+from id_allocator import next_id
+import invoice_cache
+import pagination
+from validation import APPOINTMENT_SCHEMA
+from exporter import EXPORT_CHUNK_ROWS, EXPORT_MAX_MEMORY_MB, checkpoint_path, export_table
 import mysql.connector
 from mysql.connector import IntegrityError, Error
-import csv
+import os
 
 def auto_appt_id():
-    from db_config import get_connection
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT appt_id FROM appointments WHERE appt_id LIKE 'A%'")
-    ids = [int(row[0][1:]) for row in cursor.fetchall() if row[0][1:].isdigit()]
-    cursor.close()
-    conn.close()
-    next_num = max(ids) + 1 if ids else 1
-    return f"A{next_num:03d}"
+    return next_id('appointment')
 
 class Appointment:
+    VIEW_HEADER = "Appointment_ID | Patient_ID | Doctor_ID | Date | Diagnosis"
+
     def __init__(self, appt_id, patient_id, doctor_id, date, diagnosis):
         self.appt_id = appt_id
         self.patient_id = patient_id
@@ -23,30 +24,27 @@ class Appointment:
         self.date = date
         self.diagnosis = diagnosis
 
-    def add(self):
-        # Validate patient_id
-        if not self.patient_id or not str(self.patient_id).isdigit():
-            print("Invalid Patient ID.")
-            return False
-        # Validate doctor_id
-        if not self.doctor_id or not isinstance(self.doctor_id, str):
-            print("Invalid Doctor ID.")
-            return False
-        # Validate date
-        if not self.date or not re.match(r'^\d{4}-\d{2}-\d{2}$', self.date):
-            print("Invalid Date. Use YYYY-MM-DD format.")
-            return False
-        # Validate diagnosis
-        if not self.diagnosis or not isinstance(self.diagnosis, str):
-            print("Invalid Diagnosis.")
+    def add(self, session=None):
+        values, errors = APPOINTMENT_SCHEMA.validate(self)
+        if errors:
+            print(errors[0].message)
             return False
+        self.date = values['date']
 
         try:
-            conn = get_connection()
+            conn = get_connection(session)
             cursor = conn.cursor()
+            if not scheduling.has_room(conn, self.doctor_id, self.date):
+                print(f"Doctor {self.doctor_id} is fully booked on {self.date}.")
+                conn.rollback()
+                return False
             sql = "INSERT INTO appointments (appt_id, patient_id, doctor_id, date, diagnosis) VALUES (%s, %s, %s, %s, %s)"
             cursor.execute(sql, (self.appt_id, self.patient_id, self.doctor_id, self.date, self.diagnosis))
+            rollups.apply(conn, {}, rollups.appointments(conn, [self.appt_id]))
             conn.commit()
+            scheduling.moved(None, (self.doctor_id, str(self.date)), session)
+            # The latest appointment's doctor and charge are on the invoice
+            invoice_cache.invoices.invalidate_patient(self.patient_id, session)
             return True
         except mysql.connector.errors.IntegrityError as e:
             if "PRIMARY" in str(e):
@@ -61,34 +59,40 @@ class Appointment:
             if 'cursor' in locals(): cursor.close()
             if 'conn' in locals(): conn.close()
 
-    def update(self):
-        # Validate patient_id
-        if not self.patient_id or not str(self.patient_id).isdigit():
-            print("Invalid Patient ID.")
-            return False
-        # Validate doctor_id
-        if not self.doctor_id or not isinstance(self.doctor_id, str):
-            print("Invalid Doctor ID.")
-            return False
-        # Validate date
-        if not self.date or not re.match(r'^\d{4}-\d{2}-\d{2}$', self.date):
-            print("Invalid Date. Use YYYY-MM-DD format.")
-            return False
-        # Validate diagnosis
-        if not self.diagnosis or not isinstance(self.diagnosis, str):
-            print("Invalid Diagnosis.")
+    def update(self, session=None):
+        values, errors = APPOINTMENT_SCHEMA.validate(self)
+        if errors:
+            print(errors[0].message)
             return False
+        self.date = values['date']
 
         try:
-            conn = get_connection()
+            conn = get_connection(session)
             cursor = conn.cursor()
+            before = charge_totals.appointment_charge(cursor, self.appt_id)
+            rolled_up = rollups.appointments(conn, [self.appt_id])
+            booked = scheduling.slot(conn, self.appt_id)
+            slot = (self.doctor_id, str(self.date))
+            if booked is not None and booked != slot and not scheduling.has_room(conn, *slot):
+                print(f"Doctor {self.doctor_id} is fully booked on {self.date}.")
+                conn.rollback()
+                return False
             sql = "UPDATE appointments SET patient_id=%s, doctor_id=%s, date=%s, diagnosis=%s WHERE appt_id=%s"
             cursor.execute(sql, (self.patient_id, self.doctor_id, self.date, self.diagnosis, self.appt_id))
+            updated = cursor.rowcount
+            if before is not None and str(before[0]) != str(self.patient_id):
+                # The consulting charge moves to the new patient
+                charge_totals.adjust(cursor, before[0], consulting_delta=-(before[1] or 0))
+                charge_totals.adjust(cursor, self.patient_id, consulting_delta=before[1] or 0)
+            rollups.apply(conn, rolled_up, rollups.appointments(conn, [self.appt_id]))
             conn.commit()
-            if cursor.rowcount == 0:
+            if updated == 0:
                 print("No updates found.")
                 return False
             else:
+                scheduling.moved(booked, slot, session)
+                # May have moved from another patient's invoices
+                invoice_cache.invoices.invalidate(session=session)
                 print("Appointment updated successfully.")
                 return True
         except Error as e:
@@ -102,9 +106,9 @@ class Appointment:
             if 'conn' in locals(): conn.close()
             
     @staticmethod
-    def get_by_id(appt_id):
+    def get_by_id(appt_id, session=None):
         try:
-            conn = get_connection()
+            conn = get_connection(session)
             cursor = conn.cursor(dictionary=True)
             cursor.execute("SELECT * FROM appointments WHERE appt_id = %s", (appt_id,))
             return cursor.fetchone()
@@ -116,17 +120,40 @@ class Appointment:
             if 'conn' in locals(): conn.close()
 
     @staticmethod
-    def delete(appt_id):
+    def latest_for_patient(patient_id, session=None):
         try:
-            conn = get_connection()
+            conn = get_connection(session)
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("SELECT * FROM appointments WHERE patient_id = %s ORDER BY date DESC LIMIT 1", (patient_id,))
+            return cursor.fetchone()
+        except Exception as e:
+            print("Error fetching latest appointment:", e)
+            return None
+        finally:
+            if 'cursor' in locals(): cursor.close()
+            if 'conn' in locals(): conn.close()
+
+    @staticmethod
+    def delete(appt_id, session=None):
+        try:
+            conn = get_connection(session)
             cursor = conn.cursor()
+            before = charge_totals.appointment_charge(cursor, appt_id)
+            rolled_up = rollups.appointments(conn, [appt_id])
+            booked = scheduling.slot(conn, appt_id)
             sql = "DELETE FROM appointments WHERE appt_id=%s"
             cursor.execute(sql, (appt_id,))
+            deleted = cursor.rowcount
+            if before is not None:
+                charge_totals.adjust(cursor, before[0], consulting_delta=-(before[1] or 0))
+            rollups.apply(conn, rolled_up, {})
             conn.commit()
-            if cursor.rowcount == 0:
+            if deleted == 0:
                 print("Appointment ID not found.")
                 return False
             else:
+                scheduling.moved(booked, None, session)
+                invoice_cache.invoices.invalidate(session=session)
                 print("Appointment cancelled successfully.")
                 return True
         except Error as e:
@@ -141,21 +168,23 @@ class Appointment:
 
     @staticmethod
     def view():
+        # Streams every row page by page instead of one fetchall()
         try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM appointments")
-            rows = cursor.fetchall()
-            print("Appointment_ID | Patient_ID | Doctor_ID | Date | Diagnosis")
-            for row in rows:
+            print(Appointment.VIEW_HEADER)
+            for row in Appointment.iter_all(page_size=pagination.BATCH_PAGE_SIZE):
                 print(" | ".join(str(x) for x in row))
         except Error as e:
             print("Database error while viewing appointments:", e)
         except Exception as e:
             print("Error while viewing appointments:", e)
-        finally:
-            if 'cursor' in locals(): cursor.close()
-            if 'conn' in locals(): conn.close()
+
+    @staticmethod
+    def iter_pages(page_size=pagination.PAGE_SIZE, filters=None, sort=None, descending=False, session=None):
+        return pagination.iter_pages('appointments', page_size, filters, sort, descending, session)
+
+    @staticmethod
+    def iter_all(page_size=pagination.PAGE_SIZE, filters=None, sort=None, descending=False, session=None):
+        return pagination.iter_rows('appointments', page_size, filters, sort, descending, session)
 
     @staticmethod
     def filter_appointments():
@@ -176,8 +205,8 @@ class Appointment:
             if 'conn' in locals(): conn.close()
             
     @staticmethod
-    def days_between_appointments(patient_id):
-        conn = get_connection()
+    def days_between_appointments(patient_id, session=None):
+        conn = get_connection(session)
         cursor = conn.cursor()
         try:
             cursor.execute("SELECT date FROM appointments WHERE patient_id=%s ORDER BY date", (patient_id,))
@@ -201,26 +230,18 @@ class Appointment:
             conn.close()
 
     @staticmethod
-    def export_appointment_summary_to_csv(filename="appointment_summary.csv"):
-        conn = get_connection()
-        cursor = conn.cursor()
+    def export_appointment_summary_to_csv(filename="appointment_summary.csv", compress=False, resume=False,
+                                          chunk_rows=EXPORT_CHUNK_ROWS, max_memory_mb=EXPORT_MAX_MEMORY_MB):
         try:
-            cursor.execute("SELECT appt_id, patient_id, doctor_id, date, diagnosis, consulting_charge FROM appointments")
-            rows = cursor.fetchall()
+            rows = export_table('appointments', filename, compress, resume, chunk_rows, max_memory_mb)
             if not rows:
                 print("No appointment records to export.")
                 return
-            with open(filename, "w", newline="") as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow(["Appointment ID", "Patient ID", "Doctor ID", "Date", "Diagnosis", "Consulting Charge"])
-                for row in rows:
-                    writer.writerow(row)
-            print(f"Appointment summary exported to {filename}")
+            print(f"Appointment summary exported to {filename} ({rows} rows)")
         except Exception as e:
             print("Error exporting appointment summary:", e)
-        finally:
-            cursor.close()
-            conn.close()
+            if os.path.exists(checkpoint_path(filename)):
+                print("Export interrupted; it can be resumed from the last checkpoint.")
 
 
 
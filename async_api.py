@@ -0,0 +1,250 @@
+import asyncio
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from db_config import POOL_MAX_OVERFLOW, POOL_SIZE, PoolError
+from patient import Patient
+from doctor import Doctor
+from service import Service, ServiceUsageDB
+from appointment import Appointment
+from billing import Bill, calculate_charges, calculate_total_charge
+
+# The blocking entity methods run on a bounded thread pool. Keep the worker
+# count within the connection pool's capacity so workers never queue on
+# checkout; the concurrency limit caps how many calls are in flight at once.
+# A session= is one connection and one transaction: await the calls that use
+# it one after another. Passing it to calls that are in flight together
+# (asyncio.gather) raises PoolError instead of interleaving their statements.
+ASYNC_MAX_WORKERS = int(os.environ.get('HMS_ASYNC_WORKERS', POOL_SIZE + POOL_MAX_OVERFLOW))
+ASYNC_MAX_CONCURRENCY = int(os.environ.get('HMS_ASYNC_CONCURRENCY', ASYNC_MAX_WORKERS))
+
+
+class AsyncExecutor:
+    def __init__(self, max_workers=ASYNC_MAX_WORKERS, max_concurrency=ASYNC_MAX_CONCURRENCY):
+        self.max_workers = max_workers
+        self.max_concurrency = max_concurrency
+        self._executor = None
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._sessions = set()
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='hms-db')
+        return self._executor
+
+    def _get_semaphore(self):
+        # asyncio primitives belong to one event loop
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    async def run(self, func, *args, **kwargs):
+        session = kwargs.get('session')
+        if session is None:
+            return await self._run(func, *args, **kwargs)
+        with self._lock:
+            if id(session) in self._sessions:
+                raise PoolError("Session is already in use by another call; await its calls one at a time.")
+            self._sessions.add(id(session))
+        try:
+            return await self._run(func, *args, **kwargs)
+        finally:
+            with self._lock:
+                self._sessions.discard(id(session))
+
+    async def _run(self, func, *args, **kwargs):
+        async with self._get_semaphore():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), partial(func, *args, **kwargs))
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+        self._semaphores.clear()
+
+
+_executor = AsyncExecutor()
+
+
+def configure(max_workers=None, max_concurrency=None):
+    global _executor
+    _executor.shutdown(wait=False)
+    _executor = AsyncExecutor(max_workers or ASYNC_MAX_WORKERS, max_concurrency or ASYNC_MAX_CONCURRENCY)
+    return _executor
+
+
+async def run(func, *args, **kwargs):
+    return await _executor.run(func, *args, **kwargs)
+
+
+async def gather_limited(coros, limit):
+    # Extra per-call limit on top of the executor-wide one, for fan-outs
+    semaphore = asyncio.Semaphore(limit)
+
+    async def guarded(coro):
+        async with semaphore:
+            return await coro
+    return await asyncio.gather(*(guarded(c) for c in coros))
+
+
+# Async counterparts of the entity classes. Each call runs the blocking
+# method unchanged, so validation and return values are identical.
+class AsyncPatient:
+    @staticmethod
+    async def add(patient, session=None):
+        return await run(patient.add, session=session)
+
+    @staticmethod
+    async def update(patient, session=None):
+        return await run(patient.update, session=session)
+
+    @staticmethod
+    async def get_by_id(patient_id, session=None):
+        return await run(Patient.get_by_id, patient_id, session=session)
+
+    @staticmethod
+    async def delete(patient_id, session=None):
+        return await run(Patient.delete, patient_id, session=session)
+
+    @staticmethod
+    async def days_admitted(patient_id, session=None):
+        return await run(Patient.days_admitted, patient_id, session=session)
+
+
+class AsyncDoctor:
+    @staticmethod
+    async def add(doctor, session=None):
+        return await run(doctor.add, session=session)
+
+    @staticmethod
+    async def update(doctor, session=None):
+        return await run(doctor.update, session=session)
+
+    @staticmethod
+    async def get_by_id(doctor_id, session=None):
+        return await run(Doctor.get_by_id, doctor_id, session=session)
+
+    @staticmethod
+    async def delete(doctor_id, session=None):
+        return await run(Doctor.delete, doctor_id, session=session)
+
+
+class AsyncService:
+    @staticmethod
+    async def add(service, session=None):
+        return await run(service.add, session=session)
+
+    @staticmethod
+    async def update(service, session=None):
+        return await run(service.update, session=session)
+
+    @staticmethod
+    async def get_by_id(service_id, session=None):
+        return await run(Service.get_by_id, service_id, session=session)
+
+    @staticmethod
+    async def delete(service_id, session=None):
+        return await run(Service.delete, service_id, session=session)
+
+
+class AsyncServiceUsage:
+    @staticmethod
+    async def add_service_for_patient(patient_id, service, session=None):
+        return await run(ServiceUsageDB.add_service_for_patient, patient_id, service, session=session)
+
+    @staticmethod
+    async def get_services_for_patient(patient_id, session=None):
+        return await run(ServiceUsageDB.get_services_for_patient, patient_id, session=session)
+
+    @staticmethod
+    async def clear_services_for_patient(patient_id, session=None):
+        return await run(ServiceUsageDB.clear_services_for_patient, patient_id, session=session)
+
+
+class AsyncAppointment:
+    @staticmethod
+    async def add(appointment, session=None):
+        return await run(appointment.add, session=session)
+
+    @staticmethod
+    async def update(appointment, session=None):
+        return await run(appointment.update, session=session)
+
+    @staticmethod
+    async def get_by_id(appt_id, session=None):
+        return await run(Appointment.get_by_id, appt_id, session=session)
+
+    @staticmethod
+    async def latest_for_patient(patient_id, session=None):
+        return await run(Appointment.latest_for_patient, patient_id, session=session)
+
+    @staticmethod
+    async def delete(appt_id, session=None):
+        return await run(Appointment.delete, appt_id, session=session)
+
+    @staticmethod
+    async def days_between_appointments(patient_id, session=None):
+        return await run(Appointment.days_between_appointments, patient_id, session=session)
+
+
+class AsyncBill:
+    @staticmethod
+    async def add(bill, session=None):
+        return await run(bill.add, session=session)
+
+    @staticmethod
+    async def update(bill, session=None):
+        return await run(bill.update, session=session)
+
+    @staticmethod
+    async def get_by_id(bill_id, session=None):
+        return await run(Bill.get_by_id, bill_id, session=session)
+
+    @staticmethod
+    async def get_billed_services(bill_id, session=None):
+        return await run(Bill.get_billed_services, bill_id, session=session)
+
+    @staticmethod
+    async def delete(bill_id, session=None):
+        return await run(Bill.delete, bill_id, session=session)
+
+    @staticmethod
+    async def generate_invoice(bill, session=None):
+        return await run(bill.generate_invoice, session=session)
+
+    @staticmethod
+    async def calculate_total_charge(patient_id, session=None):
+        return await run(calculate_total_charge, patient_id, session=session)
+
+    @staticmethod
+    async def calculate_charges(patient_ids=None, session=None):
+        return await run(calculate_charges, patient_ids, session=session)
+
+
+async def fetch_bill_details(bill_id):
+    # Bill row first, then patient, latest appointment and billed services
+    # concurrently
+    bill = await AsyncBill.get_by_id(bill_id)
+    if not bill:
+        return None
+    patient, appointment, services = await asyncio.gather(
+        AsyncPatient.get_by_id(bill['patient_id']),
+        AsyncAppointment.latest_for_patient(bill['patient_id']),
+        AsyncBill.get_billed_services(bill_id),
+    )
+    return {'bill': bill, 'patient': patient, 'appointment': appointment, 'services': services}
+
+
+async def fetch_bill_details_batch(bill_ids, limit=ASYNC_MAX_CONCURRENCY):
+    bill_ids = list(bill_ids)
+    results = await gather_limited((fetch_bill_details(b) for b in bill_ids), limit)
+    return dict(zip(bill_ids, results))
@@ -0,0 +1,172 @@
+import argparse
+import datetime
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import invoice_cache
+from billing import render_invoice
+from db_config import get_connection
+from invoice_archive import get_archive
+
+# Month-end invoicing: everything the invoices of a billing-date range need
+# is read with three set-based queries on one connection (bills with their
+# patient, each patient's latest appointment with its doctor, and all the
+# billed services), the connection goes back to the pool, and the invoices
+# are rendered by a process pool. Workers only format text; they never open
+# a database connection. This process appends the results to the invoice
+# archive. Bills whose current version is archived already are skipped (see
+# invoice_cache); the in-process invoice memo is left alone, it only serves
+# interactive re-requests.
+#   python batch_invoices.py --from 2024-03-01 --to 2024-03-31 --workers 8
+INVOICE_WORKERS = int(os.environ.get('HMS_INVOICE_WORKERS', os.cpu_count() or 1))
+# One process renders and archives several thousand invoices a second, so
+# below this many the pool's start-up costs more than it saves
+POOL_THRESHOLD = 2000
+
+_BILLS = """
+    SELECT b.bill_id, b.patient_id, b.billing_date, p.name
+    FROM billing b
+    LEFT JOIN patients p ON p.patient_id = b.patient_id
+    WHERE b.billing_date BETWEEN %s AND %s
+    ORDER BY b.bill_id
+"""
+
+# The latest appointment with a doctor, per patient billed in the range
+_APPOINTMENTS = """
+    SELECT a.patient_id, d.name, d.specialization, a.consulting_charge
+    FROM (
+        SELECT patient_id, doctor_id, consulting_charge,
+               ROW_NUMBER() OVER (PARTITION BY patient_id ORDER BY date DESC) AS rn
+        FROM appointments
+        WHERE doctor_id IS NOT NULL
+          AND patient_id IN (SELECT patient_id FROM billing WHERE billing_date BETWEEN %s AND %s)
+    ) a
+    JOIN doctors d ON d.doctor_id = a.doctor_id
+    WHERE a.rn = 1
+"""
+
+_SERVICES = """
+    SELECT bs.bill_id, s.service_name, bs.cost
+    FROM billed_services bs
+    JOIN billing b ON b.bill_id = bs.bill_id
+    JOIN services s ON s.service_id = bs.service_id
+    WHERE b.billing_date BETWEEN %s AND %s
+    ORDER BY bs.bill_id, bs.id
+"""
+
+
+def fetch_invoices(start, end, session=None):
+    # [(bill_id, patient_id, billing_date, patient_name, appointment, services)]
+    # with the shapes render_invoice takes
+    conn = get_connection(session)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(_BILLS, (start, end))
+        bills = cursor.fetchall()
+        cursor.execute(_APPOINTMENTS, (start, end))
+        appointments = {str(patient_id): {'doctor_name': name, 'specialization': specialization,
+                                          'consulting_charge': charge}
+                        for patient_id, name, specialization, charge in cursor.fetchall()}
+        cursor.execute(_SERVICES, (start, end))
+        services = {}
+        for bill_id, service_name, cost in cursor.fetchall():
+            services.setdefault(bill_id, []).append({'service_name': service_name, 'cost': cost})
+    finally:
+        cursor.close()
+        conn.close()
+    return [(bill_id, patient_id, billing_date, name, appointments.get(str(patient_id)), services.get(bill_id, []))
+            for bill_id, patient_id, billing_date, name in bills]
+
+
+def _render(job):
+    # Runs in the workers: (bill_id, version, text, error)
+    bill_id, version, fields = job
+    try:
+        return bill_id, version, render_invoice(*fields), None
+    except Exception as e:
+        return bill_id, version, None, f"{type(e).__name__}: {e}"
+
+
+def generate_range(start, end, workers=INVOICE_WORKERS, archive=None):
+    # Returns a summary dict; failures are listed as (bill_id, error)
+    archive = archive or get_archive()
+    began = time.perf_counter()
+    invoices = fetch_invoices(start, end)
+    fetched = time.perf_counter()
+
+    jobs, patients, unchanged = [], {}, 0
+    for fields in invoices:
+        bill_id = fields[0]
+        version = invoice_cache.invoice_version(*fields)
+        if archive.has(bill_id, version):
+            unchanged += 1
+            continue
+        patients[bill_id] = fields[1]
+        jobs.append((bill_id, version, fields))
+
+    workers = max(1, min(workers, len(jobs)))
+    if workers == 1 or len(jobs) < POOL_THRESHOLD:
+        workers = 1
+        results = map(_render, jobs)
+    else:
+        # spawn: workers start clean instead of inheriting the parent's
+        # pooled connections through fork
+        pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+        results = pool.map(_render, jobs, chunksize=max(1, len(jobs) // (workers * 4)))
+
+    written, failures = 0, []
+    try:
+        for bill_id, version, text, error in results:
+            if error is None:
+                try:
+                    archive.append(bill_id, patients[bill_id], version, text)
+                    written += 1
+                except Exception as e:
+                    failures.append((bill_id, f"{type(e).__name__}: {e}"))
+            else:
+                failures.append((bill_id, error))
+    finally:
+        if workers > 1:
+            pool.shutdown()
+
+    elapsed = time.perf_counter() - began
+    return {
+        'bills': len(invoices),
+        'written': written,
+        'unchanged': unchanged,
+        'failed': failures,
+        'workers': workers,
+        'fetch_seconds': round(fetched - began, 3),
+        'seconds': round(elapsed, 3),
+        'per_second': round(len(invoices) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def print_summary(summary):
+    print(f"{summary['bills']} bills: {summary['written']} invoices archived, {summary['unchanged']} unchanged, "
+          f"{len(summary['failed'])} failed")
+    print(f"Finished in {summary['seconds']:.2f}s ({summary['fetch_seconds']:.2f}s fetching) with "
+          f"{summary['workers']} worker(s): {summary['per_second']:,.1f} invoices/s")
+    for bill_id, error in summary['failed'][:20]:
+        print(f"  {bill_id}: {error}")
+    if len(summary['failed']) > 20:
+        print(f"  ... and {len(summary['failed']) - 20} more")
+
+
+def parse_date(text):
+    return datetime.date.fromisoformat(text.strip()).isoformat()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate every invoice in a billing-date range.")
+    parser.add_argument('--from', dest='start', required=True, type=parse_date, metavar='YYYY-MM-DD')
+    parser.add_argument('--to', dest='end', required=True, type=parse_date, metavar='YYYY-MM-DD')
+    parser.add_argument('--workers', type=int, default=INVOICE_WORKERS)
+    args = parser.parse_args()
+    print_summary(generate_range(args.start, args.end, args.workers))
+
+
+if __name__ == "__main__":
+    main()
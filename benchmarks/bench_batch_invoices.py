@@ -0,0 +1,105 @@
+# Month-end invoicing: Bill.generate_invoice one bill at a time against
+# batch_invoices.generate_range with one and several worker processes, on a
+# scratch SQLite database of synthetic bills (three billed services each).
+# Invoices are archived under a temporary directory.
+#   python benchmarks/bench_batch_invoices.py --bills 2000,20000 --workers 4
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def populate(bills):
+    from db_config import get_connection
+    conn = get_connection()
+    cursor = conn.cursor()
+    patients = max(1, bills // 4)
+    cursor.executemany("INSERT INTO patients (patient_id, name, age, gender, admission_date, contact_no) "
+                       "VALUES (%s, %s, 40, 'F', '2024-01-01', '9999999999')",
+                       [(p, f"Bench Patient {p}") for p in range(1, patients + 1)])
+    cursor.executemany("INSERT INTO doctors (doctor_id, name, specialization, contact_no) VALUES (%s, %s, 'General', %s)",
+                       [(f"D{d:03d}", f"Dr. Bench {d}", f"8{d:09d}") for d in range(50)])
+    cursor.executemany("INSERT INTO services (service_id, service_name, cost) VALUES (%s, %s, %s)",
+                       [(f"S{s:03d}", f"Service {s}", 100 + s) for s in range(50)])
+    cursor.executemany("INSERT INTO appointments (appt_id, patient_id, doctor_id, date, diagnosis, consulting_charge) "
+                       "VALUES (%s, %s, %s, '2024-03-01', 'Checkup', 500)",
+                       [(f"A{p:07d}", p, f"D{p % 50:03d}") for p in range(1, patients + 1)])
+    cursor.executemany("INSERT INTO billing (bill_id, patient_id, total_amount, billing_date) VALUES (%s, %s, 0, %s)",
+                       [(f"X{b:07d}", b % patients + 1, f"2024-03-{b % 28 + 1:02d}") for b in range(bills)])
+    cursor.executemany("INSERT INTO billed_services (bill_id, patient_id, service_id, service_name, cost) "
+                       "VALUES (%s, %s, %s, %s, %s)",
+                       [(f"X{b:07d}", b % patients + 1, f"S{(b + k) % 50:03d}", f"Service {(b + k) % 50}", 100)
+                        for b in range(bills) for k in range(3)])
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def one_at_a_time():
+    from billing import Bill
+    from db_config import get_connection
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT bill_id, patient_id, billing_date FROM billing WHERE billing_date BETWEEN %s AND %s",
+                   ('2024-03-01', '2024-03-31'))
+    bills = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for bill_id, patient_id, billing_date in bills:
+            Bill(bill_id, patient_id, billing_date).generate_invoice()
+    return len(bills)
+
+
+def child(size, workers):
+    import batch_invoices
+    from invoice_archive import InvoiceArchive
+    populate(size)
+    start = time.perf_counter()
+    count = one_at_a_time()
+    elapsed = time.perf_counter() - start
+    print(f"{size:>8,} {'one at a time':>14} {elapsed:>8.2f} {count / elapsed:>11,.0f}")
+
+    batch_invoices.POOL_THRESHOLD = 0
+    for n in sorted({1, workers}):
+        # An empty archive each time, so every invoice is rendered
+        archive = InvoiceArchive(f'archive_x{n}')
+        summary = batch_invoices.generate_range('2024-03-01', '2024-03-31', n, archive)
+        assert not summary['failed'], summary['failed'][:3]
+        print(f"{size:>8,} {f'batch x{n}':>14} {summary['seconds']:>8.2f} {summary['per_second']:>11,.0f}")
+    summary = batch_invoices.generate_range('2024-03-01', '2024-03-31', workers, archive)
+    print(f"{size:>8,} {'batch, no-op':>14} {summary['seconds']:>8.2f} {summary['per_second']:>11,.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="One-at-a-time vs batch invoice generation.")
+    parser.add_argument('--bills', default='2000,20000')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.workers)
+        return
+
+    print(f"{'bills':>8} {'mode':>14} {'seconds':>8} {'invoices/s':>11}")
+    for size in [int(s) for s in args.bills.split(',')]:
+        # A fresh process, database and invoice directory per size
+        workdir = tempfile.mkdtemp(prefix='hms_invoice_bench_')
+        env = dict(os.environ, HMS_DB_BACKEND='sqlite', HMS_SQLITE_PATH=os.path.join(workdir, 'bench.db'),
+                   PYTHONPATH=ROOT)
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--child', str(size), '--workers', str(args.workers)],
+                       env=env, cwd=workdir, check=True)
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
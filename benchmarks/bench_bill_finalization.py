@@ -0,0 +1,106 @@
+# Bill finalization with a large service cart: the old per-line INSERT loop
+# (cart fetched into Python, summed there, one INSERT per line) against
+# Bill.add's set-based INSERT ... SELECT, on a scratch SQLite database.
+#   python benchmarks/bench_bill_finalization.py --lines 10,1000,100000
+import argparse
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def fill_cart(cursor, patient_id, lines):
+    cursor.executemany("INSERT INTO temp_service_usage (patient_id, service_id, service_name, cost) VALUES (%s, %s, %s, %s)",
+                       [(patient_id, f"S{i % 50:03d}", f"Service {i % 50}", 100 + i % 50) for i in range(lines)])
+
+
+def legacy_add(bill_id, patient_id):
+    # Bill.add before the set-based rewrite, minus its prints
+    from db_config import get_connection
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT service_id, service_name, cost FROM temp_service_usage WHERE patient_id=%s", (patient_id,))
+    services = cursor.fetchall()
+    total_amount = sum(float(s[2]) for s in services)
+    cursor.execute("SELECT 1 FROM patients WHERE patient_id=%s", (patient_id,))
+    cursor.fetchone()
+    cursor.execute("INSERT INTO billing (bill_id, patient_id, total_amount, billing_date) VALUES (%s, %s, %s, %s)",
+                   (bill_id, patient_id, total_amount, '2024-03-01'))
+    for s in services:
+        cursor.execute("INSERT INTO billed_services (bill_id, patient_id, service_id, service_name, cost) VALUES (%s, %s, %s, %s, %s)",
+                       (bill_id, patient_id, s[0], s[1], s[2]))
+    cursor.execute("DELETE FROM temp_service_usage WHERE patient_id=%s", (patient_id,))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def child(sizes, repeat):
+    from billing import Bill
+    from db_config import get_connection
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.executemany("INSERT INTO patients (patient_id, name, age, gender, admission_date, contact_no) "
+                       "VALUES (%s, %s, 40, 'F', '2024-01-01', '9999999999')",
+                       [(p, f"Bench Patient {p}") for p in range(1, 3)])
+    cursor.executemany("INSERT INTO services (service_id, service_name, cost) VALUES (%s, %s, %s)",
+                       [(f"S{s:03d}", f"Service {s}", 100 + s) for s in range(50)])
+    # Other patients' carts, so the lookups cannot get away with a scan of
+    # a table holding only this patient's lines
+    fill_cart(cursor, 2, 50000)
+    conn.commit()
+
+    for lines in sizes:
+        timings = {'legacy': [], 'set-based': []}
+        for run in range(repeat):
+            for mode in timings:
+                fill_cart(cursor, 1, lines)
+                conn.commit()
+                bill_id = f"{mode[0].upper()}{lines}-{run}"
+                start = time.perf_counter()
+                if mode == 'legacy':
+                    legacy_add(bill_id, 1)
+                else:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        assert Bill(bill_id, 1, '2024-03-01').add()
+                timings[mode].append(time.perf_counter() - start)
+                cursor.execute("SELECT COUNT(*) FROM billed_services WHERE bill_id=%s", (bill_id,))
+                assert cursor.fetchone()[0] == lines
+        legacy, fast = min(timings['legacy']), min(timings['set-based'])
+        print(f"{lines:>8,} {legacy * 1000:>10.1f} {fast * 1000:>10.1f} {legacy / fast:>8.1f}x")
+    cursor.close()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-line vs set-based bill finalization.")
+    parser.add_argument('--lines', default='10,1000,100000')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.lines.split(',')]
+
+    if args.child:
+        child(sizes, args.repeat)
+        return
+
+    workdir = tempfile.mkdtemp(prefix='hms_finalize_bench_')
+    db = os.path.join(workdir, 'bench.db')
+    env = dict(os.environ, HMS_DB_BACKEND='sqlite', HMS_SQLITE_PATH=db)
+    print(f"{'lines':>8} {'legacy ms':>10} {'set ms':>10} {'speedup':>9}")
+    subprocess.run([sys.executable, os.path.abspath(__file__), '--child', '--lines', args.lines,
+                    '--repeat', str(args.repeat)], env=env, check=True)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db + suffix):
+            os.remove(db + suffix)
+    os.rmdir(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# Peak RSS of the billing export as the table grows: the old fetchall()
+# export against the streaming exporter. Each measurement runs in a fresh
+# process on a scratch SQLite database, so peaks do not carry over.
+#   python benchmarks/bench_export_memory.py --sizes 10000,100000,1000000
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def populate(rows):
+    from db_config import get_connection
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO patients (patient_id, name, age, gender, admission_date, contact_no) "
+                   "VALUES (1, 'Bench Patient', 40, 'M', '2024-01-01', '9999999999')")
+    batch = []
+    for i in range(rows):
+        batch.append((f"X{i:08d}", 1, 100 + i % 5000, f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}"))
+        if len(batch) == 10000:
+            cursor.executemany("INSERT INTO billing (bill_id, patient_id, total_amount, billing_date) VALUES (%s, %s, %s, %s)", batch)
+            batch = []
+    if batch:
+        cursor.executemany("INSERT INTO billing (bill_id, patient_id, total_amount, billing_date) VALUES (%s, %s, %s, %s)", batch)
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def legacy_export(filename):
+    import csv
+    from db_config import get_connection
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT bill_id, patient_id, total_amount, billing_date FROM billing")
+    rows = cursor.fetchall()
+    with open(filename, "w", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["Bill ID", "Patient ID", "Total Amount", "Billing Date"])
+        for row in rows:
+            writer.writerow(row)
+    cursor.close()
+    conn.close()
+
+
+def child(mode, filename, max_memory_mb):
+    from exporter import export_table
+    start = time.perf_counter()
+    if mode == 'legacy':
+        legacy_export(filename)
+    else:
+        export_table('billing', filename, compress=(mode == 'gzip'), max_memory_mb=max_memory_mb)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in KiB on Linux
+    print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak RSS of billing exports by table size.")
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--max-memory-mb', type=float, default=None)
+    parser.add_argument('--child', choices=['legacy', 'stream', 'gzip'], help=argparse.SUPPRESS)
+    parser.add_argument('--out', help=argparse.SUPPRESS)
+    parser.add_argument('--populate', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.populate:
+        populate(args.populate)
+        return
+    if args.child:
+        child(args.child, args.out, args.max_memory_mb)
+        return
+
+    workdir = tempfile.mkdtemp(prefix='hms_export_bench_')
+    print(f"{'rows':>10} {'mode':>7} {'peak RSS MB':>12} {'seconds':>8} {'file MB':>8}")
+    for size in [int(s) for s in args.sizes.split(',')]:
+        env = dict(os.environ, HMS_DB_BACKEND='sqlite', HMS_SQLITE_PATH=os.path.join(workdir, f'bench_{size}.db'))
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--populate', str(size)], env=env, check=True)
+        for mode in ('legacy', 'stream', 'gzip'):
+            out = os.path.join(workdir, f'billing_{size}_{mode}.csv' + ('.gz' if mode == 'gzip' else ''))
+            cmd = [sys.executable, os.path.abspath(__file__), '--child', mode, '--out', out]
+            if args.max_memory_mb:
+                cmd += ['--max-memory-mb', str(args.max_memory_mb)]
+            result = subprocess.run(cmd, env=env, check=True, capture_output=True, text=True)
+            peak_kb, elapsed = result.stdout.split()[-2:]
+            print(f"{size:>10,} {mode:>7} {int(peak_kb) / 1024:>12.1f} {float(elapsed):>8.2f} "
+                  f"{os.path.getsize(out) / 1048576:>8.1f}")
+            os.remove(out)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(env['HMS_SQLITE_PATH'] + suffix):
+                os.remove(env['HMS_SQLITE_PATH'] + suffix)
+    os.rmdir(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# The index advisor on a scratch SQLite database: the entity classes' read
+# paths run with query recording on (date-range appointment lists, a
+# patient's bills and visits, bill lines, batch invoices, name search), then
+# index_advisor explains the recorded statements, flags the full scans and
+# times each affected statement before and after its suggested index.
+#   python benchmarks/bench_index_advisor.py --rows 200000
+import argparse
+import builtins
+import contextlib
+import datetime
+import io
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PATIENTS = 20000
+
+
+def fill(cursor, rows, rnd):
+    first = datetime.date(2020, 1, 1)
+    day = lambda: (first + datetime.timedelta(days=rnd.randrange(1500))).isoformat()
+    cursor.executemany("INSERT INTO patients (patient_id, name, age, gender, admission_date, contact_no) "
+                       "VALUES (%s, %s, 40, 'F', '2020-01-01', '9999999999')",
+                       [(p, f"Bench Patient {p}") for p in range(1, PATIENTS + 1)])
+    cursor.executemany("INSERT INTO doctors (doctor_id, name, specialization, contact_no) VALUES (%s, %s, 'General', %s)",
+                       [(f"D{d}", f"Dr. Bench {d}", f"{9000000000 + d}") for d in range(200)])
+    cursor.executemany("INSERT INTO appointments (appt_id, patient_id, doctor_id, date, diagnosis, consulting_charge) "
+                       "VALUES (%s, %s, %s, %s, 'Checkup', 500)",
+                       [(f"A{a}", 1 + rnd.randrange(PATIENTS), f"D{a % 200}", day()) for a in range(rows)])
+    cursor.executemany("INSERT INTO billing (bill_id, patient_id, total_amount, billing_date) VALUES (%s, %s, 1000, %s)",
+                       [(f"B{b}", 1 + rnd.randrange(PATIENTS), day()) for b in range(rows)])
+    cursor.executemany("INSERT INTO billed_services (bill_id, patient_id, service_id, service_name, cost) "
+                       "VALUES (%s, %s, NULL, 'Checkup', 1000)", [(f"B{b}", 1 + b % PATIENTS) for b in range(rows)])
+
+
+def workload(rnd):
+    # What the menus run, a few times each
+    import batch_invoices
+    from appointment import Appointment
+    from billing import Bill
+    from db_config import get_connection
+    from patient import Patient
+    answers = iter(['2022-03-01', '2022-03-07'] * 5)
+    real_input, builtins.input = builtins.input, lambda prompt='': next(answers)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(5):
+                Appointment.filter_appointments()
+            for _ in range(20):
+                patient_id = 1 + rnd.randrange(PATIENTS)
+                Appointment.days_between_appointments(patient_id)
+                Appointment.latest_for_patient(patient_id)
+                Bill.get_billed_services(f"B{rnd.randrange(PATIENTS)}")
+                # hospital_main: invoice for a patient's bill
+                conn = get_connection()
+                cursor = conn.cursor(dictionary=True)
+                cursor.execute("SELECT bill_id, billing_date FROM billing WHERE patient_id=%s", (str(patient_id),))
+                cursor.fetchall()
+                cursor.close()
+                conn.close()
+            batch_invoices.fetch_invoices('2022-03-01', '2022-03-02')
+            Patient.search_by_name('Patient 12')
+    finally:
+        builtins.input = real_input
+
+
+def child(rows, repeat):
+    import index_advisor
+    import query_stats
+    from db_config import get_connection
+    conn = get_connection()
+    cursor = conn.cursor()
+    fill(cursor, rows, random.Random(7))
+    conn.commit()
+    cursor.close()
+    conn.close()
+    print(f"{PATIENTS:,} patients, {rows:,} appointments, bills and bill lines")
+
+    query_stats.enable()
+    workload(random.Random(11))
+    statements = query_stats.recorder.statements()
+    query_stats.disable()
+    print(f"{len(statements)} distinct statements recorded\n")
+
+    start = time.perf_counter()
+    findings, suggestions, errors = index_advisor.analyze(statements)
+    print(f"explained in {(time.perf_counter() - start) * 1000:.0f} ms")
+    index_advisor.measure(suggestions, repeat)
+    index_advisor.print_report(findings, suggestions, errors)
+
+    print(f"\n{'index':<72} {'before ms':>10} {'after ms':>10}")
+    for s in suggestions:
+        if s.before_ms is not None:
+            label = f"{s.table} ({', '.join(s.columns)})"
+            print(f"{label:<72} {s.before_ms:>10.2f} {s.after_ms:>10.2f} {s.before_ms / s.after_ms:>7.0f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index advisor on a recorded workload.")
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.rows, args.repeat)
+        return
+
+    workdir = tempfile.mkdtemp(prefix='hms_advisor_bench_')
+    db = os.path.join(workdir, 'bench.db')
+    # Parameters are recorded so the timings use the workload's own values
+    env = dict(os.environ, HMS_DB_BACKEND='sqlite', HMS_SQLITE_PATH=db, HMS_SLOW_QUERY_LOG_PARAMS='1')
+    subprocess.run([sys.executable, os.path.abspath(__file__), '--child', '--rows', str(args.rows),
+                    '--repeat', str(args.repeat)], env=env, check=True, cwd=workdir)
+    for name in os.listdir(workdir):
+        os.remove(os.path.join(workdir, name))
+    os.rmdir(workdir)
+
+
+if __name__ == "__main__":
+    main()
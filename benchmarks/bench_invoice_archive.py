@@ -0,0 +1,93 @@
+# Invoice storage: one text file per invoice (the old layout) against the
+# packed invoice archive, raw and compressed. Reports write throughput,
+# the time to open the store, random-read latency and the bytes on disk.
+#   python benchmarks/bench_invoice_archive.py --invoices 100000
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def invoices(count, rnd):
+    from billing import render_invoice
+    for i in range(count):
+        services = [{'service_name': f"Service {rnd.randrange(50)}", 'cost': rnd.randrange(100, 5000)}
+                    for _ in range(rnd.randrange(0, 8))]
+        appointment = {'doctor_name': f"Dr. Bench {i % 97}", 'specialization': 'General', 'consulting_charge': 500}
+        yield (f"B{i:07d}", str(1000 + i % 25000), f"{i:016x}",
+               render_invoice(f"B{i:07d}", 1000 + i % 25000, '2024-03-01', f"Patient {i % 25000}", appointment, services))
+
+
+def disk_bytes(directory):
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(directory) for f in files)
+
+
+def latency(read, keys):
+    samples = []
+    for key in keys:
+        start = time.perf_counter()
+        read(key)
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="File per invoice vs the packed invoice archive.")
+    parser.add_argument('--invoices', type=int, default=100000)
+    parser.add_argument('--reads', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    from invoice_archive import InvoiceArchive
+    rnd = random.Random(args.seed)
+    data = list(invoices(args.invoices, rnd))
+    keys = [rnd.choice(data)[0] for _ in range(args.reads)]
+    workdir = tempfile.mkdtemp(prefix='hms_archive_bench_')
+    print(f"{'store':>12} {'write/s':>10} {'open s':>7} {'read p50/p99 us':>16} {'disk MB':>8}")
+
+    files = os.path.join(workdir, 'files')
+    os.makedirs(files)
+    start = time.perf_counter()
+    for bill_id, _, version, text in data:
+        with open(os.path.join(files, f"bill_{bill_id}_{version}.txt"), 'w', encoding='utf-8') as f:
+            f.write(text)
+    written = time.perf_counter() - start
+    start = time.perf_counter()
+    names = {name.split('_')[1]: name for name in os.listdir(files)}
+    opened = time.perf_counter() - start
+
+    def read_file(key):
+        with open(os.path.join(files, names[key]), encoding='utf-8') as f:
+            return f.read()
+    p50, p99 = latency(read_file, keys)
+    print(f"{'files':>12} {len(data) / written:>10,.0f} {opened:>7.2f} {p50:>7.1f}/{p99:<8.1f} "
+          f"{disk_bytes(files) / 1048576:>8.1f}")
+
+    for compress in (False, True):
+        directory = os.path.join(workdir, 'compressed' if compress else 'raw')
+        archive = InvoiceArchive(directory, compress=compress)
+        start = time.perf_counter()
+        for bill_id, patient_id, version, text in data:
+            archive.append(bill_id, patient_id, version, text)
+        written = time.perf_counter() - start
+        archive.close()
+        start = time.perf_counter()
+        archive = InvoiceArchive(directory)
+        opened = time.perf_counter() - start
+        p50, p99 = latency(lambda key: archive.read(archive.get(key)), keys)
+        archive.close()
+        print(f"{'archive/zlib' if compress else 'archive/raw':>12} {len(data) / written:>10,.0f} {opened:>7.2f} "
+              f"{p50:>7.1f}/{p99:<8.1f} {disk_bytes(directory) / 1048576:>8.1f}")
+    shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
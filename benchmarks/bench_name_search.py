@@ -0,0 +1,105 @@
+# Name search latency: the old LIKE '%x%' scan against the trigram index, on
+# a scratch SQLite table of synthetic patient names. Also reports index
+# build, save and load times and the matches found for misspelled queries.
+#   python benchmarks/bench_name_search.py --sizes 100000,1000000
+import argparse
+import csv
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def name_pools():
+    first, last = set(), set()
+    with open(os.path.join(ROOT, 'patients_dataset.csv'), newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            parts = row['name'].split()
+            if len(parts) >= 2:
+                first.add(parts[0])
+                last.add(parts[-1])
+    return sorted(first), sorted(last)
+
+
+def misspell(name, rnd):
+    # One dropped, doubled or swapped letter per word
+    words = []
+    for word in name.split():
+        i = rnd.randrange(1, len(word)) if len(word) > 2 else 0
+        edit = rnd.choice(('drop', 'double', 'swap'))
+        if edit == 'drop':
+            word = word[:i] + word[i + 1:]
+        elif edit == 'double':
+            word = word[:i] + word[i] + word[i:]
+        elif i + 1 < len(word):
+            word = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+        words.append(word)
+    return ' '.join(words)
+
+
+def timings(fn, queries):
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LIKE scan vs trigram index name search.")
+    parser.add_argument('--sizes', default='100000,1000000')
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    from name_index import TrigramIndex
+    first, last = name_pools()
+    workdir = tempfile.mkdtemp(prefix='hms_name_bench_')
+    print(f"{'names':>10} {'build s':>8} {'save s':>7} {'load s':>7} {'LIKE p50/p95 ms':>17} "
+          f"{'index p50/p95 ms':>17} {'typo hit rate':>13}")
+    for size in [int(s) for s in args.sizes.split(',')]:
+        rnd = random.Random(args.seed)
+        names = [f"{rnd.choice(first)} {rnd.choice(last)}" for _ in range(size)]
+        db = os.path.join(workdir, f'names_{size}.db')
+        conn = sqlite3.connect(db)
+        conn.execute("CREATE TABLE patients (patient_id INTEGER PRIMARY KEY, name VARCHAR(100))")
+        conn.executemany("INSERT INTO patients VALUES (?, ?)", enumerate(names, 1))
+        conn.commit()
+
+        start = time.perf_counter()
+        index = TrigramIndex('patients')
+        for key, name in enumerate(names, 1):
+            index.add(key, name)
+        build = time.perf_counter() - start
+        path = os.path.join(workdir, 'index.json')
+        start = time.perf_counter()
+        index.save(path)
+        save = time.perf_counter() - start
+        start = time.perf_counter()
+        index = TrigramIndex.load('patients', path)
+        load = time.perf_counter() - start
+
+        targets = [rnd.choice(names) for _ in range(args.queries)]
+        exact = [t.split()[-1] for t in targets]
+        typos = [misspell(t, rnd) for t in targets]
+        like = timings(lambda q: conn.execute("SELECT * FROM patients WHERE name LIKE ?", (f"%{q}%",)).fetchall(), exact)
+        trigram = timings(lambda q: index.search(q, 20), typos)
+        found = sum(any(n == t for _, n, _ in index.search(q, 20)) for q, t in zip(typos, targets))
+        print(f"{size:>10,} {build:>8.2f} {save:>7.2f} {load:>7.2f} {like[0]:>8.1f}/{like[1]:<8.1f} "
+              f"{trigram[0]:>8.1f}/{trigram[1]:<8.1f} {found / len(typos):>13.0%}")
+        conn.close()
+        for leftover in (db, path, os.path.join(workdir, 'index.mark')):
+            os.remove(leftover)
+    os.rmdir(workdir)
+
+
+if __name__ == "__main__":
+    main()
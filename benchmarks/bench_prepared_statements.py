@@ -0,0 +1,82 @@
+# Compares the text protocol (statement parsed on every call) against the
+# per-connection prepared statement cache for the hot CRUD lookups.
+# Needs the MySQL backend:  python benchmarks/bench_prepared_statements.py -n 5000
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector
+
+from db_config import DB_CONFIG
+from statement_cache import CachedStatementCursor, PreparedStatementCache
+
+HOT_STATEMENTS = [
+    ("SELECT * FROM doctors WHERE doctor_id = %s", "SELECT doctor_id FROM doctors"),
+    ("SELECT * FROM patients WHERE patient_id = %s", "SELECT patient_id FROM patients"),
+    ("SELECT service_id, service_name, cost FROM temp_service_usage WHERE patient_id=%s", "SELECT patient_id FROM patients"),
+    ("SELECT * FROM services WHERE service_id = %s", "SELECT service_id FROM services"),
+]
+
+
+def session_status(conn):
+    cursor = conn.cursor()
+    cursor.execute("SHOW SESSION STATUS WHERE Variable_name IN ('Com_stmt_prepare', 'Com_stmt_execute', 'Com_select')")
+    status = {name: int(value) for name, value in cursor.fetchall()}
+    cursor.close()
+    return status
+
+
+def load_keys(conn):
+    workload = []
+    cursor = conn.cursor()
+    for sql, key_sql in HOT_STATEMENTS:
+        cursor.execute(key_sql + " LIMIT 200")
+        keys = [row[0] for row in cursor.fetchall()] or [0]
+        workload.append((sql, keys))
+    cursor.close()
+    return workload
+
+
+def run(conn, make_cursor, workload, iterations):
+    before = session_status(conn)
+    start = time.perf_counter()
+    for i in range(iterations):
+        for sql, keys in workload:
+            cursor = make_cursor()
+            cursor.execute(sql, (keys[i % len(keys)],))
+            cursor.fetchall()
+            cursor.close()
+    elapsed = time.perf_counter() - start
+    after = session_status(conn)
+    return elapsed, {k: after[k] - before[k] for k in after}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    conn = mysql.connector.connect(**DB_CONFIG)
+    workload = load_keys(conn)
+    calls = args.iterations * len(workload)
+
+    text_time, text_status = run(conn, conn.cursor, workload, args.iterations)
+    cache = PreparedStatementCache(conn)
+    prep_time, prep_status = run(conn, lambda: CachedStatementCursor(conn, cache), workload, args.iterations)
+    cache.close()
+    conn.close()
+
+    print(f"{calls} statement executions ({len(workload)} distinct statements)")
+    print(f"{'mode':<20}{'total s':>10}{'us/call':>10}   server counters")
+    print(f"{'text protocol':<20}{text_time:>10.3f}{text_time / calls * 1e6:>10.1f}   {text_status}")
+    print(f"{'prepared (cached)':<20}{prep_time:>10.3f}{prep_time / calls * 1e6:>10.1f}   {prep_status}")
+    print(f"statement cache: {cache.stats()}")
+    print(f"speed-up: {text_time / prep_time:.2f}x; statements parsed: "
+          f"{text_status.get('Com_select', 0)} -> {prep_status.get('Com_stmt_prepare', 0)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# Revenue dashboards on a scratch SQLite database: the monthly, service and
+# doctor reports aggregated from billing, billed_services and appointments
+# against the same reports read from the daily rollups, plus what keeping
+# the rollups current adds to a bill and an appointment write.
+#   python benchmarks/bench_rollups.py --bills 200000
+import argparse
+import contextlib
+import datetime
+import io
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The same reports straight from the base tables
+BASE_REPORTS = {
+    'monthly': ["SELECT substr(billing_date, 1, 7), COUNT(*), SUM(total_amount) FROM billing GROUP BY 1",
+                "SELECT substr(date, 1, 7), COUNT(*), SUM(consulting_charge) FROM appointments GROUP BY 1"],
+    'services': ["SELECT COALESCE(service_id, ''), COUNT(*), SUM(cost) FROM billed_services GROUP BY 1"],
+    'doctors': ["SELECT COALESCE(doctor_id, ''), COUNT(*), SUM(consulting_charge) FROM appointments GROUP BY 1"],
+}
+
+
+def fill(cursor, bills, rnd):
+    first = datetime.date(2023, 1, 1)
+    day = lambda: (first + datetime.timedelta(days=rnd.randrange(730))).isoformat()
+    cursor.executemany("INSERT INTO patients (patient_id, name, age, gender, admission_date, contact_no) "
+                       "VALUES (%s, %s, 40, 'F', '2023-01-01', '9999999999')",
+                       [(p, f"Bench Patient {p}") for p in range(1, 1001)])
+    cursor.executemany("INSERT INTO doctors (doctor_id, name, specialization, contact_no) VALUES (%s, %s, 'General', %s)",
+                       [(f"D{d}", f"Dr. Bench {d}", f"{9000000000 + d}") for d in range(100)])
+    cursor.executemany("INSERT INTO services (service_id, service_name, cost) VALUES (%s, %s, %s)",
+                       [(f"S{s:03d}", f"Service {s}", 100 + s) for s in range(50)])
+    lines = []
+    for b in range(bills):
+        costs = [(f"S{rnd.randrange(50):03d}", rnd.randrange(100, 5000)) for _ in range(3)]
+        cursor.execute("INSERT INTO billing (bill_id, patient_id, total_amount, billing_date) VALUES (%s, %s, %s, %s)",
+                       (f"B{b}", 1 + b % 1000, sum(c for _, c in costs), day()))
+        lines.extend((f"B{b}", 1 + b % 1000, sid, f"Service {sid}", cost) for sid, cost in costs)
+    cursor.executemany("INSERT INTO billed_services (bill_id, patient_id, service_id, service_name, cost) "
+                       "VALUES (%s, %s, %s, %s, %s)", lines)
+    cursor.executemany("INSERT INTO appointments (appt_id, patient_id, doctor_id, date, diagnosis, consulting_charge) "
+                       "VALUES (%s, %s, %s, %s, 'Checkup', 500)",
+                       [(f"A{a}", 1 + a % 1000, f"D{a % 100}", day()) for a in range(bills)])
+
+
+def best(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def writes(count, tag):
+    from appointment import Appointment
+    from billing import Bill
+    from service import Service, ServiceUsageDB
+    service = Service('S001', 'Service 1', 101)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(count):
+            ServiceUsageDB.add_service_for_patient('1', service)
+            assert Bill(f"W{tag}{i}", 1, '2024-03-01').add()
+            appt_id = f"W{tag}{i}"
+            assert Appointment(appt_id, 1, 'D1', '2024-03-01', 'Checkup').add()
+            assert Appointment.delete(appt_id)
+    return (time.perf_counter() - start) / count
+
+
+def child(bills, repeat):
+    import rollups
+    from db_config import get_connection
+    conn = get_connection()
+    cursor = conn.cursor()
+    fill(cursor, bills, random.Random(7))
+    conn.commit()
+    start = time.perf_counter()
+    rollups.rebuild()
+    print(f"{bills:,} bills, {bills * 3:,} lines, {bills:,} appointments; rebuild {time.perf_counter() - start:.2f}s")
+
+    def base(report):
+        for sql in BASE_REPORTS[report]:
+            cursor.execute(sql)
+            cursor.fetchall()
+    reports = {'monthly': rollups.monthly_report, 'services': rollups.service_report, 'doctors': rollups.doctor_report}
+    print(f"{'report':>10} {'base ms':>10} {'rollup ms':>10} {'speedup':>9}")
+    for name, report in reports.items():
+        slow = best(lambda: base(name), repeat)
+        fast = best(lambda: report('0001-01-01', '9999-12-31'), repeat)
+        print(f"{name:>10} {slow * 1000:>10.1f} {fast * 1000:>10.2f} {slow / fast:>8.0f}x")
+    cursor.close()
+    conn.close()
+
+    # One bill (cart line, bill) and one appointment added and cancelled,
+    # with and without the rollup upkeep
+    snapshot, apply = rollups._snapshot, rollups.apply
+    rollups._snapshot, rollups.apply = lambda *args: {}, lambda *args: None
+    without = writes(200, 'N')
+    rollups._snapshot, rollups.apply = snapshot, apply
+    rollups.rebuild()
+    with_rollups = writes(200, 'R')
+    print(f"write cycle: {without * 1000:.2f} ms without rollups, {with_rollups * 1000:.2f} ms with")
+    assert not rollups.verify()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dashboard reports from the base tables vs the daily rollups.")
+    parser.add_argument('--bills', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.bills, args.repeat)
+        return
+
+    workdir = tempfile.mkdtemp(prefix='hms_rollup_bench_')
+    db = os.path.join(workdir, 'bench.db')
+    env = dict(os.environ, HMS_DB_BACKEND='sqlite', HMS_SQLITE_PATH=db)
+    subprocess.run([sys.executable, os.path.abspath(__file__), '--child', '--bills', str(args.bills),
+                    '--repeat', str(args.repeat)], env=env, check=True)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db + suffix):
+            os.remove(db + suffix)
+    os.rmdir(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# Doctor availability with the Schedule's run index against scanning each
+# doctor's bookings, which is what a lookup without the index amounts to.
+# The bookings are generated in memory (one per doctor and day) and loaded
+# with DoctorCalendar.from_days, as Schedule.load does from the rollup.
+#   python benchmarks/bench_scheduling.py --doctors 1000 --appointments 10000000
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FIRST_DAY = 730000
+SPECIALIZATIONS = 20
+
+
+def per_op(fn, args):
+    start = time.perf_counter()
+    for a in args:
+        fn(*a)
+    return (time.perf_counter() - start) / len(args) * 1e6
+
+
+def naive_next_free(booked, doctors, start, count):
+    # Day by day, every doctor of the specialization, scanning their bookings
+    slots, day = [], start
+    while len(slots) < count:
+        for doctor_id in doctors:
+            if day not in booked[doctor_id] and len(slots) < count:
+                slots.append((day, doctor_id))
+        day += 1
+    return slots
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Schedule run index vs scanning bookings.")
+    parser.add_argument('--doctors', type=int, default=1000)
+    parser.add_argument('--appointments', type=int, default=10000000)
+    parser.add_argument('--queries', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    from scheduling import DoctorCalendar, Schedule
+    rnd = random.Random(args.seed)
+    per_doctor = args.appointments // args.doctors
+    span = per_doctor * 10 // 7
+    start = time.perf_counter()
+    booked = {f"D{d}": sorted(FIRST_DAY + day for day in rnd.sample(range(span), per_doctor))
+              for d in range(args.doctors)}
+    print(f"{args.doctors:,} doctors, {per_doctor * args.doctors:,} appointments over {span:,} days "
+          f"(generated in {time.perf_counter() - start:.1f}s)")
+
+    start = time.perf_counter()
+    schedule = Schedule(capacity=1)
+    for d, (doctor_id, days) in enumerate(booked.items()):
+        schedule.add_doctor(doctor_id, f"Spec {d % SPECIALIZATIONS}")
+        schedule.calendars[doctor_id] = DoctorCalendar.from_days(1, ((day, 1) for day in days))
+    runs = sum(len(c.starts) for c in schedule.calendars.values())
+    print(f"index built in {time.perf_counter() - start:.1f}s: {runs:,} runs of full days, "
+          f"{runs * 16 / 1048576:,.0f} MB of run arrays")
+
+    doctor_ids = list(booked)
+    lookups = [(rnd.choice(doctor_ids), FIRST_DAY + rnd.randrange(span)) for _ in range(args.queries)]
+    print(f"{'operation':>28} {'scan us':>10} {'index us':>10} {'speedup':>9}")
+
+    slow = per_op(lambda d, day: day in booked[d], lookups[:2000])
+    fast = per_op(lambda d, day: schedule.calendars[d].is_free(day), lookups)
+    print(f"{'is the slot free':>28} {slow:>10.1f} {fast:>10.2f} {slow / fast:>8.0f}x")
+
+    by_specialization = {}
+    for doctor_id, specialization in schedule.specializations.items():
+        by_specialization.setdefault(specialization, []).append(doctor_id)
+    searches = [(f"Spec {rnd.randrange(SPECIALIZATIONS)}", FIRST_DAY + rnd.randrange(span)) for _ in range(1000)]
+    slow = per_op(lambda s, day: naive_next_free(booked, by_specialization[s], day, 10), searches[:20])
+    fast = per_op(lambda s, day: schedule.next_free(s, datetime.date.fromordinal(day), 10), searches)
+    print(f"{'next 10 free, specialization':>28} {slow:>10.1f} {fast:>10.2f} {slow / fast:>8.0f}x")
+
+    # A booking is a check plus an insert into the sorted bookings; the
+    # index merges runs instead of shifting a list of every booking
+    free = [(d, day) for d, day in lookups if schedule.calendars[d].is_free(day)][:20000]
+
+    def scan_book(d, day):
+        days, i = booked[d], 0
+        while i < len(days) and days[i] < day:
+            i += 1
+        if i == len(days) or days[i] != day:
+            days.insert(i, day)
+    slow = per_op(scan_book, free[:500])
+    fast = per_op(lambda d, day: schedule.calendars[d].book(day), free)
+    print(f"{'book a free slot':>28} {slow:>10.1f} {fast:>10.2f} {slow / fast:>8.0f}x")
+    fast = per_op(lambda d, day: schedule.calendars[d].release(day), free)
+    print(f"{'cancel a booking':>28} {'':>10} {fast:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# Inter-visit gaps for every patient: Appointment.days_between_appointments
+# called once per patient (the readmission job's loop) against
+# visit_gaps.analyze in one ordered pass, with NumPy and in plain Python,
+# on a scratch SQLite database.
+#   python benchmarks/bench_visit_gaps.py --patients 20000 --visits 10
+import argparse
+import contextlib
+import datetime
+import io
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def fill(cursor, patients, visits, rnd):
+    first = datetime.date(2020, 1, 1)
+    cursor.executemany("INSERT INTO patients (patient_id, name, age, gender, admission_date, contact_no) "
+                       "VALUES (%s, %s, 40, 'F', '2020-01-01', '9999999999')",
+                       [(p, f"Bench Patient {p}") for p in range(1, patients + 1)])
+    rows = ((f"A{i}", 1 + rnd.randrange(patients), first + datetime.timedelta(days=rnd.randrange(1500)))
+            for i in range(patients * visits))
+    cursor.executemany("INSERT INTO appointments (appt_id, patient_id, date, diagnosis) VALUES (%s, %s, %s, 'Checkup')",
+                       list(rows))
+
+
+def child(patients, visits):
+    import visit_gaps
+    from appointment import Appointment
+    from db_config import get_connection
+    conn = get_connection()
+    cursor = conn.cursor()
+    fill(cursor, patients, visits, random.Random(7))
+    conn.commit()
+    cursor.close()
+    conn.close()
+    print(f"{patients:,} patients, {patients * visits:,} appointments")
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        loop = {p: Appointment.days_between_appointments(p) for p in range(1, patients + 1)}
+    looped = time.perf_counter() - start
+    print(f"{'per-patient loop':>18} {looped:>8.2f}s")
+
+    for name, use_numpy in (('one pass, Python', False), ('one pass, NumPy', True)):
+        start = time.perf_counter()
+        result = visit_gaps.analyze(use_numpy=use_numpy)
+        result.population()
+        elapsed = time.perf_counter() - start
+        print(f"{name:>18} {elapsed:>8.2f}s {looped / elapsed:>7.0f}x")
+        gaps = result.by_patient()
+        assert all(list(gaps.get(p, [])) == g for p, g in loop.items())
+
+    # The same pass without the database read, to show where the time goes
+    rows = list(visit_gaps._rows())
+    for name, analyze in (('compute, Python', visit_gaps._analyze_python), ('compute, NumPy', visit_gaps._analyze_numpy)):
+        start = time.perf_counter()
+        analyze(rows)
+        print(f"{name:>18} {time.perf_counter() - start:>8.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-patient gap loop vs one-pass visit gap analytics.")
+    parser.add_argument('--patients', type=int, default=20000)
+    parser.add_argument('--visits', type=int, default=10)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.patients, args.visits)
+        return
+
+    workdir = tempfile.mkdtemp(prefix='hms_gaps_bench_')
+    db = os.path.join(workdir, 'bench.db')
+    env = dict(os.environ, HMS_DB_BACKEND='sqlite', HMS_SQLITE_PATH=db)
+    subprocess.run([sys.executable, os.path.abspath(__file__), '--child', '--patients', str(args.patients),
+                    '--visits', str(args.visits)], env=env, check=True)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db + suffix):
+            os.remove(db + suffix)
+    os.rmdir(workdir)
+
+
+if __name__ == "__main__":
+    main()
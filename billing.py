@@ -1,201 +1,254 @@
-from db_config import get_connection
-from service import ServiceUsageDB
-import re
+from db_config import get_connection, session_scope
+import charge_totals
+import rollups
+from id_allocator import next_id
+import pagination
+from patient import patient_cache
+import invoice_cache
+from invoice_archive import get_archive
+import reference_cache
+from validation import BILL_SCHEMA
+from exporter import EXPORT_CHUNK_ROWS, EXPORT_MAX_MEMORY_MB, checkpoint_path, export_table
 import datetime
-import csv
 import os
 
 import mysql.connector
 from mysql.connector import IntegrityError, Error
 
 def auto_bill_id():
-    from db_config import get_connection
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT bill_id FROM billing WHERE bill_id REGEXP '^B[0-9]+$'")
-    bill_ids = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    max_num = 0
-    for (bill_id,) in bill_ids:
-        try:
-            num = int(bill_id[1:])
-            if num > max_num:
-                max_num = num
-        except:
-            continue
-    return f'B{max_num+1:03d}'
+    return next_id('bill')
+
+def cart_totals(cursor, patient_id):
+    # (line count, total cost, highest id) of the patient's service cart.
+    # Finalizing only moves rows up to that id, so a service added while the
+    # bill is being written stays in the cart for the next bill.
+    cursor.execute("SELECT COUNT(*), COALESCE(SUM(cost), 0), MAX(id) FROM temp_service_usage WHERE patient_id=%s",
+                   (patient_id,))
+    return cursor.fetchone()
+
+def move_cart(cursor, bill_id, patient_id, last_id):
+    # Set-based: copies the cart into billed_services and clears it on the
+    # caller's transaction. A service deleted from the catalog since it was
+    # added is billed with no service_id, as ON DELETE SET NULL would leave it.
+    cursor.execute("""
+        INSERT INTO billed_services (bill_id, patient_id, service_id, service_name, cost)
+        SELECT %s, %s, s.service_id, t.service_name, t.cost
+        FROM temp_service_usage t
+        LEFT JOIN services s ON s.service_id = t.service_id
+        WHERE t.patient_id=%s AND t.id <= %s
+        ORDER BY t.id
+    """, (bill_id, patient_id, patient_id, last_id))
+    cursor.execute("DELETE FROM temp_service_usage WHERE patient_id=%s AND id <= %s", (patient_id, last_id))
+
+def render_invoice(bill_id, patient_id, billing_date, patient_name, appointment, services):
+    # appointment: {'doctor_name', 'specialization', 'consulting_charge'} or
+    # None; services: [{'service_name', 'cost'}]. No I/O.
+    lines = []
+    lines.append("="*60)
+    lines.append("              HOSPITAL INVOICE")
+    lines.append("="*60)
+    lines.append(f"Bill No.    : {bill_id:<15}   Date: {billing_date}")
+    lines.append(f"Patient ID  : {patient_id:<15}   Name: {patient_name if patient_name else 'N/A'}")
+    lines.append("-"*60)
+    if appointment:
+        lines.append(f"Doctor      : {appointment['doctor_name']} ({appointment['specialization']})")
+        lines.append(f"Consultation Charge: ₹{float(appointment['consulting_charge']):,.2f}")
+    else:
+        lines.append("Doctor      : N/A")
+        lines.append("Consultation Charge: ₹0.00")
+
+    lines.append("-"*60)
+    lines.append(f"{'Service Name':30} {'Amount':>15}")
+    lines.append("-"*60)
+
+    service_total = 0
+    if services:
+        for s in services:
+            lines.append(f"{s['service_name'][:30]:30} {float(s['cost']):>15,.2f}")
+            service_total += float(s['cost'])
+    else:
+        lines.append(f"{'No services billed.':<57}")
+
+    lines.append("-"*60)
+    lines.append(f"{'Service Total':>47} : ₹{service_total:,.2f}")
+    consulting_charge = float(appointment['consulting_charge']) if appointment else 0.0
+    lines.append(f"{'Consultation Charge':>47} : ₹{consulting_charge:,.2f}")
+    lines.append("-"*60)
+    total = service_total + consulting_charge
+    lines.append(f"{'TOTAL AMOUNT DUE':>47} : ₹{total:,.2f}")
+    lines.append("="*60)
+    lines.append("Payment due within 30 days. For queries, call (123) 456-7890")
+    lines.append("="*60)
+    lines.append("        Thank you for choosing our Hospital!")
+    lines.append("="*60)
+    return '\n'.join(lines)
 
 class Bill:
+    VIEW_HEADER = "Bill ID | Patient ID | Total Amount | Billing Date"
+
     def __init__(self, bill_id, patient_id, billing_date=None):
         self.bill_id = bill_id
         self.patient_id = patient_id
         self.billing_date = billing_date or datetime.date.today().strftime("%Y-%m-%d")
 
-    def add(self):
-        import datetime
-        if not self.patient_id:
-            print("Patient ID is required.")
-            return False
-
-        # Validate billing date
-        try:
-            datetime.datetime.strptime(self.billing_date, "%Y-%m-%d")
-        except ValueError:
-            print("Invalid Billing Date. Use YYYY-MM-DD format.")
+    def add(self, session=None):
+        _, errors = BILL_SCHEMA.validate(self)
+        if errors:
+            print(errors[0].message)
             return False
 
-        # Fetch all services used by this patient from temp_service_usage
-        services = ServiceUsageDB.get_services_for_patient(self.patient_id)
-        print("DEBUG: Services fetched from temp_service_usage:", services)
-        if not services:
-            print("No services to bill for this patient.")
-            return False
-
-        # Calculate total amount
-        total_amount = sum(float(s[2]) for s in services)  # s[2] is cost
-
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            # Check patient exists
-            cursor.execute("SELECT 1 FROM patients WHERE patient_id=%s", (self.patient_id,))
-            if cursor.fetchone() is None:
-                print("Patient ID does not exist.")
-                return False
-
-            # Insert bill
-            sql = "INSERT INTO billing (bill_id, patient_id, total_amount, billing_date) VALUES (%s, %s, %s, %s)"
+        # Totalling the cart, inserting the bill, moving the cart into
+        # billed_services and clearing it run as one unit of work: a single
+        # connection and a single commit.
+        with session_scope(session) as tx:
             try:
-                cursor.execute(sql, (self.bill_id, self.patient_id, total_amount, self.billing_date))
-            except IntegrityError:
-                print(f"Error: Duplicate Bill ID '{self.bill_id}'. Please use a unique ID.")
-                return False
-
-            # Insert service details into billed_services
-            for s in services:
+                conn = get_connection(tx)
+                cursor = conn.cursor()
+                count, total_amount, last_id = cart_totals(cursor, self.patient_id)
+                if not count:
+                    print("No services to bill for this patient.")
+                    return False
+
+                # Check patient exists
+                cursor.execute("SELECT 1 FROM patients WHERE patient_id=%s", (self.patient_id,))
+                if cursor.fetchone() is None:
+                    print("Patient ID does not exist.")
+                    return False
+
+                # Insert bill
+                sql = "INSERT INTO billing (bill_id, patient_id, total_amount, billing_date) VALUES (%s, %s, %s, %s)"
                 try:
-                    cursor.execute(
-                        "INSERT INTO billed_services (bill_id, patient_id, service_id, service_name, cost) VALUES (%s, %s, %s, %s, %s)",
-                        (self.bill_id, self.patient_id, s[0], s[1], s[2])
-                    )
+                    cursor.execute(sql, (self.bill_id, self.patient_id, total_amount, self.billing_date))
                 except IntegrityError:
-                    print(f"Error: Duplicate service entry for bill {self.bill_id} and service {s[0]}. Skipping.")
-            conn.commit()
-            print(f"Bill added successfully. Total amount: {total_amount}")
-            print("Billed services recorded.")
-            return True
-        except Error as e:
-            print("Database error while adding bill:", e)
-            return False
-        except Exception as e:
-            print("Error while adding bill:", e)
-            return False
-        finally:
-            if 'cursor' in locals(): cursor.close()
-            if 'conn' in locals(): conn.close()
-
-        # Clear temp service usage for this patient
-        try:
-            ServiceUsageDB.clear_services_for_patient(self.patient_id)
-        except Exception as e:
-            print("Error clearing temp service usage:", e)
-
-    def update(self):
-        import datetime
-
-        # Bill ID is auto-generated; just check presence
-        if not self.bill_id:
-            print("Bill ID is required.")
-            return False
-
-        # Patient ID: check presence (format validation not needed if auto-generated)
-        if not self.patient_id:
-            print("Patient ID is required.")
-            return False
-
-        # Validate billing date
-        try:
-            datetime.datetime.strptime(self.billing_date, "%Y-%m-%d")
-        except ValueError:
-            print("Invalid Billing Date. Use YYYY-MM-DD format.")
-            return False
-
-        # Fetch all services used by this patient from temp_service_usage
-        services = ServiceUsageDB.get_services_for_patient(self.patient_id)
-        if not services:
-            print("No services to bill for this patient.")
-            return False
-
-        # Calculate total amount
-        total_amount = sum(float(s[2]) for s in services)  # s[2] is cost
-
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            # Check patient exists
-            cursor.execute("SELECT 1 FROM patients WHERE patient_id=%s", (self.patient_id,))
-            if cursor.fetchone() is None:
-                print("Patient ID does not exist.")
+                    print(f"Error: Duplicate Bill ID '{self.bill_id}'. Please use a unique ID.")
+                    tx.rollback()
+                    return False
+
+                move_cart(cursor, self.bill_id, self.patient_id, last_id)
+                charge_totals.adjust(cursor, self.patient_id, service_delta=-total_amount)
+                rollups.apply(conn, {}, rollups.bills(conn, [self.bill_id]))
+                conn.commit()
+                invoice_cache.invoices.invalidate(self.bill_id, tx)
+                print(f"Bill added successfully. Total amount: {total_amount}")
+                print(f"{count} billed services recorded.")
+                return True
+            except Error as e:
+                print("Database error while adding bill:", e)
+                tx.rollback()
                 return False
-
-            # Update bill
-            sql = "UPDATE billing SET patient_id=%s, total_amount=%s, billing_date=%s WHERE bill_id=%s"
-            cursor.execute(sql, (self.patient_id, total_amount, self.billing_date, self.bill_id))
-            conn.commit()
-            if cursor.rowcount == 0:
-                print("No updates found.")
+            except Exception as e:
+                print("Error while adding bill:", e)
+                tx.rollback()
                 return False
-            else:
+            finally:
+                if 'cursor' in locals(): cursor.close()
+                if 'conn' in locals(): conn.close()
+
+    def update(self, session=None):
+        # Bill and patient IDs must be present, billing date YYYY-MM-DD
+        _, errors = BILL_SCHEMA.validate(self)
+        if errors:
+            print(errors[0].message)
+            return False
+
+        # The patient's cart is added to the bill and cleared in the same
+        # transaction; the total is recomputed from the bill's lines
+        with session_scope(session) as tx:
+            try:
+                conn = get_connection(tx)
+                cursor = conn.cursor()
+                count, cart_total, last_id = cart_totals(cursor, self.patient_id)
+                if not count:
+                    print("No services to bill for this patient.")
+                    return False
+
+                # Check patient exists
+                cursor.execute("SELECT 1 FROM patients WHERE patient_id=%s", (self.patient_id,))
+                if cursor.fetchone() is None:
+                    print("Patient ID does not exist.")
+                    return False
+
+                # Update bill
+                before = rollups.bills(conn, [self.bill_id])
+                sql = "UPDATE billing SET patient_id=%s, billing_date=%s WHERE bill_id=%s"
+                cursor.execute(sql, (self.patient_id, self.billing_date, self.bill_id))
+                if cursor.rowcount == 0:
+                    print("No updates found.")
+                    return False
+                move_cart(cursor, self.bill_id, self.patient_id, last_id)
+                charge_totals.adjust(cursor, self.patient_id, service_delta=-cart_total)
+                cursor.execute("""
+                    UPDATE billing SET total_amount =
+                        (SELECT COALESCE(SUM(cost), 0) FROM billed_services WHERE bill_id=%s)
+                    WHERE bill_id=%s
+                """, (self.bill_id, self.bill_id))
+                cursor.execute("SELECT total_amount FROM billing WHERE bill_id=%s", (self.bill_id,))
+                total_amount = cursor.fetchone()[0]
+                rollups.apply(conn, before, rollups.bills(conn, [self.bill_id]))
+                conn.commit()
+                invoice_cache.invoices.invalidate(self.bill_id, tx)
                 print("Bill updated successfully. Total amount:", total_amount)
                 return True
+            except Error as e:
+                print("Database error while updating bill:", e)
+                tx.rollback()
+                return False
+            except Exception as e:
+                print("Error while updating bill:", e)
+                tx.rollback()
+                return False
+            finally:
+                if 'cursor' in locals(): cursor.close()
+                if 'conn' in locals(): conn.close()
+
+    @staticmethod
+    def get_by_id(bill_id, session=None):
+        try:
+            conn = get_connection(session)
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("SELECT * FROM billing WHERE bill_id=%s", (bill_id,))
+            return cursor.fetchone()
         except Error as e:
-            print("Database error while updating bill:", e)
-            return False
-        except Exception as e:
-            print("Error while updating bill:", e)
-            return False
+            print("Database error:", e)
+            return None
         finally:
             if 'cursor' in locals(): cursor.close()
             if 'conn' in locals(): conn.close()
 
-        # Clear temp service usage for this patient
-        try:
-            ServiceUsageDB.clear_services_for_patient(self.patient_id)
-        except Exception as e:
-            print("Error clearing temp service usage:", e)
-        
     @staticmethod
-    def get_by_id(bill_id):
+    def get_billed_services(bill_id, session=None):
         try:
-            conn = get_connection()
+            conn = get_connection(session)
             cursor = conn.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM billing WHERE bill_id=%s", (bill_id,))
-            return cursor.fetchone()
+            cursor.execute("SELECT * FROM billed_services WHERE bill_id=%s", (bill_id,))
+            return cursor.fetchall()
         except Error as e:
             print("Database error:", e)
-            return None
+            return []
         finally:
             if 'cursor' in locals(): cursor.close()
             if 'conn' in locals(): conn.close()
 
     @staticmethod
-    def delete(bill_id):
+    def delete(bill_id, session=None):
         # No format validation for bill_id since it's system-generated
         if not bill_id:
             print("Bill ID is required.")
             return False
 
         try:
-            conn = get_connection()
+            conn = get_connection(session)
             cursor = conn.cursor()
+            before = rollups.bills(conn, [bill_id])
             sql = "DELETE FROM billing WHERE bill_id=%s"
             cursor.execute(sql, (bill_id,))
+            rollups.apply(conn, before, {})
             conn.commit()
             if cursor.rowcount == 0:
                 print("Bill ID not found.")
                 return False
             else:
+                invoice_cache.invoices.invalidate(bill_id, session)
                 print("Bill deleted successfully.")
                 return True
         except Error as e:
@@ -211,99 +264,87 @@ class Bill:
 
     @staticmethod
     def view():
+        # Streams every row page by page instead of one fetchall()
         try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM billing")
-            rows = cursor.fetchall()
-            print("Bill ID | Patient ID | Total Amount | Billing Date")
-            for row in rows:
+            print(Bill.VIEW_HEADER)
+            for row in Bill.iter_all(page_size=pagination.BATCH_PAGE_SIZE):
                 print(" | ".join(str(x) for x in row))
         except Error as e:
             print("Database error while viewing bills:", e)
         except Exception as e:
             print("Error while viewing bills:", e)
-        finally:
-            if 'cursor' in locals(): cursor.close()
-            if 'conn' in locals(): conn.close()
 
+    @staticmethod
+    def iter_pages(page_size=pagination.PAGE_SIZE, filters=None, sort=None, descending=False, session=None):
+        return pagination.iter_pages('billing', page_size, filters, sort, descending, session)
 
-    def generate_invoice(self):
-        conn = get_connection()
+    @staticmethod
+    def iter_all(page_size=pagination.PAGE_SIZE, filters=None, sort=None, descending=False, session=None):
+        return pagination.iter_rows('billing', page_size, filters, sort, descending, session)
+
+
+    def generate_invoice(self, session=None):
+        # Returns the invoice's archive Entry, or None when the bill does not
+        # exist. An unchanged bill is served from the invoice cache, or from
+        # the archived copy of its version.
+        cached = invoice_cache.invoices.get(self.bill_id, self.patient_id, self.billing_date)
+        if cached is not None:
+            print(f"Invoice is up to date: bill {self.bill_id}, version {cached.version}")
+            return get_archive().get(self.bill_id, cached.version)
+
+        conn = get_connection(session)
         cursor = conn.cursor(dictionary=True)
         try:
-            # 1. Fetch patient details
-            cursor.execute("SELECT * FROM patients WHERE patient_id = %s", (self.patient_id,))
-            patient = cursor.fetchone()
+            cursor.execute("SELECT bill_id FROM billing WHERE bill_id = %s", (self.bill_id,))
+            if cursor.fetchone() is None:
+                print(f"Bill ID '{self.bill_id}' not found.")
+                return None
+
+            # 1. Fetch patient details (from the patient cache)
+            patient = patient_cache.get(self.patient_id, session)
 
-            # 2. Fetch doctor and latest appointment details
+            # 2. Fetch latest appointment details; the doctor comes from the
+            #    directory cache
             cursor.execute("""
-                SELECT a.date, d.name AS doctor_name, d.specialization, a.consulting_charge
-                FROM appointments a
-                JOIN doctors d ON a.doctor_id = d.doctor_id
-                WHERE a.patient_id = %s
-                ORDER BY a.date DESC LIMIT 1
+                SELECT date, doctor_id, consulting_charge
+                FROM appointments
+                WHERE patient_id = %s AND doctor_id IS NOT NULL
+                ORDER BY date DESC LIMIT 1
             """, (self.patient_id,))
             appt = cursor.fetchone()
-
-            # 3. Fetch services used from billed_services
-            cursor.execute("""
-                SELECT s.service_name, bs.cost
-                FROM billed_services bs
-                JOIN services s ON bs.service_id = s.service_id
-                WHERE bs.bill_id = %s
-            """, (self.bill_id,))
-            services = cursor.fetchall()
-
-            # 4. Prepare invoice content
-            lines = []
-            lines.append("="*60)
-            lines.append("              HOSPITAL INVOICE")
-            lines.append("="*60)
-            lines.append(f"Bill No.    : {self.bill_id:<15}   Date: {self.billing_date}")
-            lines.append(f"Patient ID  : {self.patient_id:<15}   Name: {patient['name'] if patient else 'N/A'}")
-            lines.append("-"*60)
-            if appt:
-                lines.append(f"Doctor      : {appt['doctor_name']} ({appt['specialization']})")
-                lines.append(f"Consultation Charge: ₹{float(appt['consulting_charge']):,.2f}")
+            doctor = reference_cache.doctors.get(appt['doctor_id'], session) if appt else None
+            appointment = None
+            if doctor:
+                appointment = {'doctor_name': doctor['name'], 'specialization': doctor['specialization'],
+                               'consulting_charge': appt['consulting_charge']}
+
+            # 3. Fetch services used from billed_services; names come from the
+            #    catalog cache
+            cursor.execute("SELECT service_id, cost FROM billed_services WHERE bill_id = %s ORDER BY id", (self.bill_id,))
+            billed = cursor.fetchall()
+            catalog = reference_cache.services.get_many([b['service_id'] for b in billed if b['service_id'] is not None], session)
+            services = [{'service_name': catalog[str(b['service_id'])]['service_name'], 'cost': b['cost']}
+                        for b in billed if str(b['service_id']) in catalog]
+
+            # 4. Render and archive, unless this version is archived already
+            patient_name = patient['name'] if patient else None
+            version = invoice_cache.invoice_version(self.bill_id, self.patient_id, self.billing_date,
+                                                    patient_name, appointment, services)
+            archive = get_archive()
+            entry = archive.get(self.bill_id, version)
+            if entry is not None:
+                print(f"Invoice is up to date: bill {self.bill_id}, version {version}")
             else:
-                lines.append("Doctor      : N/A")
-                lines.append("Consultation Charge: ₹0.00")
-                
-            lines.append("-"*60)
-            lines.append(f"{'Service Name':30} {'Amount':>15}")
-            lines.append("-"*60)
-
-            service_total = 0
-            if services:
-                for s in services:
-                    lines.append(f"{s['service_name'][:30]:30} {float(s['cost']):>15,.2f}")
-                    service_total += float(s['cost'])
+                text = render_invoice(self.bill_id, self.patient_id, self.billing_date, patient_name, appointment, services)
+                entry = archive.append(self.bill_id, self.patient_id, version, text)
+                print(f"Invoice generated and archived: bill {self.bill_id}, version {version}")
+            invoice = invoice_cache.Invoice(str(self.bill_id), str(self.patient_id), str(self.billing_date), version)
+            # Inside a Session the bill may still roll back
+            if session is None:
+                invoice_cache.invoices.put(invoice)
             else:
-                lines.append(f"{'No services billed.':<57}")
-
-            lines.append("-"*60)
-            lines.append(f"{'Service Total':>47} : ₹{service_total:,.2f}")
-            consulting_charge = float(appt['consulting_charge']) if appt else 0.0
-            lines.append(f"{'Consultation Charge':>47} : ₹{consulting_charge:,.2f}")
-            lines.append("-"*60)
-            total = service_total + consulting_charge
-            lines.append(f"{'TOTAL AMOUNT DUE':>47} : ₹{total:,.2f}")
-            lines.append("="*60)
-            lines.append("Payment due within 30 days. For queries, call (123) 456-7890")
-            lines.append("="*60)
-            lines.append("        Thank you for choosing our Hospital!")
-            lines.append("="*60)
-            
-            # 5. Ensure output/invoices directory exists
-            output_dir = os.path.join("output", "invoices")
-            os.makedirs(output_dir, exist_ok=True)
-
-            # 6. Write to file
-            filename = os.path.join(output_dir, f"bill_{self.patient_id}.txt")
-            with open(filename, "w", encoding="utf-8") as f:
-                f.write('\n'.join(lines))
-            print(f"Invoice generated and saved as {filename}")
+                session.on_commit(lambda: invoice_cache.invoices.put(invoice))
+            return entry
 
         except Error as e:
             print("Database error while generating invoice:", e)
@@ -314,57 +355,39 @@ class Bill:
             if 'conn' in locals(): conn.close()
 
     @staticmethod
-    def export_billing_summary_to_csv(filename="billing_summary.csv"):
-        conn = get_connection()
-        cursor = conn.cursor()
+    def export_billing_summary_to_csv(filename="billing_summary.csv", compress=False, resume=False,
+                                      chunk_rows=EXPORT_CHUNK_ROWS, max_memory_mb=EXPORT_MAX_MEMORY_MB):
         try:
-            cursor.execute("SELECT bill_id, patient_id, total_amount, billing_date FROM billing")
-            rows = cursor.fetchall()
+            rows = export_table('billing', filename, compress, resume, chunk_rows, max_memory_mb)
             if not rows:
                 print("No billing records to export.")
                 return
-            with open(filename, "w", newline="") as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow(["Bill ID", "Patient ID", "Total Amount", "Billing Date"])
-                for row in rows:
-                    writer.writerow(row)
-            print(f"Billing summary exported to {filename}")
+            print(f"Billing summary exported to {filename} ({rows} rows)")
         except Exception as e:
             print("Error exporting billing summary:", e)
-        finally:
-            cursor.close()
-            conn.close()
+            if os.path.exists(checkpoint_path(filename)):
+                print("Export interrupted; it can be resumed from the last checkpoint.")
 
-def calculate_total_charge(patient_id):
+def calculate_charges(patient_ids=None, session=None):
+    # {patient_id: (service_total, consulting_total, total)} for a set of
+    # patients (every patient when None) in one grouped query, or from the
+    # running totals table when it is enabled; see charge_totals.py
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        # Sum service costs
-        cursor.execute(
-            "SELECT COALESCE(SUM(cost), 0) FROM temp_service_usage WHERE patient_id=%s",
-            (patient_id,)
-        )
-        service_total = cursor.fetchone()[0] or 0
-
-        # Sum consulting charges
-        cursor.execute(
-            "SELECT COALESCE(SUM(consulting_charge), 0) FROM appointments WHERE patient_id=%s",
-            (patient_id,)
-        )
-        consulting_total = cursor.fetchone()[0] or 0
-
-        total_billing = service_total + consulting_total
-        print(f"Service Total: {service_total}")
-        print(f"Consulting Total: {consulting_total}")
-        print(f"Total Billing: {total_billing}")
-        return total_billing
+        return charge_totals.charges(patient_ids, session)
     except Error as e:
-        print("Database error while computing total billing:", e)
+        print("Database error while computing charges:", e)
         return None
     except Exception as e:
-        print("Error while computing total billing:", e)
+        print("Error while computing charges:", e)
+        return None
+
+def calculate_total_charge(patient_id, session=None):
+    charges = calculate_charges([patient_id], session)
+    if charges is None:
         return None
-    finally:
-        if 'cursor' in locals(): cursor.close()
-        if 'conn' in locals(): conn.close()
+    service_total, consulting_total, total_billing = charges.get(str(patient_id), (0, 0, 0))
+    print(f"Service Total: {service_total}")
+    print(f"Consulting Total: {consulting_total}")
+    print(f"Total Billing: {total_billing}")
+    return total_billing
  
@@ -0,0 +1,386 @@
+import argparse
+import csv
+import datetime
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import mysql.connector
+from mysql.connector import Error
+
+import charge_totals
+import db_config
+import rollups
+from db_config import get_connection
+from id_allocator import sync_sequence
+from validation import APPOINTMENT_SCHEMA, BILL_SCHEMA, DOCTOR_SCHEMA, PATIENT_SCHEMA, SERVICE_SCHEMA, errors_by_row
+
+# Streams the *_dataset.csv files into the database in large executemany
+# batches, one transaction per batch. Parent tables load first (in
+# parallel), then the tables referencing them. Rows the database refuses are
+# isolated by retrying the failed batch row by row and written, with the
+# reason, to the reject file. Every batch is also checked against the
+# application's validation schemas first, so loaded rows obey the same rules
+# as rows entered through the menus.
+#   python bulk_loader.py --dir . --batch-size 10000 --workers 3
+
+
+def _date(value):
+    return datetime.date.fromisoformat(value).isoformat()
+
+
+def _text(value):
+    return value
+
+
+# table: (csv file, primary key, [(column, converter, required)], id sequence)
+TABLES = {
+    'patients': ('patients_dataset.csv', 'patient_id', [
+        ('patient_id', int, True), ('name', _text, True), ('age', int, False),
+        ('gender', _text, False), ('admission_date', _date, False), ('contact_no', _text, False),
+    ], 'patient'),
+    'doctors': ('doctors_dataset.csv', 'doctor_id', [
+        ('doctor_id', _text, True), ('name', _text, True), ('specialization', _text, False),
+        ('contact_no', _text, False),
+    ], 'doctor'),
+    'services': ('services_dataset.csv', 'service_id', [
+        ('service_id', _text, True), ('service_name', _text, True), ('cost', float, False),
+    ], 'service'),
+    'appointments': ('appointments_dataset.csv', 'appt_id', [
+        ('appt_id', _text, True), ('patient_id', int, False), ('doctor_id', _text, False),
+        ('date', _date, False), ('diagnosis', _text, False), ('consulting_charge', float, False),
+    ], 'appointment'),
+    'billing': ('billing_dataset.csv', 'bill_id', [
+        ('bill_id', _text, True), ('patient_id', int, False), ('total_amount', float, False),
+        ('billing_date', _date, False),
+    ], 'bill'),
+}
+
+# Blank optional columns are loaded as NULL and skip the schema check
+SCHEMAS = {
+    'patients': PATIENT_SCHEMA,
+    'doctors': DOCTOR_SCHEMA,
+    'services': SERVICE_SCHEMA,
+    'appointments': APPOINTMENT_SCHEMA,
+    'billing': BILL_SCHEMA,
+}
+
+# Foreign-key order: every table in a stage only references earlier stages
+STAGES = [('patients', 'doctors', 'services'), ('appointments', 'billing')]
+
+BATCH_SIZE = int(os.environ.get('HMS_LOAD_BATCH_SIZE', 10000))
+PROGRESS_INTERVAL = 2.0
+
+
+class RejectWriter:
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        # The original CSV fields follow the reason, one per column
+        self._writer.writerow(['table', 'line', 'reason', 'fields...'])
+
+    def write(self, table, line, reason, row):
+        with self._lock:
+            self._writer.writerow([table, line, reason] + list(row))
+            self.count += 1
+
+    def close(self):
+        self._file.close()
+
+
+class Progress:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tables = {}
+        self._last = 0.0
+
+    def start(self, table):
+        with self._lock:
+            self._tables[table] = {'rows': 0, 'rejected': 0, 'start': time.perf_counter(), 'end': None}
+
+    def update(self, table, rows, rejected, force=False):
+        with self._lock:
+            state = self._tables[table]
+            state['rows'] += rows
+            state['rejected'] += rejected
+            now = time.perf_counter()
+            if force:
+                state['end'] = now
+            if force or now - self._last >= PROGRESS_INTERVAL:
+                self._last = now
+                self._print(table, state, now)
+
+    @staticmethod
+    def _print(table, state, now):
+        elapsed = (state['end'] or now) - state['start']
+        rate = state['rows'] / elapsed if elapsed > 0 else 0.0
+        done = " (done)" if state['end'] else ""
+        print(f"{table:<13} {state['rows']:>12,} rows  {rate:>11,.0f} rows/s  {state['rejected']:>8,} rejected{done}")
+
+    def summary(self):
+        with self._lock:
+            return {t: dict(s) for t, s in self._tables.items()}
+
+
+def parse_rows(path, columns):
+    # Yields (line number, raw row, converted values or None, reason)
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        index = {name.strip(): i for i, name in enumerate(header)}
+        present = [(name, convert, required) for name, convert, required in columns if name in index]
+        missing = [name for name, _, required in columns if required and name not in index]
+        if missing:
+            raise ValueError(f"{path}: missing required column(s) {', '.join(missing)}")
+        for line, row in enumerate(reader, start=2):
+            if len(row) != len(header):
+                yield line, row, None, f"expected {len(header)} fields, got {len(row)}"
+                continue
+            values = []
+            reason = None
+            for name, convert, required in present:
+                raw = row[index[name]].strip()
+                if raw == '':
+                    if required:
+                        reason = f"{name} is required"
+                        break
+                    values.append(None)
+                    continue
+                try:
+                    values.append(convert(raw))
+                except ValueError:
+                    reason = f"invalid {name} '{raw}'"
+                    break
+            yield line, row, (values if reason is None else None), reason
+
+
+def present_columns(path, columns):
+    with open(path, newline='', encoding='utf-8') as f:
+        header = [h.strip() for h in next(csv.reader(f), [])]
+    return [name for name, _, _ in columns if name in header]
+
+
+def check_batch(table, names, batch, rejects):
+    # Returns the rows passing the schema; the rest go to the reject file
+    schema = SCHEMAS.get(table)
+    if schema is None or not batch:
+        return batch
+    optional = {name for name, _, required in TABLES[table][2] if not required}
+    columns = {name: [values[i] for _, _, values in batch] for i, name in enumerate(names)}
+    _, errors = schema.validate_batch(columns)
+    errors = [e for e in errors if e.field in columns
+              and not (e.field in optional and columns[e.field][e.row] is None)]
+    if not errors:
+        return batch
+    failed = errors_by_row(errors)
+    for row, row_errors in failed.items():
+        line, raw, _ = batch[row]
+        rejects.write(table, line, ' '.join(e.message for e in row_errors), raw)
+    return [entry for i, entry in enumerate(batch) if i not in failed]
+
+
+def insert_sql(table, names, key, upsert):
+    placeholders = ', '.join(['%s'] * len(names))
+    sql = f"INSERT INTO {table} ({', '.join(names)}) VALUES ({placeholders})"
+    if upsert:
+        updates = [n for n in names if n != key]
+        if db_config.DB_BACKEND == 'sqlite':
+            sql += f" ON CONFLICT({key}) DO UPDATE SET " + ', '.join(f"{n}=excluded.{n}" for n in updates)
+        else:
+            sql += " ON DUPLICATE KEY UPDATE " + ', '.join(f"{n}=VALUES({n})" for n in updates)
+    return sql
+
+
+def _flush(conn, cursor, sql, table, batch, rejects):
+    # One transaction per batch; on failure find the offending rows one by one
+    try:
+        cursor.executemany(sql, [values for _, _, values in batch])
+        conn.commit()
+        return len(batch), 0
+    except Error:
+        conn.rollback()
+    loaded = rejected = 0
+    for line, row, values in batch:
+        try:
+            cursor.execute(sql, values)
+            loaded += 1
+        except Error as e:
+            rejects.write(table, line, getattr(e, 'msg', None) or str(e), row)
+            rejected += 1
+    conn.commit()
+    return loaded, rejected
+
+
+def load_table(table, directory, rejects, progress, batch_size=BATCH_SIZE, upsert=False):
+    filename, key, columns, _ = TABLES[table]
+    path = os.path.join(directory, filename)
+    progress.start(table)
+    names = present_columns(path, columns)
+    sql = insert_sql(table, names, key, upsert)
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        if db_config.DB_BACKEND == 'sqlite':
+            # The load is re-runnable, so trade per-commit fsync for speed;
+            # the pooled connection gets its own setting back afterwards
+            cursor.execute("PRAGMA synchronous")
+            synchronous = int(cursor.fetchone()[0])
+            cursor.execute("PRAGMA synchronous = OFF")
+        batch = []
+        invalid = 0
+        for line, row, values, reason in parse_rows(path, columns):
+            if values is None:
+                rejects.write(table, line, reason, row)
+                invalid += 1
+                continue
+            batch.append((line, row, values))
+            if len(batch) >= batch_size:
+                valid = check_batch(table, names, batch, rejects)
+                loaded, rejected = _flush(conn, cursor, sql, table, valid, rejects)
+                progress.update(table, loaded, rejected + invalid + len(batch) - len(valid))
+                batch, invalid = [], 0
+        valid = check_batch(table, names, batch, rejects)
+        loaded, rejected = _flush(conn, cursor, sql, table, valid, rejects) if valid else (0, 0)
+        progress.update(table, loaded, rejected + invalid + len(batch) - len(valid), force=True)
+    finally:
+        if db_config.DB_BACKEND == 'sqlite' and 'synchronous' in locals():
+            cursor.execute(f"PRAGMA synchronous = {synchronous}")
+        cursor.close()
+        conn.close()
+
+
+def load_table_load_data(table, directory, rejects, progress, batch_size=BATCH_SIZE, upsert=False):
+    # MySQL only: validated rows go to a temporary CSV that the server reads
+    # with LOAD DATA LOCAL INFILE; rows the server skips come back as warnings.
+    filename, key, columns, _ = TABLES[table]
+    path = os.path.join(directory, filename)
+    progress.start(table)
+    names = present_columns(path, columns)
+    tmp = tempfile.NamedTemporaryFile('w', suffix='.csv', newline='', encoding='utf-8', delete=False)
+    lines = []
+    invalid = 0
+    try:
+        def write(batch):
+            # Every value quoted with quotes doubled and NULL bare, read with
+            # ESCAPED BY '' so a backslash in the data stays a backslash
+            valid = check_batch(table, names, batch, rejects)
+            for line, row, values in valid:
+                tmp.write(','.join('NULL' if v is None else '"' + str(v).replace('"', '""') + '"' for v in values)
+                          + '\r\n')
+                lines.append((line, row))
+            return len(batch) - len(valid)
+
+        batch = []
+        for line, row, values, reason in parse_rows(path, columns):
+            if values is None:
+                rejects.write(table, line, reason, row)
+                invalid += 1
+                continue
+            batch.append((line, row, values))
+            if len(batch) >= batch_size:
+                invalid += write(batch)
+                batch = []
+        invalid += write(batch)
+        tmp.close()
+
+        conn = mysql.connector.connect(**db_config.DB_CONFIG, allow_local_infile=True)
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SET SESSION max_error_count = 65535")
+            cursor.execute(
+                f"LOAD DATA LOCAL INFILE %s IGNORE INTO TABLE {table} "
+                "FIELDS TERMINATED BY ',' ENCLOSED BY '\"' ESCAPED BY '' LINES TERMINATED BY '\\r\\n' "
+                f"({', '.join(names)})", (tmp.name,))
+            loaded = cursor.rowcount
+            cursor.execute("SHOW WARNINGS")
+            rejected = 0
+            for _, code, message in cursor.fetchall():
+                row_no = _warning_row(message)
+                line, row = lines[row_no - 1] if row_no and row_no <= len(lines) else ('?', [])
+                rejects.write(table, line, f"{code}: {message}", row)
+                rejected += 1
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+        progress.update(table, loaded, rejected + invalid, force=True)
+    finally:
+        os.unlink(tmp.name)
+
+
+def _warning_row(message):
+    marker = ' at row '
+    if marker in message:
+        tail = message.rsplit(marker, 1)[1].split()[0]
+        if tail.isdigit():
+            return int(tail)
+    return None
+
+
+def run(directory='.', tables=None, batch_size=BATCH_SIZE, workers=None, upsert=False,
+        load_data=False, rejects_path='bulk_load_rejects.csv'):
+    tables = set(tables or TABLES)
+    if workers is None:
+        # SQLite has a single writer, parallel loaders would only contend
+        workers = 1 if db_config.DB_BACKEND == 'sqlite' else 3
+    loader = load_table_load_data if load_data else load_table
+    rejects = RejectWriter(rejects_path)
+    progress = Progress()
+    start = time.perf_counter()
+    try:
+        for stage in STAGES:
+            stage_tables = [t for t in stage if t in tables and os.path.exists(os.path.join(directory, TABLES[t][0]))]
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(loader, t, directory, rejects, progress, batch_size, upsert) for t in stage_tables]
+                for future in futures:
+                    future.result()
+            for table in stage_tables:
+                sync_sequence(TABLES[table][3])
+    finally:
+        rejects.close()
+    elapsed = time.perf_counter() - start
+    summary = progress.summary()
+    total = sum(s['rows'] for s in summary.values())
+    print(f"Loaded {total:,} rows in {elapsed:.1f}s ({total / elapsed if elapsed else 0:,.0f} rows/s); "
+          f"{rejects.count:,} rejected -> {rejects_path}")
+    if charge_totals.CHARGE_TOTALS_ENABLED and 'appointments' in tables:
+        # Loaded consulting charges bypass the running totals
+        print(f"Rebuilt charge totals for {charge_totals.rebuild():,} patients.")
+    if tables & {'billing', 'billed_services', 'appointments'}:
+        rollups.rebuild()
+        print("Rebuilt the daily revenue and visit rollups.")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load the *_dataset.csv files.")
+    parser.add_argument('--dir', default='.', help="directory holding the dataset CSV files")
+    parser.add_argument('--tables', help="comma-separated subset of: " + ', '.join(TABLES))
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--workers', type=int, help="tables loaded in parallel per stage")
+    parser.add_argument('--upsert', action='store_true', help="update rows whose key already exists")
+    parser.add_argument('--load-data', action='store_true', help="use LOAD DATA LOCAL INFILE (MySQL only)")
+    parser.add_argument('--rejects', default='bulk_load_rejects.csv')
+    args = parser.parse_args()
+
+    if args.load_data and db_config.DB_BACKEND != 'mysql':
+        parser.error("--load-data needs the MySQL backend")
+    if args.load_data and args.upsert:
+        # LOAD DATA ... REPLACE deletes the old row first, cascading to children
+        parser.error("--upsert cannot be combined with --load-data")
+    tables = [t.strip() for t in args.tables.split(',')] if args.tables else None
+    unknown = set(tables or ()) - set(TABLES)
+    if unknown:
+        parser.error(f"unknown table(s): {', '.join(sorted(unknown))}")
+    run(args.dir, tables, args.batch_size, args.workers, args.upsert, args.load_data, args.rejects)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import argparse
+import os
+
+import db_config
+from db_config import get_connection
+
+# Per-patient charges: the services in the patient's cart (temp_service_usage)
+# plus their consulting charges (appointments). charges() computes them for
+# any set of patients with one grouped query per CHARGE_BATCH ids.
+# With HMS_CHARGE_TOTALS=1 they are also kept in patient_charge_totals
+# (migration 005): every cart, appointment and bill write made through the
+# entity classes applies its delta to the patient's row in the same
+# transaction, and lookups read that table instead of aggregating. Writes
+# that bypass the entity classes (bulk loads, SQL run by hand) are not seen,
+# so after those run
+#   python charge_totals.py --rebuild     (or --verify to list the drift)
+CHARGE_TOTALS_ENABLED = os.environ.get('HMS_CHARGE_TOTALS', '0') == '1'
+CHARGE_BATCH = 500
+
+# The cart keys patients by VARCHAR; the cast lets the join to patients
+# match (and index) them as numbers
+_GROUPED = """
+    SELECT p.patient_id, COALESCE(s.total, 0), COALESCE(a.total, 0)
+    FROM patients p
+    LEFT JOIN (SELECT CAST(patient_id AS DECIMAL) AS patient_id, SUM(cost) AS total
+               FROM temp_service_usage {cart} GROUP BY patient_id) s
+        ON s.patient_id = p.patient_id
+    LEFT JOIN (SELECT patient_id, SUM(consulting_charge) AS total FROM appointments {appointments} GROUP BY patient_id) a
+        ON a.patient_id = p.patient_id
+    {patients}
+"""
+
+
+def _in(column, count):
+    return f"WHERE {column} IN ({', '.join(['%s'] * count)})"
+
+
+def _chunks(patient_ids):
+    ids = list(dict.fromkeys(str(p) for p in patient_ids))
+    for start in range(0, len(ids), CHARGE_BATCH):
+        yield ids[start:start + CHARGE_BATCH]
+
+
+def grouped(cursor, patient_ids=None):
+    # Yields (patient_id, service_total, consulting_total) from the base
+    # tables; every patient when patient_ids is None
+    if patient_ids is None:
+        cursor.execute(_GROUPED.format(cart='', appointments='', patients=''))
+        yield from cursor.fetchall()
+        return
+    for chunk in _chunks(patient_ids):
+        where = _in('patient_id', len(chunk))
+        cursor.execute(_GROUPED.format(cart=where, appointments=where, patients=_in('p.patient_id', len(chunk))),
+                       tuple(chunk) * 3)
+        yield from cursor.fetchall()
+
+
+def stored(cursor, patient_ids=None):
+    # The same rows from patient_charge_totals; a patient with no row there
+    # has no charges
+    sql = ("SELECT p.patient_id, COALESCE(t.service_total, 0), COALESCE(t.consulting_total, 0) FROM patients p "
+           "LEFT JOIN patient_charge_totals t ON t.patient_id = p.patient_id")
+    if patient_ids is None:
+        cursor.execute(sql)
+        yield from cursor.fetchall()
+        return
+    for chunk in _chunks(patient_ids):
+        cursor.execute(f"{sql} {_in('p.patient_id', len(chunk))}", tuple(chunk))
+        yield from cursor.fetchall()
+
+
+def charges(patient_ids=None, session=None):
+    # {patient_id: (service_total, consulting_total, total)} for the given
+    # patients (every patient when None); unknown patients are left out
+    conn = get_connection(session)
+    cursor = conn.cursor()
+    try:
+        rows = (stored if CHARGE_TOTALS_ENABLED else grouped)(cursor, patient_ids)
+        return {str(pid): (service, consulting, service + consulting) for pid, service, consulting in rows}
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def adjust(cursor, patient_id, service_delta=0, consulting_delta=0):
+    # Applies a write's change to the patient's running totals on the
+    # writer's cursor, so it commits or rolls back with the write
+    if not CHARGE_TOTALS_ENABLED or not (service_delta or consulting_delta):
+        return
+    sql = ("INSERT INTO patient_charge_totals (patient_id, service_total, consulting_total) VALUES (%s, %s, %s)")
+    if db_config.DB_BACKEND == 'sqlite':
+        sql += (" ON CONFLICT(patient_id) DO UPDATE SET service_total = service_total + excluded.service_total,"
+                " consulting_total = consulting_total + excluded.consulting_total")
+    else:
+        sql += (" ON DUPLICATE KEY UPDATE service_total = service_total + VALUES(service_total),"
+                " consulting_total = consulting_total + VALUES(consulting_total)")
+    cursor.execute(sql, (patient_id, service_delta, consulting_delta))
+
+
+def appointment_charge(cursor, appt_id):
+    # (patient_id, consulting_charge) of an appointment before it changes,
+    # or None; only looked up while the totals table is maintained
+    if not CHARGE_TOTALS_ENABLED:
+        return None
+    cursor.execute("SELECT patient_id, consulting_charge FROM appointments WHERE appt_id=%s", (appt_id,))
+    return cursor.fetchone()
+
+
+def rebuild(session=None):
+    # Recomputes the whole table from the base tables; returns the row count
+    conn = get_connection(session)
+    cursor = conn.cursor()
+    try:
+        rows = [(pid, service, consulting) for pid, service, consulting in grouped(cursor)
+                if service or consulting]
+        cursor.execute("DELETE FROM patient_charge_totals")
+        cursor.executemany("INSERT INTO patient_charge_totals (patient_id, service_total, consulting_total) "
+                           "VALUES (%s, %s, %s)", rows)
+        conn.commit()
+        return len(rows)
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def verify(session=None):
+    # [(patient_id, stored, actual)] where the table and the base tables differ
+    conn = get_connection(session)
+    cursor = conn.cursor()
+    try:
+        actual = {str(pid): (float(s), float(c)) for pid, s, c in grouped(cursor)}
+        kept = {str(pid): (float(s), float(c)) for pid, s, c in stored(cursor)}
+    finally:
+        cursor.close()
+        conn.close()
+    drift = []
+    for pid in sorted(actual.keys() | kept.keys()):
+        want, have = actual.get(pid, (0.0, 0.0)), kept.get(pid, (0.0, 0.0))
+        if any(abs(w - h) >= 0.005 for w, h in zip(want, have)):
+            drift.append((pid, have, want))
+    return drift
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the per-patient running charge totals.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--rebuild', action='store_true', help="recompute patient_charge_totals from the base tables")
+    group.add_argument('--verify', action='store_true', help="list patients whose stored totals have drifted")
+    args = parser.parse_args()
+    if args.rebuild:
+        print(f"Rebuilt charge totals for {rebuild()} patients.")
+    else:
+        drift = verify()
+        for pid, have, want in drift[:50]:
+            print(f"Patient {pid}: stored services/consulting {have[0]:.2f}/{have[1]:.2f}, "
+                  f"actual {want[0]:.2f}/{want[1]:.2f}")
+        print(f"{len(drift)} patients out of step." if drift else "Charge totals are up to date.")
+
+
+if __name__ == "__main__":
+    main()
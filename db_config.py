@@ -1,22 +1,417 @@
+import os
+import threading
+import time
+from collections import deque
+
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, PoolError
+
+import query_stats
+from statement_cache import CachedStatementCursor, PreparedStatementCache
+
+# Storage backend: 'mysql' (default) or 'sqlite' for an embedded, in-process
+# database file. Every entity class works unchanged on either.
+DB_BACKEND = os.environ.get('HMS_DB_BACKEND', 'mysql').lower()
+SQLITE_PATH = os.environ.get('HMS_SQLITE_PATH', 'HospitalManagementSystem.db')
+
+DB_CONFIG = {
+    'host': os.environ.get('HMS_DB_HOST', 'localhost'),
+    'user': os.environ.get('HMS_DB_USER', 'root'),
+    'password': os.environ.get('HMS_DB_PASSWORD', '123456'),
+    'database': os.environ.get('HMS_DB_NAME', 'HospitalManagementSystem'),
+}
+
+# Pool settings (overridable through the environment)
+POOL_SIZE = int(os.environ.get('HMS_POOL_SIZE', 5))
+POOL_MAX_OVERFLOW = int(os.environ.get('HMS_POOL_MAX_OVERFLOW', 10))
+POOL_TIMEOUT = float(os.environ.get('HMS_POOL_TIMEOUT', 30))
+POOL_IDLE_TIMEOUT = float(os.environ.get('HMS_POOL_IDLE_TIMEOUT', 300))
+POOL_PRE_PING = os.environ.get('HMS_POOL_PRE_PING', '1') != '0'
+
+# Prepared statements kept per connection (0 disables the cache)
+STMT_CACHE_SIZE = int(os.environ.get('HMS_STMT_CACHE_SIZE', 64))
+
+
+def _mysql_connect():
+    return mysql.connector.connect(**DB_CONFIG)
+
+
+def _mysql_is_alive(raw):
+    try:
+        raw.ping(reconnect=False)
+        return True
+    except Error:
+        return False
+
+
+def _sqlite_connect():
+    import sqlite_backend
+    # sqlite3 keeps its own per-connection LRU of compiled statements
+    return sqlite_backend.connect(SQLITE_PATH, cached_statements=max(STMT_CACHE_SIZE, 1))
+
+
+def _sqlite_is_alive(raw):
+    return raw.is_connected()
+
+
+BACKENDS = {
+    'mysql': (_mysql_connect, _mysql_is_alive, STMT_CACHE_SIZE),
+    'sqlite': (_sqlite_connect, _sqlite_is_alive, 0),
+}
+
+
+class _PoolEntry:
+    def __init__(self, raw, statement_cache_size=0):
+        self.raw = raw
+        self.last_used = time.monotonic()
+        self.statements = PreparedStatementCache(raw, statement_cache_size) if statement_cache_size else None
+
+
+class PooledConnection:
+    # Thin proxy handed out by get_connection(); close() returns the
+    # underlying connection to the pool instead of dropping the session.
+    def __init__(self, pool, entry):
+        self._pool = pool
+        self._entry = entry
+
+    def cursor(self, *args, **kwargs):
+        raw = self._raw()
+        statements = self._entry.statements
+        if statements is not None and not args and set(kwargs) <= {'dictionary'}:
+            cursor = CachedStatementCursor(raw, statements, dictionary=kwargs.get('dictionary', False))
+        else:
+            cursor = raw.cursor(*args, **kwargs)
+        return query_stats.instrument(cursor)
+
+    def statement_cache_stats(self):
+        statements = self._entry.statements if self._entry is not None else None
+        return statements.stats() if statements is not None else None
+
+    def close(self):
+        if self._entry is not None:
+            entry, self._entry = self._entry, None
+            self._pool._release(entry)
+
+    def _raw(self):
+        if self._entry is None:
+            raise PoolError("Connection has already been returned to the pool.")
+        return self._entry.raw
+
+    def __getattr__(self, name):
+        return getattr(self._raw(), name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    def __init__(self, connect, is_alive=None, size=POOL_SIZE, max_overflow=POOL_MAX_OVERFLOW,
+                 timeout=POOL_TIMEOUT, idle_timeout=POOL_IDLE_TIMEOUT, pre_ping=POOL_PRE_PING,
+                 statement_cache_size=0):
+        self._connect = connect
+        self._is_alive = is_alive
+        self.statement_cache_size = statement_cache_size
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.pre_ping = pre_ping
+        self._idle = deque()
+        self._cond = threading.Condition(threading.Lock())
+        self._open = 0
+        self._waiting = 0
+        self._pid = os.getpid()
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'exhausted': 0,
+            'timeouts': 0,
+            'created': 0,
+            'overflow_created': 0,
+            'discarded_idle': 0,
+            'discarded_dead': 0,
+        }
+
+    def connect(self):
+        self._check_pid()
+        start = time.monotonic()
+        waited = False
+        entry = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._open < self.size + self.max_overflow:
+                    self._open += 1
+                    break
+                # Every slot (including overflow) is checked out
+                if not waited:
+                    self._stats['exhausted'] += 1
+                    waited = True
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolError(f"Connection pool exhausted: no connection available within {self.timeout}s.")
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+        if entry is not None:
+            entry = self._validate(entry)
+        if entry is None:
+            entry = self._create()
+
+        wait = time.monotonic() - start
+        with self._cond:
+            self._stats['checkouts'] += 1
+            if waited:
+                self._stats['waits'] += 1
+            self._stats['wait_time_total'] += wait
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], wait)
+        return PooledConnection(self, entry)
+
+    def _create(self):
+        try:
+            raw = self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats['created'] += 1
+            if self._open > self.size:
+                self._stats['overflow_created'] += 1
+        return _PoolEntry(raw, self.statement_cache_size)
+
+    def _validate(self, entry):
+        # Drop connections that sat idle too long or fail the liveness check;
+        # the slot is reused for a fresh connection.
+        reason = None
+        if self.idle_timeout and time.monotonic() - entry.last_used > self.idle_timeout:
+            reason = 'discarded_idle'
+        elif self.pre_ping and self._is_alive is not None and not self._is_alive(entry.raw):
+            reason = 'discarded_dead'
+        if reason is None:
+            return entry
+        self._close_raw(entry.raw)
+        with self._cond:
+            self._stats[reason] += 1
+        return None
+
+    def _release(self, entry):
+        if os.getpid() != self._pid:
+            return
+        try:
+            if entry.statements is not None:
+                entry.statements.drain()
+                entry.statements.active = entry.statements.owner = None
+            if getattr(entry.raw, 'in_transaction', False):
+                entry.raw.rollback()
+        except Exception:
+            self._discard(entry)
+            return
+        with self._cond:
+            # Connections beyond the core size are closed rather than kept
+            # idle, unless another thread is already waiting for one
+            if self._open > self.size and not self._waiting:
+                self._open -= 1
+                self._cond.notify()
+                discard = True
+            else:
+                entry.last_used = time.monotonic()
+                self._idle.append(entry)
+                self._cond.notify()
+                discard = False
+        if discard:
+            self._close_raw(entry.raw)
+
+    def _discard(self, entry):
+        self._close_raw(entry.raw)
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _close_raw(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _check_pid(self):
+        # Connections must never be shared with a forked child process
+        if os.getpid() != self._pid:
+            with self._cond:
+                self._idle.clear()
+                self._open = 0
+                self._pid = os.getpid()
+
+    def dispose(self):
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for entry in idle:
+            self._close_raw(entry.raw)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['size'] = self.size
+            stats['max_overflow'] = self.max_overflow
+            stats['open'] = self._open
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._open - len(self._idle)
+        checkouts = stats['checkouts']
+        stats['wait_time_avg'] = stats['wait_time_total'] / checkouts if checkouts else 0.0
+        return stats
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                if DB_BACKEND not in BACKENDS:
+                    raise ValueError(f"Unknown database backend '{DB_BACKEND}'. Choose from: {', '.join(BACKENDS)}")
+                connect, is_alive, statement_cache_size = BACKENDS[DB_BACKEND]
+                _pool = ConnectionPool(connect, is_alive, statement_cache_size=statement_cache_size)
+    return _pool
+
+
+class _SessionConnection:
+    # Connection handed to entity methods running inside a Session: commit()
+    # and close() are deferred to the session so the whole workflow shares
+    # one connection and one transaction.
+    def __init__(self, session):
+        self._session = session
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+    def rollback(self):
+        self._session.rollback()
+
+    def __getattr__(self, name):
+        return getattr(self._session._conn, name)
+
+
+class Session:
+    # Unit of work: entity methods accept session=... and then run on this
+    # session's connection. Commits once on a clean exit, rolls back if the
+    # block raises or rollback() was called.
+    def __init__(self):
+        self._conn = None
+        self._failed = False
+        self._on_commit = []
+
+    def __enter__(self):
+        self._conn = get_pool().connect()
+        self._failed = False
+        self._on_commit = []
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None and not self._failed:
+                self.commit()
+            else:
+                self.rollback()
+        finally:
+            self._conn.close()
+            self._conn = None
+        return False
+
+    def connection(self):
+        if self._conn is None:
+            raise PoolError("Session is not active; use it as a context manager.")
+        return _SessionConnection(self)
+
+    def on_commit(self, callback):
+        # callback() runs once the session's changes are committed (cache
+        # invalidation: another thread may have re-read the old row meanwhile);
+        # it is dropped on rollback
+        self._on_commit.append(callback)
+
+    def commit(self):
+        self._conn.commit()
+        callbacks, self._on_commit = self._on_commit, []
+        for callback in callbacks:
+            callback()
+
+    def rollback(self):
+        self._conn.rollback()
+        self._on_commit = []
+        self._failed = True
+
+    @property
+    def failed(self):
+        return self._failed
+
+
+class session_scope:
+    # Joins the caller's session if one is given, otherwise runs the block in
+    # a session of its own.
+    def __init__(self, session=None):
+        self._outer = session
+        self._own = None
+
+    def __enter__(self):
+        if self._outer is not None:
+            return self._outer
+        self._own = Session()
+        return self._own.__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._own is not None:
+            return self._own.__exit__(exc_type, exc, tb)
+        return False
+
+
+def get_connection(session=None):
+    if session is not None:
+        return session.connection()
+    return get_pool().connect()
+
 
-def get_connection():
-    return mysql.connector.connect(
-        host='localhost',
-        user='root',
-        password='123456',
-        database='HospitalManagementSystem',
-    )
+def pool_stats():
+    return get_pool().stats()
 
 # Optional: Test connection when running this file directly
 if __name__ == "__main__":
     try:
         conn = get_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT DATABASE()")
-        print("Connected to:", cursor.fetchone()[0])
+        if DB_BACKEND == 'sqlite':
+            print("Connected to:", SQLITE_PATH)
+        else:
+            cursor.execute("SELECT DATABASE()")
+            print("Connected to:", cursor.fetchone()[0])
         cursor.close()
         conn.close()
+        print("Pool stats:", pool_stats())
     except Error as e:
-        print("Error while connecting to MySQL:", e)
+        print("Error while connecting to the database:", e)
@@ -0,0 +1,274 @@
+import argparse
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import time
+
+from db_config import get_connection
+from exporter import EXPORT_CHUNK_ROWS, encode_rows
+from snapshot import begin_snapshot
+
+# Incremental exports for the warehouse feed. Triggers (migration
+# 002_change_log) append (seq, table, key, op) to change_log on every insert,
+# update and delete. The business dates (billing_date, billed_at, ...) are
+# not modification times and never see deletes, so the change_log seq is the
+# high-water mark for every table. Each run reads, inside one snapshot, the
+# keys changed since the table's mark and writes their current rows as
+# upserts ('U') and the keys that no longer exist as tombstones ('D').
+# The first run for a table is a full export. Cost follows churn, not size.
+#   python delta_export.py --dir delta_exports --gzip
+#   python delta_export.py --status
+#   python delta_export.py --prune      (drop change_log rows every reader is past)
+DELTA_STATE_FILE = os.environ.get('HMS_DELTA_STATE', 'delta_state.json')
+DELTA_DIR = os.environ.get('HMS_DELTA_DIR', 'delta_exports')
+# A hole in the seq range may be a transaction that has not committed yet;
+# it is waited for until the entry after it is this old
+DELTA_GAP_TIMEOUT = float(os.environ.get('HMS_DELTA_GAP_TIMEOUT', 300))
+KEY_BATCH = 500
+
+# table: key column
+DELTA_TABLES = {
+    'billing': 'bill_id',
+    'appointments': 'appt_id',
+    'billed_services': 'id',
+}
+
+
+def load_state(path=DELTA_STATE_FILE):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(state, path=DELTA_STATE_FILE):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _as_datetime(value):
+    if isinstance(value, datetime.datetime):
+        return value
+    return datetime.datetime.fromisoformat(str(value))
+
+
+def safe_high_water(cursor, low):
+    # Highest seq such that every seq in (low, seq] is committed or has been
+    # given up on: an in-flight transaction can hold a lower seq than one
+    # that has already committed, and skipping it would lose its change.
+    # The first recent entry right after a hole is found in the database,
+    # so no change_log rows are read here.
+    cursor.execute("SELECT CURRENT_TIMESTAMP")
+    now = _as_datetime(cursor.fetchone()[0])
+    cutoff = (now - datetime.timedelta(seconds=DELTA_GAP_TIMEOUT)).strftime('%Y-%m-%d %H:%M:%S')
+    cursor.execute("SELECT MIN(c.seq) FROM change_log c WHERE c.seq > %s AND c.changed_at >= %s "
+                   "AND NOT EXISTS (SELECT 1 FROM change_log p WHERE p.seq = c.seq - 1)", (low + 1, cutoff))
+    blocked = cursor.fetchone()[0]
+    if blocked is None:
+        cursor.execute("SELECT MAX(seq) FROM change_log WHERE seq > %s", (low,))
+    else:
+        cursor.execute("SELECT MAX(seq) FROM change_log WHERE seq > %s AND seq < %s", (low, blocked))
+    return cursor.fetchone()[0] or low
+
+
+class _Output:
+    def __init__(self, path, compress, header):
+        self.path = path
+        self.compress = compress
+        self.digest = hashlib.sha256()
+        self.rows = 0
+        self._file = open(path, 'wb')
+        self._write(encode_rows([], header))
+
+    def _write(self, data):
+        if self.compress:
+            data = gzip.compress(data, mtime=0)
+        self._file.write(data)
+        self.digest.update(data)
+
+    def write(self, rows):
+        if rows:
+            self._write(encode_rows(rows))
+            self.rows += len(rows)
+
+    def close(self):
+        self._file.close()
+
+
+def _columns(cursor, table):
+    cursor.execute(f"SELECT * FROM {table} WHERE 1 = 0")
+    cursor.fetchall()
+    return [d[0] for d in cursor.description]
+
+
+def _full(conn, table, key, out):
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute(f"SELECT * FROM {table} ORDER BY {key}")
+        while True:
+            rows = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+            if not rows:
+                break
+            out.write([('U',) + tuple(r) for r in rows])
+    finally:
+        cursor.close()
+    return out.rows, 0
+
+
+def _delta(conn, table, key, columns, low, high, out):
+    cursor = conn.cursor()
+    cursor.execute("SELECT DISTINCT row_key FROM change_log WHERE table_name = %s AND seq > %s AND seq <= %s "
+                   "ORDER BY row_key", (table, low, high))
+    keys = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    key_index = columns.index(key)
+    tombstones = 0
+    cursor = conn.cursor(buffered=True)
+    try:
+        for i in range(0, len(keys), KEY_BATCH):
+            batch = keys[i:i + KEY_BATCH]
+            cursor.execute(f"SELECT * FROM {table} WHERE {key} IN ({', '.join(['%s'] * len(batch))}) ORDER BY {key}",
+                           tuple(batch))
+            rows = cursor.fetchall()
+            present = {str(r[key_index]) for r in rows}
+            gone = [k for k in batch if k not in present]
+            out.write([('U',) + tuple(r) for r in rows])
+            out.write([('D',) + tuple(k if j == key_index else None for j in range(len(columns))) for k in gone])
+            tombstones += len(gone)
+    finally:
+        cursor.close()
+    return out.rows - tombstones, tombstones
+
+
+def export_deltas(directory=DELTA_DIR, tables=None, compress=False, state_path=DELTA_STATE_FILE):
+    tables = list(tables or DELTA_TABLES)
+    state = load_state(state_path)
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    start = time.perf_counter()
+    results = {}
+
+    conn = get_connection()
+    try:
+        begin_snapshot(conn)
+        cursor = conn.cursor()
+        marks = [state[t]['watermark'] for t in tables if t in state]
+        # A full export already holds every committed row; marking it at the
+        # safe point only means a few changes are sent again next run
+        high = safe_high_water(cursor, min(marks) if marks else 0)
+        for table in tables:
+            key = DELTA_TABLES[table]
+            columns = _columns(cursor, table)
+            low = state.get(table, {}).get('watermark')
+            if low is not None and low >= high:
+                results[table] = {'mode': 'delta', 'from_seq': low, 'to_seq': low, 'upserts': 0, 'tombstones': 0}
+                continue
+            name = f"{table}_{stamp}.csv" + ('.gz' if compress else '')
+            out = _Output(os.path.join(directory, name), compress, ['op'] + columns)
+            try:
+                if low is None:
+                    upserts, tombstones = _full(conn, table, key, out)
+                else:
+                    upserts, tombstones = _delta(conn, table, key, columns, low, high, out)
+            finally:
+                out.close()
+            results[table] = {
+                'mode': 'full' if low is None else 'delta',
+                'file': name,
+                'from_seq': low or 0,
+                'to_seq': high,
+                'upserts': upserts,
+                'tombstones': tombstones,
+                'sha256': out.digest.hexdigest(),
+            }
+        cursor.close()
+    finally:
+        conn.rollback()
+        conn.close()
+
+    manifest = {
+        'exported_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'compressed': compress,
+        'seconds': round(time.perf_counter() - start, 3),
+        'tables': results,
+    }
+    with open(os.path.join(directory, f"manifest_{stamp}.json"), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    # The marks only move once every file is safely written
+    for table, entry in results.items():
+        state[table] = {'watermark': entry['to_seq'], 'exported_at': manifest['exported_at']}
+    _save_state(state, state_path)
+    return manifest
+
+
+def prune_change_log(state_path=DELTA_STATE_FILE):
+    # Entries below every reader's mark will never be read again: the
+    # exported tables' rows below the export's marks, and the name tables'
+    # rows below the saved name index marks (and the export's, whose
+    # safe_high_water walks every table)
+    import name_index
+    state = load_state(state_path)
+    marks = [state[t]['watermark'] for t in DELTA_TABLES if t in state]
+    name_marks = name_index.saved_marks()
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        pruned = 0
+        if len(marks) == len(DELTA_TABLES):
+            cursor.execute(f"DELETE FROM change_log WHERE seq <= %s AND table_name IN ({', '.join(['%s'] * len(DELTA_TABLES))})",
+                           (min(marks),) + tuple(DELTA_TABLES))
+            pruned += cursor.rowcount
+        if len(name_marks) == len(name_index.NAME_TABLES):
+            low = min(list(name_marks.values()) + marks)
+            cursor.execute(f"DELETE FROM change_log WHERE seq <= %s AND table_name IN ({', '.join(['%s'] * len(name_marks))})",
+                           (low,) + tuple(name_marks))
+            pruned += cursor.rowcount
+        conn.commit()
+        return pruned
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def print_manifest(manifest):
+    for table, entry in manifest['tables'].items():
+        target = entry.get('file', 'no changes')
+        print(f"  {table:<16} {entry['mode']:<5} seq {entry['from_seq']}..{entry['to_seq']}  "
+              f"{entry['upserts']} upserts, {entry['tombstones']} tombstones  -> {target}")
+    print(f"Delta export finished in {manifest['seconds']:.2f}s.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental exports from the change log.")
+    parser.add_argument('--dir', default=DELTA_DIR)
+    parser.add_argument('--tables', help="comma-separated subset of: " + ', '.join(DELTA_TABLES))
+    parser.add_argument('--gzip', action='store_true')
+    parser.add_argument('--state', default=DELTA_STATE_FILE)
+    parser.add_argument('--status', action='store_true', help="show the high-water marks")
+    parser.add_argument('--prune', action='store_true', help="delete change_log rows every reader is past")
+    args = parser.parse_args()
+
+    if args.status:
+        state = load_state(args.state)
+        for table in DELTA_TABLES:
+            entry = state.get(table)
+            print(f"{table:<16} " + (f"seq {entry['watermark']} (exported {entry['exported_at']})" if entry
+                                      else "never exported (next run is a full export)"))
+        return
+    if args.prune:
+        print(f"Pruned {prune_change_log(args.state)} change_log rows.")
+        return
+    tables = [t.strip() for t in args.tables.split(',')] if args.tables else None
+    unknown = set(tables or ()) - set(DELTA_TABLES)
+    if unknown:
+        parser.error(f"unknown table(s): {', '.join(sorted(unknown))}")
+    print_manifest(export_deltas(args.dir, tables, args.gzip, args.state))
+
+
+if __name__ == "__main__":
+    main()
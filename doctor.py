@@ -1,21 +1,21 @@
-import re
 from db_config import get_connection
+from id_allocator import next_id
+import name_index
+import pagination
+import reference_cache
+import rollups
+import scheduling
 from person import Person
+from validation import DOCTOR_SCHEMA
 import mysql.connector
 from mysql.connector import IntegrityError, Error
 
 def auto_doctor_id():
-    from db_config import get_connection
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT doctor_id FROM doctors WHERE doctor_id LIKE 'D%'")
-    ids = [int(row[0][1:]) for row in cursor.fetchall() if row[0][1:].isdigit()]
-    cursor.close()
-    conn.close()
-    next_num = max(ids) + 1 if ids else 1
-    return f"D{next_num:02d}"
+    return next_id('doctor')
 
 class Doctor(Person):
+    VIEW_HEADER = "Doctor ID | Name | Specialization | Contact Number"
+
     def __init__(self, doctor_id, name, specialization, contact_no):
         super().__init__(doctor_id, name, contact_no)
         self.doctor_id = doctor_id
@@ -28,20 +28,15 @@ class Doctor(Person):
             return "Dr. " + name
         return name
 
-    def add(self):
+    def add(self, session=None):
         # Data validation
-        if not self.name or not re.match(r'^[A-Za-z. ]+$', self.name):
-            print("Invalid Name.")
-            return False
-        if not self.specialization or not all(x.isalpha() or x.isspace() for x in self.specialization):
-            print("Invalid Specialization.")
-            return False
-        if not self.contact_no.isdigit() or len(self.contact_no) < 10:
-            print("Invalid Contact Number.")
+        _, errors = DOCTOR_SCHEMA.validate(self)
+        if errors:
+            print(errors[0].message)
             return False
 
         try:
-            conn = get_connection()
+            conn = get_connection(session)
             cursor = conn.cursor()
             
              # Check for duplicate contact number
@@ -53,6 +48,10 @@ class Doctor(Person):
             sql = "INSERT INTO doctors (doctor_id, name, specialization, contact_no) VALUES (%s, %s, %s, %s)"
             cursor.execute(sql, (self.doctor_id, self.name, self.specialization, self.contact_no))
             conn.commit()
+            scheduling.doctor_changed(self.doctor_id, self.specialization, session)
+            # Inside a session the change reaches the index through change_log
+            if session is None:
+                name_index.record('doctors', self.doctor_id, self.name)
             return True
         except mysql.connector.errors.IntegrityError as e:
             if "unique_contact_no" in str(e):
@@ -70,20 +69,15 @@ class Doctor(Person):
             if 'cursor' in locals(): cursor.close()
             if 'conn' in locals(): conn.close()
 
-    def update(self):
+    def update(self, session=None):
         # Data validation 
-        if not self.name or not re.match(r'^[A-Za-z. ]+$', self.name):
-            print("Invalid Name.")
-            return False
-        if not self.specialization or not all(x.isalpha() or x.isspace() for x in self.specialization):
-            print("Invalid Specialization.")
-            return False
-        if not self.contact_no.isdigit() or len(self.contact_no) < 10:
-            print("Invalid Contact Number.")
+        _, errors = DOCTOR_SCHEMA.validate(self)
+        if errors:
+            print(errors[0].message)
             return False
 
         try:
-            conn = get_connection()
+            conn = get_connection(session)
             cursor = conn.cursor()
             sql = "UPDATE doctors SET name=%s, specialization=%s, contact_no=%s WHERE doctor_id=%s"
             cursor.execute(sql, (self.name, self.specialization, self.contact_no, self.doctor_id))
@@ -93,6 +87,10 @@ class Doctor(Person):
                 return False
             else:
                 print("Doctor updated successfully.")
+                reference_cache.doctors.invalidate(self.doctor_id, session)
+                scheduling.doctor_changed(self.doctor_id, self.specialization, session)
+                if session is None:
+                    name_index.record('doctors', self.doctor_id, self.name)
                 return True
         except Error as e:
             print("Database error while updating doctor:", e)
@@ -105,33 +103,34 @@ class Doctor(Person):
             if 'conn' in locals(): conn.close()
             
     @staticmethod
-    def get_by_id(doctor_id):
+    def get_by_id(doctor_id, session=None):
         try:
-            conn = get_connection()
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM doctors WHERE doctor_id = %s", (doctor_id,))
-            record = cursor.fetchone()
-            return record
+            return reference_cache.doctors.get(doctor_id, session)
         except Exception as e:
             print("Error fetching doctor:", e)
             return None
-        finally:
-            if 'cursor' in locals(): cursor.close()
-            if 'conn' in locals(): conn.close()
 
     @staticmethod
-    def delete(doctor_id):
+    def delete(doctor_id, session=None):
         try:
-            conn = get_connection()
+            conn = get_connection(session)
             cursor = conn.cursor()
+            # The doctor's appointments are kept without a doctor
+            appt_ids = rollups.keys(conn, 'appointments', 'doctor_id', doctor_id)
+            before = rollups.appointments(conn, appt_ids)
             sql = "DELETE FROM doctors WHERE doctor_id=%s"
             cursor.execute(sql, (doctor_id,))
+            rollups.apply(conn, before, rollups.appointments(conn, appt_ids))
             conn.commit()
             if cursor.rowcount == 0:
                 print(f"Doctor ID '{doctor_id}' not found.")
                 return False
             else:
                 print("Doctor deleted successfully.")
+                reference_cache.doctors.invalidate(doctor_id, session)
+                scheduling.doctor_changed(doctor_id, session=session)
+                if session is None:
+                    name_index.record('doctors', doctor_id)
                 return True
         except Error as e:
             print("Database error while deleting doctor:", e)
@@ -145,30 +144,46 @@ class Doctor(Person):
 
     @staticmethod
     def view():
+        # Streams every row page by page instead of one fetchall()
         try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM doctors")
-            rows = cursor.fetchall()
-            print("Doctor ID | Name | Specialization | Contact Number")
-            for row in rows:
+            print(Doctor.VIEW_HEADER)
+            for row in Doctor.iter_all(page_size=pagination.BATCH_PAGE_SIZE):
                 print(" | ".join(str(x) for x in row))
         except Error as e:
             print("Database error while viewing doctors:", e)
         except Exception as e:
             print("Error while viewing doctors:", e)
-        finally:
-            if 'cursor' in locals(): cursor.close()
-            if 'conn' in locals(): conn.close()
 
     @staticmethod
-    def search_by_name(name_substring):
+    def iter_pages(page_size=pagination.PAGE_SIZE, filters=None, sort=None, descending=False, session=None):
+        return pagination.iter_pages('doctors', page_size, filters, sort, descending, session)
+
+    @staticmethod
+    def iter_all(page_size=pagination.PAGE_SIZE, filters=None, sort=None, descending=False, session=None):
+        return pagination.iter_rows('doctors', page_size, filters, sort, descending, session)
+
+    @staticmethod
+    def search_by_name(name_substring, limit=name_index.NAME_SEARCH_LIMIT):
+        # Ranked, typo-tolerant matches from the trigram index; falls back to
+        # the LIKE scan if the index cannot be used
+        try:
+            ids = [key for key, _, _ in name_index.search('doctors', name_substring, limit)]
+        except Exception as e:
+            print("Name index unavailable, searching the table instead:", e)
+            ids = None
         conn = get_connection()
         cursor = conn.cursor()
         try:
-            search_pattern = f"%{name_substring}%"
-            cursor.execute("SELECT * FROM doctors WHERE name LIKE %s", (search_pattern,))
-            rows = cursor.fetchall()
+            if ids is None:
+                search_pattern = f"%{name_substring}%"
+                cursor.execute("SELECT * FROM doctors WHERE name LIKE %s", (search_pattern,))
+                rows = cursor.fetchall()
+            elif ids:
+                cursor.execute(f"SELECT * FROM doctors WHERE doctor_id IN ({', '.join(['%s'] * len(ids))})", tuple(ids))
+                rank = {key: i for i, key in enumerate(ids)}
+                rows = sorted(cursor.fetchall(), key=lambda row: rank.get(str(row[0]), len(rank)))
+            else:
+                rows = []
             if rows:
                 print("Doctor ID | Name | Specialization | Contact Number")
                 for row in rows:
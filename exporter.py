@@ -0,0 +1,146 @@
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+
+from db_config import get_connection
+
+# Streaming CSV exports. Rows come from an unbuffered cursor (MySQL streams
+# them off the socket, SQLite steps lazily) in fetchmany() chunks, so only
+# one chunk is ever held in Python. After each chunk the file offset and
+# last primary key go to <file>.checkpoint; an interrupted export resumes
+# from there with a keyset WHERE key > last. Gzip output is written as one
+# gzip member per chunk, which gzip readers treat as a single stream and
+# which lets a resume truncate cleanly at a chunk boundary.
+EXPORT_CHUNK_ROWS = int(os.environ.get('HMS_EXPORT_CHUNK_ROWS', 5000))
+EXPORT_MAX_MEMORY_MB = float(os.environ.get('HMS_EXPORT_MAX_MEMORY_MB', 0)) or None
+
+# name: (table, key column, columns, CSV header)
+EXPORTS = {
+    'billing': ('billing', 'bill_id', ['bill_id', 'patient_id', 'total_amount', 'billing_date'],
+                ["Bill ID", "Patient ID", "Total Amount", "Billing Date"]),
+    'appointments': ('appointments', 'appt_id',
+                     ['appt_id', 'patient_id', 'doctor_id', 'date', 'diagnosis', 'consulting_charge'],
+                     ["Appointment ID", "Patient ID", "Doctor ID", "Date", "Diagnosis", "Consulting Charge"]),
+}
+
+
+def checkpoint_path(filename):
+    return filename + '.checkpoint'
+
+
+def load_checkpoint(filename):
+    try:
+        with open(checkpoint_path(filename), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_checkpoint(filename, state):
+    tmp = checkpoint_path(filename) + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp, checkpoint_path(filename))
+
+
+def _row_bytes(rows):
+    # Rough in-memory size of a fetched row, sampled from the chunk
+    sample = rows[:50]
+    total = sum(sys.getsizeof(r) + sum(sys.getsizeof(v) for v in r) for r in sample)
+    return total / len(sample)
+
+
+def encode_rows(rows, header=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(header)
+    writer.writerows(rows)
+    return buffer.getvalue().encode('utf-8')
+
+
+class _Budget:
+    # Turns a memory budget into a chunk size: the fetched rows plus their
+    # CSV text (about as large again) must fit.
+    def __init__(self, chunk_rows, max_memory_mb):
+        self.chunk_rows = chunk_rows
+        self.limit = int(max_memory_mb * 1024 * 1024) if max_memory_mb else None
+        # Probe with a small chunk until the row size is known
+        self.size = min(chunk_rows, 100) if self.limit else chunk_rows
+
+    def observe(self, rows):
+        if self.limit and rows:
+            per_row = _row_bytes(rows) * 2
+            self.size = max(1, min(self.chunk_rows, int(self.limit // per_row)))
+
+
+def export_table(name, filename, compress=False, resume=False, chunk_rows=EXPORT_CHUNK_ROWS,
+                 max_memory_mb=EXPORT_MAX_MEMORY_MB, session=None):
+    # Returns the number of rows in the finished file; 0 when there is
+    # nothing to export (no file is written then)
+    table, key, columns, header = EXPORTS[name]
+    state = load_checkpoint(filename) if resume else None
+    if state is not None and (state.get('export') != name or state.get('gzip') != compress
+                              or not os.path.exists(filename) or os.path.getsize(filename) < state['offset']):
+        # Checkpoint from another export or ahead of what reached the disk
+        state = None
+
+    sql = f"SELECT {', '.join(columns)} FROM {table}"
+    params = None
+    if state is not None and state['last_key'] is not None:
+        sql += f" WHERE {key} > %s"
+        params = (state['last_key'],)
+    sql += f" ORDER BY {key}"
+    key_index = columns.index(key)
+    budget = _Budget(chunk_rows, max_memory_mb)
+
+    conn = get_connection(session)
+    cursor = conn.cursor(buffered=False)
+    out = None
+    finished = False
+    try:
+        cursor.execute(sql, params) if params else cursor.execute(sql)
+        rows = cursor.fetchmany(budget.size)
+        if not rows and state is None:
+            finished = True
+            return 0
+        if state is None:
+            out = open(filename, 'wb')
+            state = {'export': name, 'gzip': compress, 'last_key': None, 'rows': 0, 'offset': 0}
+            first = encode_rows([], header)
+            out.write(gzip.compress(first) if compress else first)
+        else:
+            out = open(filename, 'r+b')
+            out.truncate(state['offset'])
+            out.seek(state['offset'])
+        while rows:
+            budget.observe(rows)
+            data = encode_rows(rows)
+            out.write(gzip.compress(data) if compress else data)
+            out.flush()
+            state['last_key'] = rows[-1][key_index]
+            state['rows'] += len(rows)
+            state['offset'] = out.tell()
+            _save_checkpoint(filename, state)
+            rows = None  # release the chunk before fetching the next
+            rows = cursor.fetchmany(budget.size)
+        finished = True
+        return state['rows']
+    finally:
+        if out is not None:
+            out.close()
+        if not finished:
+            # An unbuffered MySQL cursor cannot close over unread rows
+            consume = getattr(conn, 'consume_results', None)
+            if consume is not None:
+                try:
+                    consume()
+                except Exception:
+                    pass
+        cursor.close()
+        conn.close()
+        if finished and os.path.exists(checkpoint_path(filename)):
+            os.remove(checkpoint_path(filename))
@@ -1,9 +1,59 @@
-from db_config import get_connection
+from db_config import get_connection, Session
 from patient import Patient, auto_patient_id
 from doctor import Doctor, auto_doctor_id
 from service import Service, service_usage_menu, auto_service_id
 from appointment import Appointment, auto_appt_id
-from billing import Bill, calculate_total_charge, auto_bill_id
+from billing import Bill, calculate_charges, calculate_total_charge, auto_bill_id
+from batch_invoices import INVOICE_WORKERS, generate_range, parse_date, print_summary
+from exporter import EXPORT_MAX_MEMORY_MB, load_checkpoint
+from snapshot import SNAPSHOT_WORKERS, export_snapshot, print_manifest
+from delta_export import DELTA_DIR, export_deltas, print_manifest as print_delta_manifest
+from pagination import LISTINGS, PAGE_SIZE
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import os
+import threading
+from invoice_archive import get_archive
+from rollups import REPORTS, print_report
+from scheduling import get_schedule
+from visit_gaps import analyze as analyze_gaps, print_population
+import name_index
+import reference_cache
+
+# --- Listings ---
+def page_through(pages, header):
+    # Shows one page at a time; the next page is fetched in the background
+    # while the current one is being read
+    with ThreadPoolExecutor(max_workers=1) as prefetch:
+        pending = prefetch.submit(next, pages, None)
+        number = 0
+        while True:
+            page = pending.result()
+            if page is None:
+                print("No records found." if number == 0 else "End of list.")
+                return
+            number += 1
+            pending = prefetch.submit(next, pages, None)
+            print(f"\n--- Page {number} ---")
+            print(header)
+            for row in page:
+                print(" | ".join(str(x) for x in row))
+            if input("Press Enter for the next page, or q to stop: ").strip().lower() == 'q':
+                # Let the prefetch finish before closing the generator
+                pending.result()
+                pages.close()
+                return
+
+def display_all(entity, table):
+    key, columns = LISTINGS[table]
+    sort = input(f"Sort by ({', '.join(columns)}) [{key}]: ").strip() or key
+    descending = input("Descending order? (y/N): ").strip().lower() == 'y'
+    try:
+        page_through(entity.iter_pages(PAGE_SIZE, sort=sort, descending=descending), entity.VIEW_HEADER)
+    except ValueError as e:
+        print(e)
+    except Exception as e:
+        print(f"Error while listing {table}:", e)
 
 # --- Patients ---
 def patient_menu():
@@ -40,7 +90,7 @@ def patient_menu():
                 print("Patient was not added.")
                 
         elif choice == '3':
-            Patient.view()
+            display_all(Patient, 'patients')
 
         elif choice == '4':
             patient_id = input("Enter Patient ID to update: ")
@@ -108,7 +158,7 @@ def doctor_menu():
                 print("Doctor was not added.")
  
         elif choice == '3':
-            Doctor.view()
+            display_all(Doctor, 'doctors')
  
         elif choice == '4':
             doctor_id = input("Enter Doctor ID to update: ")
@@ -160,7 +210,7 @@ def service_menu():
                 print("Service was not added.")
 
         elif choice == '2':
-            Service.view()
+            display_all(Service, 'services')
 
         elif choice == '3':
             service_id = input("Enter Service ID to update: ")
@@ -202,7 +252,8 @@ def appointment_menu():
         print("4. Cancel Appointment")
         print("5. Search/Filter Appointments")
         print("6. Calculate Days Between Patient Appointments")
-        print("7. Return to Main Menu")
+        print("7. Find Free Slots")
+        print("8. Return to Main Menu")
         
         choice = input("Select an option: ")
 
@@ -221,7 +272,7 @@ def appointment_menu():
                 print("Appointment was not added.")
                 
         elif choice == '2':
-            Appointment.view()
+            display_all(Appointment, 'appointments')
 
         elif choice == '3':
             appt_id = input("Enter Appointment ID to update: ")
@@ -247,15 +298,52 @@ def appointment_menu():
             Appointment.filter_appointments()
 
         elif choice == '6':
-            patient_id = input("Enter Patient ID: ")
-            Appointment.days_between_appointments(patient_id)
+            patient_id = input("Enter Patient ID [blank: all patients]: ").strip()
+            if patient_id:
+                Appointment.days_between_appointments(patient_id)
+                continue
+            try:
+                print_population(analyze_gaps().population())
+            except Exception as e:
+                print("Error calculating days between appointments:", e)
+
+        elif choice == '7':
+            specialization = input("Enter Specialization: ").strip()
+            start = input("From date (YYYY-MM-DD) [blank: today]: ").strip()
+            try:
+                start = parse_date(start) if start else datetime.date.today().isoformat()
+            except ValueError:
+                print("Invalid date. Use YYYY-MM-DD.")
+                continue
+            try:
+                slots = get_schedule().next_free(specialization, start, 5)
+            except Exception as e:
+                print("Error while reading the schedule:", e)
+                continue
+            if not slots:
+                print(f"No doctors with specialization '{specialization}'.")
+            for day, doctor_id in slots:
+                print(f"{day}  Doctor {doctor_id}")
             
-        elif choice == "7":
+        elif choice == "8":
             break
         else:
             print("Invalid Choice. Please try again.")
 
 # --- Billing ---
+def show_charges(charges):
+    # Outstanding charges per patient, patients with none left out
+    if charges is None:
+        return
+    owing = [(pid, c) for pid, c in charges.items() if c[2]]
+    if not owing:
+        print("No outstanding charges.")
+        return
+    print(f"{'Patient ID':>10} {'Services':>12} {'Consulting':>12} {'Total':>12}")
+    for pid, (service_total, consulting_total, total) in sorted(owing, key=lambda item: int(item[0])):
+        print(f"{pid:>10} {float(service_total):>12,.2f} {float(consulting_total):>12,.2f} {float(total):>12,.2f}")
+    print(f"{len(owing)} patients, {sum(float(c[2]) for _, c in owing):,.2f} outstanding in total.")
+
 def billing_menu():
     while True:
         print("\n=== Billing Records ===")
@@ -265,7 +353,8 @@ def billing_menu():
         print("4. Remove Bill Entry")
         print("5. Calculate Total Charges")
         print("6. Print/Generate Invoice")
-        print("7. Return to Main Menu")
+        print("7. Revenue Reports")
+        print("8. Return to Main Menu")
         
         choice = input("Select an option: ")
  
@@ -278,14 +367,15 @@ def billing_menu():
                 bill = Bill(bill_id, patient_id)
             else:
                 bill = Bill(bill_id, patient_id, billing_date)
-            result = bill.add()
-            if result:
-                bill.generate_invoice()
-            else:
-                print("Bill and Invoice not generated.")
+            with Session() as session:
+                result = bill.add(session=session)
+                if result:
+                    bill.generate_invoice(session=session)
+                else:
+                    print("Bill and Invoice not generated.")
  
         elif choice == "2":
-            Bill.view()
+            display_all(Bill, 'billing')
  
         elif choice == "3":
             bill_id = input("Enter Bill ID to update: ")
@@ -307,48 +397,50 @@ def billing_menu():
             Bill.delete(bill_id)
  
         elif choice == "5":
-            patient_id = input("Enter Patient ID to compute total billing: ")
-            total = calculate_total_charge(patient_id)
-            if total is not None:
-                print(f"Total bill for patient {patient_id}: {total}")
+            entered = input("Enter Patient ID(s) to compute total billing, comma-separated [blank: all patients]: ")
+            patient_ids = [p.strip() for p in entered.split(',') if p.strip()]
+            if len(patient_ids) == 1:
+                total = calculate_total_charge(patient_ids[0])
+                if total is not None:
+                    print(f"Total bill for patient {patient_ids[0]}: {total}")
+            else:
+                show_charges(calculate_charges(patient_ids or None))
  
         elif choice == "6":
             print("Generate Invoice Using:")
             print("1. By Bill ID")
             print("2. By Patient ID")
+            print("3. All Bills in a Date Range")
+            print("4. Export an Archived Invoice to a File")
             invoice_choice = input("Select an option: ")
             if invoice_choice == "1":
                 bill_id = input("Enter Bill ID to generate invoice: ")
-                # Fetch patient_id and billing_date from DB
-                from db_config import get_connection
-                conn = get_connection()
-                cursor = conn.cursor()
-                cursor.execute("SELECT patient_id, billing_date FROM billing WHERE bill_id=%s", (bill_id,))
-                row = cursor.fetchone()
-                cursor.close()
-                conn.close()
-                if row:
-                    patient_id, billing_date = row
-                    bill = Bill(bill_id, patient_id, billing_date)
-                    bill.generate_invoice()
-                else:
-                    print("Bill not found.")
+                # Look up the bill and render it on one connection
+                with Session() as session:
+                    row = Bill.get_by_id(bill_id, session=session)
+                    if row:
+                        bill = Bill(bill_id, row['patient_id'], row['billing_date'])
+                        bill.generate_invoice(session=session)
+                    else:
+                        print("Bill not found.")
                     
             elif invoice_choice == "2":
                 patient_id = input("Enter Patient ID to generate invoice: ")
-                from db_config import get_connection
-                conn = get_connection()
-                cursor = conn.cursor(dictionary=True)
-                cursor.execute("SELECT bill_id, billing_date FROM billing WHERE patient_id=%s", (patient_id,))
-                bills = cursor.fetchall()
+                with Session() as session:
+                    conn = get_connection(session)
+                    cursor = conn.cursor(dictionary=True)
+                    cursor.execute("SELECT bill_id, billing_date FROM billing WHERE patient_id=%s", (patient_id,))
+                    bills = cursor.fetchall()
+                    cursor.close()
+                    if len(bills) == 1:
+                        bill_id = bills[0]['bill_id']
+                        billing_date = bills[0]['billing_date']
+                        bill = Bill(bill_id, patient_id, billing_date)
+                        bill.generate_invoice(session=session)
                 if not bills:
                     print("No bills found for this patient.")
-                elif len(bills) == 1:
-                    bill_id = bills[0]['bill_id']
-                    billing_date = bills[0]['billing_date']
-                    bill = Bill(bill_id, patient_id, billing_date)
-                    bill.generate_invoice()
-                else:
+                elif len(bills) > 1:
+                    # Connection is back in the pool while waiting for input
                     print("Multiple bills found for this patient:")
                     for idx, b in enumerate(bills):
                         print(f"{idx+1}. Bill ID: {b['bill_id']}, Date: {b['billing_date']}")
@@ -365,45 +457,138 @@ def billing_menu():
                             print("Invalid selection.")
                     else:
                         print("Invalid input. Please enter a number.")
-                cursor.close()
-                conn.close()
+            elif invoice_choice == "3":
+                try:
+                    start = parse_date(input("From billing date (YYYY-MM-DD): "))
+                    end = parse_date(input("To billing date (YYYY-MM-DD): "))
+                except ValueError:
+                    print("Invalid date. Use YYYY-MM-DD.")
+                    continue
+                workers = input(f"Worker processes [{INVOICE_WORKERS}]: ").strip()
+                try:
+                    print_summary(generate_range(start, end, int(workers) if workers.isdigit() else INVOICE_WORKERS))
+                except Exception as e:
+                    print("Error while generating invoices:", e)
+            elif invoice_choice == "4":
+                bill_id = input("Enter Bill ID: ").strip()
+                archive = get_archive()
+                history = archive.history(bill_id)
+                if not history:
+                    print("No archived invoices for this bill.")
+                    continue
+                for idx, entry in enumerate(history):
+                    print(f"{idx+1}. Version {entry.version}")
+                user_input = input(f"Select version [{len(history)}: latest]: ").strip()
+                if user_input and not (user_input.isdigit() and 1 <= int(user_input) <= len(history)):
+                    print("Invalid selection.")
+                    continue
+                entry = history[int(user_input) - 1 if user_input else -1]
+                filename = os.path.join("output", "invoices", f"bill_{entry.bill_id}_{entry.version}.txt")
+                os.makedirs(os.path.dirname(filename), exist_ok=True)
+                with open(filename, "w", encoding="utf-8") as f:
+                    f.write(archive.read(entry))
+                print(f"Invoice written to {filename}")
             else:
                 print("Invalid option for invoice generation.")
- 
+
         elif choice == "7":
+            names = list(REPORTS)
+            for idx, name in enumerate(names):
+                print(f"{idx+1}. {name.capitalize()}")
+            report = input("Select a report: ").strip()
+            if not (report.isdigit() and 1 <= int(report) <= len(names)):
+                print("Invalid selection.")
+                continue
+            try:
+                start = input("From date (YYYY-MM-DD) [blank: earliest]: ").strip()
+                end = input("To date (YYYY-MM-DD) [blank: latest]: ").strip()
+                start = parse_date(start) if start else '0001-01-01'
+                end = parse_date(end) if end else '9999-12-31'
+            except ValueError:
+                print("Invalid date. Use YYYY-MM-DD.")
+                continue
+            try:
+                print_report(names[int(report) - 1], start, end)
+            except Exception as e:
+                print("Error while reading revenue rollups:", e)
+ 
+        elif choice == "8":
             break
  
         else:
             print("Invalid Choice. Please try again.")
 
 # -- Export --
+def export_options(filename):
+    # Asks for gzip, resume and memory options; may append .csv/.gz to the name
+    compress = input("Compress with gzip? (y/N): ").strip().lower() == 'y'
+    base = filename[:-3] if filename.lower().endswith(".gz") else filename
+    if not base.lower().endswith(".csv"):
+        base += ".csv"
+    filename = base + ".gz" if compress else base
+    resume = False
+    if load_checkpoint(filename):
+        resume = input(f"An interrupted export of {filename} was found. Resume it? (Y/n): ").strip().lower() != 'n'
+    max_memory = input("Maximum memory for export buffers in MB (blank for default): ").strip()
+    try:
+        max_memory_mb = float(max_memory) if max_memory else EXPORT_MAX_MEMORY_MB
+    except ValueError:
+        print("Invalid memory limit, using the default.")
+        max_memory_mb = EXPORT_MAX_MEMORY_MB
+    return {'filename': filename, 'compress': compress, 'resume': resume, 'max_memory_mb': max_memory_mb}
+
 def export_menu():
     while True:
         print("\n=== Export ===")
         print("1. Export Billing Summary")
         print("2. Export Appointment Summary")
-        print("3. Return to Main Menu")
+        print("3. Export Full Database Snapshot")
+        print("4. Incremental Export (changes since last run)")
+        print("5. Return to Main Menu")
         
         choice = input("Select an option: ")
         
         if choice == '1':
             filename = input("Enter filename for billing summary (default: billing_summary.csv): ").strip() or "billing_summary.csv"
-            if not filename.lower().endswith(".csv"):
-                filename += ".csv"
-            Bill.export_billing_summary_to_csv(filename)
+            Bill.export_billing_summary_to_csv(**export_options(filename))
             
         elif choice == '2':
             filename = input("Enter filename for appointment summary (default: appointment_summary.csv): ").strip() or "appointment_summary.csv"
-            if not filename.lower().endswith(".csv"):
-                filename += ".csv"
-            Appointment.export_appointment_summary_to_csv(filename)
+            Appointment.export_appointment_summary_to_csv(**export_options(filename))
             
         elif choice == '3':
+            directory = input("Enter output directory (default: snapshot_<timestamp>): ").strip() or None
+            compress = input("Compress with gzip? (y/N): ").strip().lower() == 'y'
+            workers = input(f"Parallel workers (default: {SNAPSHOT_WORKERS}): ").strip()
+            try:
+                directory, manifest = export_snapshot(directory, compress, int(workers) if workers else SNAPSHOT_WORKERS)
+                print_manifest(directory, manifest)
+            except ValueError:
+                print("Invalid number of workers.")
+            except Exception as e:
+                print("Error exporting database snapshot:", e)
+            
+        elif choice == '4':
+            directory = input(f"Enter output directory (default: {DELTA_DIR}): ").strip() or DELTA_DIR
+            compress = input("Compress with gzip? (y/N): ").strip().lower() == 'y'
+            try:
+                print_delta_manifest(export_deltas(directory, compress=compress))
+            except Exception as e:
+                print("Error running incremental export:", e)
+            
+        elif choice == '5':
             break
         else:
             print("Invalid choice.")
 
 # --- Main CLI ---
+def show_cache_stats():
+    print("\n=== Cache Statistics ===")
+    print(f"{'cache':<10} {'entries':>8} {'KB':>8} {'hits':>8} {'not found':>9} {'misses':>8} {'hit rate':>8} {'evicted':>8} {'expired':>8}")
+    for name, stats in reference_cache.cache_stats().items():
+        print(f"{name:<10} {stats['size']:>8} {stats['bytes'] / 1024:>8.1f} {stats['hits']:>8} {stats['negative_hits']:>9} "
+              f"{stats['misses']:>8} {stats['hit_rate']:>8.1%} {stats['evictions']:>8} {stats['expirations']:>8}")
+
 def main_menu():
     while True:
         print("\n=== Hospital Management System ===")
@@ -413,7 +598,8 @@ def main_menu():
         print("4. Appointment Records")
         print("5. Billing Records")
         print("6. Export")
-        print("7. Exit")
+        print("7. Cache Statistics")
+        print("8. Exit")
         
         choice = input("Select an option: ")
 
@@ -430,10 +616,16 @@ def main_menu():
         elif choice == '6':
             export_menu()
         elif choice == '7':
+            show_cache_stats()
+        elif choice == '8':
             print("Exiting Hospital Management CLI. Bye!")
             break
         else:
             print("Invalid choice. Please try again.")
 
 if __name__ == "__main__":
+    # Warm the reference cache and load or build the name search index
+    # while the menu is in use
+    threading.Thread(target=reference_cache.warm, daemon=True).start()
+    threading.Thread(target=name_index.warm, daemon=True).start()
     main_menu()
@@ -0,0 +1,115 @@
+import os
+import threading
+
+from mysql.connector import IntegrityError
+
+from db_config import get_connection
+
+# Hi/lo allocation: each process reserves a block of IDs with one short
+# transaction on id_sequences and hands them out from memory, so new IDs
+# cost O(1) amortised and two clerks (threads or processes) never receive
+# the same ID. Unused IDs of a block are skipped when the process exits.
+ID_BLOCK_SIZE = int(os.environ.get('HMS_ID_BLOCK_SIZE', 20))
+
+# name: (table, column, prefix, zero-padded width, first value)
+SEQUENCES = {
+    'patient': ('patients', 'patient_id', '', 0, 1001),
+    'doctor': ('doctors', 'doctor_id', 'D', 2, 1),
+    'service': ('services', 'service_id', 'S', 2, 1),
+    'appointment': ('appointments', 'appt_id', 'A', 3, 1),
+    'bill': ('billing', 'bill_id', 'B', 3, 1),
+}
+
+
+def format_id(name, value):
+    _, _, prefix, width, _ = SEQUENCES[name]
+    if not prefix:
+        return value
+    return f"{prefix}{value:0{width}d}"
+
+
+def _current_max(cursor, name):
+    # One-off scan used only to seed a sequence that does not exist yet
+    table, column, prefix, _, first = SEQUENCES[name]
+    if not prefix:
+        cursor.execute(f"SELECT MAX({column}) FROM {table}")
+        row = cursor.fetchone()
+        return int(row[0]) if row and row[0] is not None else first - 1
+    cursor.execute(f"SELECT {column} FROM {table} WHERE {column} LIKE %s", (prefix + '%',))
+    ids = [int(row[0][len(prefix):]) for row in cursor.fetchall() if row[0][len(prefix):].isdigit()]
+    return max(ids) if ids else first - 1
+
+
+class _Sequence:
+    def __init__(self, name, block_size):
+        self.name = name
+        self.block_size = block_size
+        self.next_value = 0
+        self.limit = 0
+        self.lock = threading.Lock()
+
+    def next(self):
+        with self.lock:
+            if self.next_value >= self.limit:
+                self.next_value, self.limit = reserve_block(self.name, self.block_size)
+            value = self.next_value
+            self.next_value += 1
+            return value
+
+
+def reserve_block(name, size):
+    # The UPDATE row-locks the sequence until commit, so concurrent
+    # reservations from other processes serialise on it.
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        for _ in range(2):
+            cursor.execute("UPDATE id_sequences SET next_value = next_value + %s WHERE name = %s", (size, name))
+            if cursor.rowcount:
+                cursor.execute("SELECT next_value FROM id_sequences WHERE name = %s", (name,))
+                limit = int(cursor.fetchone()[0])
+                conn.commit()
+                return limit - size, limit
+            start = _current_max(cursor, name) + 1
+            try:
+                cursor.execute("INSERT INTO id_sequences (name, next_value) VALUES (%s, %s)", (name, start + size))
+                conn.commit()
+                return start, start + size
+            except IntegrityError:
+                # Another process seeded it first; take a block from its row
+                conn.rollback()
+        raise RuntimeError(f"Could not reserve IDs for sequence '{name}'.")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def sync_sequence(name, cursor=None):
+    # Moves the sequence past IDs inserted without the allocator (bulk loads)
+    own = cursor is None
+    if own:
+        conn = get_connection()
+        cursor = conn.cursor()
+    try:
+        start = _current_max(cursor, name) + 1
+        cursor.execute("UPDATE id_sequences SET next_value = %s WHERE name = %s AND next_value < %s", (start, name, start))
+        if own:
+            conn.commit()
+    finally:
+        if own:
+            cursor.close()
+            conn.close()
+    with _lock:
+        _sequences.pop(name, None)
+
+
+_sequences = {}
+_lock = threading.Lock()
+
+
+def next_id(name):
+    sequence = _sequences.get(name)
+    if sequence is None:
+        with _lock:
+            sequence = _sequences.setdefault(name, _Sequence(name, ID_BLOCK_SIZE))
+    return format_id(name, sequence.next())
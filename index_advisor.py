@@ -0,0 +1,384 @@
+import argparse
+import datetime
+import os
+import re
+import statistics
+import time
+
+import db_config
+import migrate
+import query_stats
+from db_config import get_connection
+
+# Index advice from the recorded workload. Record what the entity classes
+# actually run (query_stats keeps the last statement text of each entry),
+# then EXPLAIN every recorded statement against the current database:
+#   HMS_QUERY_STATS=1 python hospital_main.py      (or any job)
+#   python index_advisor.py                        (report)
+#   python index_advisor.py --measure --write      (time and emit a migration)
+# A full scan (SQLite: SCAN or an AUTOMATIC index; MySQL: type ALL) of a
+# table with at least ADVISOR_MIN_ROWS rows is flagged. The table's
+# equality filters, then one range filter or the ORDER BY (or its join key
+# when it has no filter of its own), taken from the statement, make the
+# suggested index unless an existing index already starts with them.
+# --measure times each affected SELECT with the index built and then
+# dropped again; --write emits the indexes that measured faster as the next
+# migration for this backend, in a form that can be applied online
+# (InnoDB: ALGORITHM=INPLACE, LOCK=NONE; SQLite: readers carry on in WAL
+# mode while the index builds).
+# Without HMS_SLOW_QUERY_LOG_PARAMS=1 the recorded parameters are types
+# only, and statements are explained and timed with stand-in values.
+ADVISOR_MIN_ROWS = int(os.environ.get('HMS_ADVISOR_MIN_ROWS', 1000))
+ADVISOR_REPEAT = int(os.environ.get('HMS_ADVISOR_REPEAT', 5))
+MAX_INDEX_COLUMNS = 3
+
+_EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH|UPDATE|DELETE|INSERT\b.*\bSELECT\b)", re.IGNORECASE | re.DOTALL)
+_TABLE = re.compile(r"\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+_NOT_ALIAS = {'where', 'join', 'left', 'right', 'inner', 'outer', 'cross', 'on', 'group', 'order', 'set', 'limit',
+              'using', 'values', 'union', 'having', 'as', 'select', 'natural'}
+_COLUMN = r"(?:(\w+)\.)?(\w+)"
+_EQUALS = re.compile(_COLUMN + r"\s*=\s*%s|" + _COLUMN + r"\s+IN\s*\(\s*%s", re.IGNORECASE)
+_RANGE = re.compile(_COLUMN + r"\s*(?:<=|>=|<|>)\s*%s|" + _COLUMN + r"\s+BETWEEN\s+%s", re.IGNORECASE)
+_JOIN = re.compile(r"(\w+)\.(\w+)\s*=\s*(\w+)\.(\w+)")
+_ORDER = re.compile(r"\bORDER\s+BY\s+([\w\s.,]+?)(?:\bLIMIT\b|\)|$)", re.IGNORECASE)
+_LIKE_BEFORE = re.compile(r"\bLIKE\s*$", re.IGNORECASE)
+
+# Stand-in parameters by recorded type name
+_STAND_INS = {'int': 1, 'float': 1.0, 'Decimal': 1.0, 'str': 'x', 'date': '2000-01-01', 'datetime': '2000-01-01 00:00:00',
+              'NoneType': None}
+
+
+class Suggestion:
+    def __init__(self, table, columns):
+        self.table = table
+        self.columns = columns
+        self.statements = []
+        self.before_ms = None
+        self.after_ms = None
+
+    @property
+    def name(self):
+        return f"idx_{self.table}_{'_'.join(self.columns)}"
+
+    def ddl(self, backend=None):
+        if (backend or db_config.DB_BACKEND) == 'sqlite':
+            return f"CREATE INDEX IF NOT EXISTS {self.name} ON {self.table} ({', '.join(self.columns)});"
+        return f"ALTER TABLE {self.table} ADD INDEX {self.name} ({', '.join(self.columns)}), ALGORITHM=INPLACE, LOCK=NONE;"
+
+    def drop(self):
+        if db_config.DB_BACKEND == 'sqlite':
+            return f"DROP INDEX IF EXISTS {self.name}"
+        return f"ALTER TABLE {self.table} DROP INDEX {self.name}"
+
+
+def parameters(sample):
+    # The recorded values when they were kept, otherwise stand-ins; a LIKE
+    # pattern stands in as '%x%', which no index serves
+    if sample['params'] is not None:
+        values = []
+        for kind, value in zip(sample['types'], sample['params']):
+            values.append(value if value is None or kind not in ('int', 'float', 'Decimal')
+                          else (int(value) if kind == 'int' else float(value)))
+        return tuple(values)
+    positions = [m.start() for m in re.finditer(r"%s", sample['sql'])]
+    return tuple('%x%' if _LIKE_BEFORE.search(sample['sql'][:pos]) else _STAND_INS.get(kind, 'x')
+                 for kind, pos in zip(sample['types'], positions))
+
+
+# --- Catalog and plans, per backend ---
+
+def tables(cursor):
+    if db_config.DB_BACKEND == 'sqlite':
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")
+    else:
+        cursor.execute("SHOW TABLES")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def columns(cursor, table):
+    if db_config.DB_BACKEND == 'sqlite':
+        cursor.execute(f"PRAGMA table_info({table})")
+        return [row[1] for row in cursor.fetchall()]
+    cursor.execute(f"SHOW COLUMNS FROM {table}")
+    return [row[0] for row in cursor.fetchall()]
+
+
+def indexes(cursor, table):
+    # Column lists of the table's indexes, the primary key included
+    if db_config.DB_BACKEND == 'sqlite':
+        cursor.execute(f"PRAGMA table_info({table})")
+        found = [[row[1] for row in sorted(cursor.fetchall(), key=lambda r: r[5]) if row[5]]]
+        cursor.execute(f"PRAGMA index_list({table})")
+        for name in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f"PRAGMA index_info({name})")
+            found.append([row[2] for row in sorted(cursor.fetchall())])
+        return [tuple(c) for c in found if c]
+    cursor.execute(f"SHOW INDEX FROM {table}")
+    found = {}
+    for row in cursor.fetchall():
+        found.setdefault(row[2], []).append((row[3], row[4]))
+    return [tuple(c for _, c in sorted(cols)) for cols in found.values()]
+
+
+def row_count(cursor, table):
+    cursor.execute(f"SELECT COUNT(*) FROM {table}")
+    return cursor.fetchone()[0]
+
+
+def full_scans(cursor, sql, params):
+    # [(table or alias, plan detail)] of the plan's full table scans
+    if db_config.DB_BACKEND == 'sqlite':
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        scans = []
+        for row in cursor.fetchall():
+            detail = row[-1]
+            words = detail.split()
+            # SCAN ... USING INDEX walks a whole index, e.g. for ORDER BY
+            if words[0] == 'SCAN' or 'AUTOMATIC' in words:
+                scans.append((words[1], detail))
+        return scans
+    cursor.execute("EXPLAIN " + sql, params)
+    names = [d[0] for d in cursor.description]
+    rows = [dict(zip(names, row)) for row in cursor.fetchall()]
+    return [(row['table'], f"type ALL, ~{row.get('rows')} rows, {row.get('Extra') or ''}".strip(', '))
+            for row in rows if row.get('type') == 'ALL' and row.get('table') and not row['table'].startswith('<')]
+
+
+# --- Candidate index from the statement text ---
+
+def aliases(sql, known):
+    # {alias or table name: table} for the real tables the statement reads
+    found = {}
+    for table, alias in _TABLE.findall(sql):
+        if table not in known:
+            continue
+        found[table] = table
+        if alias and alias.lower() not in _NOT_ALIAS:
+            found[alias] = table
+    return found
+
+
+def candidate(sql, table, names, table_columns):
+    # The table's own equality filters, then one range filter or the ORDER
+    # BY; names are the aliases that refer to it. A table with no filter of
+    # its own that is scanned inside a join wants its join key instead.
+    def mine(qualifier, column):
+        if column not in table_columns:
+            return False
+        return qualifier in names if qualifier else True
+
+    def columns_of(pattern):
+        found = []
+        for match in pattern.finditer(sql):
+            qualifier, column = (match.group(1), match.group(2)) if match.group(2) else (match.group(3), match.group(4))
+            if mine(qualifier, column) and column not in found:
+                found.append(column)
+        return found
+
+    equal = columns_of(_EQUALS)
+    ranged = [c for c in columns_of(_RANGE) if c not in equal]
+    ordered = []
+    order = _ORDER.search(sql)
+    if order and equal:
+        for term in order.group(1).split(','):
+            qualifier, _, column = (term.split() or [''])[0].rpartition('.')
+            if mine(qualifier or None, column) and column not in equal:
+                ordered.append(column)
+    chosen = equal + (ranged[:1] or ordered)
+    if not chosen:
+        for left, lcol, right, rcol in _JOIN.findall(sql):
+            for qualifier, column, other in ((left, lcol, right), (right, rcol, left)):
+                if qualifier in names and other not in names and column in table_columns:
+                    return (column,)
+    return tuple(chosen[:MAX_INDEX_COLUMNS])
+
+
+# --- Advice ---
+
+class Finding:
+    def __init__(self, stats, table, detail, rows, suggestion=None, note=''):
+        self.stats = stats
+        self.table = table
+        self.detail = detail
+        self.rows = rows
+        self.suggestion = suggestion
+        self.note = note
+
+
+def analyze(statements, min_rows=ADVISOR_MIN_ROWS, session=None):
+    # (findings, suggestions) for the recorded statements, busiest first
+    conn = get_connection(session)
+    cursor = conn.cursor()
+    findings, suggestions, errors = [], {}, []
+    try:
+        known = tables(cursor)
+        catalog, counts = {}, {}
+        for stats in sorted(statements, key=lambda s: s.total_ms, reverse=True):
+            sample = query_stats.sample_dict(stats.sample)
+            if not sample or not _EXPLAINABLE.match(sample['sql']) or 'EXPLAIN' in sample['sql'].upper():
+                continue
+            try:
+                scans = full_scans(cursor, sample['sql'], parameters(sample))
+            except Exception as e:
+                errors.append((stats.statement, str(e)))
+                continue
+            names = aliases(sample['sql'], known)
+            for alias, detail in scans:
+                table = names.get(alias)
+                if table is None:
+                    continue
+                if table not in catalog:
+                    catalog[table] = (columns(cursor, table), indexes(cursor, table))
+                    counts[table] = row_count(cursor, table)
+                if counts[table] < min_rows:
+                    continue
+                table_columns, existing = catalog[table]
+                cols = candidate(sample['sql'], table, {a for a, t in names.items() if t == table}, table_columns)
+                if not cols:
+                    note = "reads the whole table"
+                    if re.search(r"\bLIKE\s+%s", sample['sql'], re.IGNORECASE):
+                        note = "a LIKE '%...%' filter cannot use an index (see name_index.py)"
+                    findings.append(Finding(stats, table, detail, counts[table], note=note))
+                    continue
+                if any(index[:len(cols)] == cols for index in existing):
+                    findings.append(Finding(stats, table, detail, counts[table],
+                                            note=f"an index on ({', '.join(cols)}) exists but is not used"))
+                    continue
+                suggestion = suggestions.setdefault((table, cols), Suggestion(table, cols))
+                suggestion.statements.append(stats)
+                findings.append(Finding(stats, table, detail, counts[table], suggestion))
+    finally:
+        cursor.close()
+        conn.close()
+    return findings, _merge(list(suggestions.values())), errors
+
+
+def _merge(suggestions):
+    # An index whose columns lead another suggested index on the same table
+    # is served by that one
+    kept = []
+    for s in sorted(suggestions, key=lambda s: -len(s.columns)):
+        wider = next((k for k in kept if k.table == s.table and k.columns[:len(s.columns)] == s.columns), None)
+        if wider is not None:
+            wider.statements.extend(s.statements)
+        else:
+            kept.append(s)
+    return kept
+
+
+def _time(cursor, sample, repeat):
+    params = parameters(sample)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cursor.execute(sample['sql'], params)
+        cursor.fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def measure(suggestions, repeat=ADVISOR_REPEAT, session=None):
+    # Sets before_ms/after_ms to the summed median latency of the affected
+    # SELECTs without and with the index; the index is dropped afterwards
+    conn = get_connection(session)
+    cursor = conn.cursor()
+    try:
+        for suggestion in suggestions:
+            samples = [query_stats.sample_dict(s.sample) for s in suggestion.statements]
+            samples = [s for s in samples if re.match(r"\s*(SELECT|WITH)\b", s['sql'], re.IGNORECASE)]
+            if not samples:
+                continue
+            suggestion.before_ms = sum(_time(cursor, s, repeat) for s in samples)
+            cursor.execute(suggestion.ddl().rstrip(';'))
+            conn.commit()
+            try:
+                suggestion.after_ms = sum(_time(cursor, s, repeat) for s in samples)
+            finally:
+                cursor.execute(suggestion.drop())
+                conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def helpful(suggestions):
+    # Measured suggestions that did not make their statements faster are
+    # left out of the migration
+    return [s for s in suggestions if s.before_ms is None or s.after_ms is None or s.after_ms < s.before_ms]
+
+
+def write_migration(suggestions, name='workload_indexes', backend=None, directory=None):
+    # The suggestions as the next numbered migration; returns its path
+    backend = backend or db_config.DB_BACKEND
+    directory = directory or os.path.join(migrate.MIGRATIONS_DIR, backend)
+    numbers = [int(f.split('_')[0]) for f in os.listdir(directory) if f.endswith('.sql') and f.split('_')[0].isdigit()]
+    path = os.path.join(directory, f"{max(numbers, default=0) + 1:03d}_{name}.sql")
+    lines = [f"-- Suggested by index_advisor.py on {datetime.date.today().isoformat()} from the recorded workload."]
+    if backend == 'sqlite':
+        lines.append("-- SQLite builds each index in one write transaction; readers carry on in WAL mode.")
+    else:
+        lines.append("-- Online DDL: InnoDB builds each index in place without blocking reads or writes.")
+    for s in suggestions:
+        lines.append("")
+        for stats in s.statements[:3]:
+            lines.append(f"-- {stats.count}x {stats.statement[:110]}")
+        if s.before_ms is not None and s.after_ms is not None:
+            lines.append(f"-- measured: {s.before_ms:.2f} ms -> {s.after_ms:.2f} ms")
+        lines.append(s.ddl(backend))
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write('\n'.join(lines) + '\n')
+    return path
+
+
+def print_report(findings, suggestions, errors):
+    if not findings:
+        print("No full scans of large tables in the recorded workload.")
+    for f in findings:
+        print(f"{f.stats.count:>7}x {f.stats.total_ms:>10.1f} ms  {f.table} ({f.rows:,} rows): {f.detail}")
+        print(f"{'':>22}{f.stats.statement[:100]}")
+        for site, n in f.stats.call_sites.most_common(2):
+            print(f"{'':>22}called {n}x from {site}")
+        print(f"{'':>22}-> " + (f"index {f.suggestion.table} ({', '.join(f.suggestion.columns)})"
+                                  if f.suggestion else f.note))
+    if suggestions:
+        print("\nSuggested indexes:")
+        for s in suggestions:
+            timing = ""
+            if s.before_ms is not None and s.after_ms is not None:
+                timing = f"  {s.before_ms:.2f} ms -> {s.after_ms:.2f} ms"
+            print(f"  {s.ddl()}{timing}")
+    for statement, error in errors:
+        print(f"Could not explain: {statement[:80]} ({error})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Suggest indexes for the recorded query workload.")
+    parser.add_argument('--file', default=query_stats.QUERY_STATS_FILE)
+    parser.add_argument('--min-rows', type=int, default=ADVISOR_MIN_ROWS)
+    parser.add_argument('--measure', action='store_true', help="time the affected SELECTs with each index built")
+    parser.add_argument('--repeat', type=int, default=ADVISOR_REPEAT)
+    parser.add_argument('--write', action='store_true', help="emit the suggestions as the next migration")
+    parser.add_argument('--name', default='workload_indexes', help="migration name (with --write)")
+    args = parser.parse_args()
+
+    # The advisor's own EXPLAINs and timings are not part of the workload
+    query_stats.disable()
+    statements = query_stats.load_stats(args.file)
+    if not statements:
+        print(f"No query statistics recorded in {args.file}. Run the application with HMS_QUERY_STATS=1.")
+        return
+    findings, suggestions, errors = analyze(statements, args.min_rows)
+    if args.measure:
+        measure(suggestions, args.repeat)
+    print_report(findings, suggestions, errors)
+    if args.write:
+        kept = helpful(suggestions)
+        for s in suggestions:
+            if s not in kept:
+                print(f"Left out {s.name}: not faster when measured")
+        if kept:
+            print(f"Migration written to {write_migration(kept, args.name)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+import argparse
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# Rendered invoices are kept in a packed, append-only archive instead of one
+# text file per bill. Writers append to the newest segment
+# (<created>-<pid>.seg) and record every invoice in the segment's index
+# (.idx, fixed-size entries: bill, patient, version, offset, length, crc),
+# each append under an exclusive lock on the directory's .lock file, so
+# short-lived processes share one segment instead of leaving a pair of
+# small files each. A segment is sealed once it passes INVOICE_SEGMENT_MB
+# and the next writer starts a new one.
+# Readers load every index into dicts keyed by bill and by patient, making a
+# lookup O(1), and read the invoice through a memory map of its segment.
+# Invoices are stored zlib-compressed against a preset dictionary of the
+# invoice boilerplate (about 13x smaller); with HMS_INVOICE_ARCHIVE_COMPRESS=0
+# they are stored raw and read without a copy.
+#   python invoice_archive.py --bill B001 [--version V] [--history] [--out FILE]
+#   python invoice_archive.py --patient 1001
+#   python invoice_archive.py --stats | --verify | --import output/invoices
+INVOICE_ARCHIVE_DIR = os.environ.get('HMS_INVOICE_ARCHIVE_DIR', os.path.join("output", "invoice_archive"))
+INVOICE_SEGMENT_MB = float(os.environ.get('HMS_INVOICE_SEGMENT_MB', 64))
+INVOICE_ARCHIVE_COMPRESS = os.environ.get('HMS_INVOICE_ARCHIVE_COMPRESS', '1') != '0'
+
+# bill_id, patient_id, version (8 bytes of the 16 hex digits), archived_at
+# (ns), offset, stored length, text length, crc32 of the stored bytes, flags
+_ENTRY = struct.Struct('<20s20s8sQQIIIB3x')
+_COMPRESSED = 1
+
+# Never change: archived invoices are decompressed with it. New boilerplate
+# only compresses a little worse.
+_ZDICT = ("=" * 60 + "\n              HOSPITAL INVOICE\n" + "=" * 60 + "\n"
+          "Bill No.    : B0000             Date: 2024-01-01\n"
+          "Patient ID  : 1000              Name: \n" + "-" * 60 + "\n"
+          "Doctor      : Dr.  ()\nConsultation Charge: ₹0.00\n" + "-" * 60 + "\n"
+          f"{'Service Name':30} {'Amount':>15}\n" + "-" * 60 + "\n"
+          f"{'No services billed.':<57}\n" + "-" * 60 + "\n"
+          f"{'Service Total':>47} : ₹0.00\n{'Consultation Charge':>47} : ₹0.00\n" + "-" * 60 + "\n"
+          f"{'TOTAL AMOUNT DUE':>47} : ₹0.00\n" + "=" * 60 + "\n"
+          "Payment due within 30 days. For queries, call (123) 456-7890\n" + "=" * 60 + "\n"
+          "        Thank you for choosing our Hospital!\n" + "=" * 60).encode('utf-8')
+
+Entry = namedtuple('Entry', 'bill_id patient_id version archived_at segment offset length size crc flags')
+
+
+def _lock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+
+def _unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _key(value):
+    raw = str(value).encode('utf-8')
+    if len(raw) > 20:
+        raise ValueError(f"Key '{value}' is longer than 20 bytes.")
+    return raw
+
+
+class InvoiceArchive:
+    def __init__(self, directory=INVOICE_ARCHIVE_DIR, segment_bytes=None, compress=INVOICE_ARCHIVE_COMPRESS):
+        self.directory = directory
+        self.segment_bytes = int(segment_bytes or INVOICE_SEGMENT_MB * 1024 * 1024)
+        self.compress = compress
+        # bill_id: {version: Entry}; patient_id: {bill_id}
+        self._bills = {}
+        self._patients = {}
+        # index file: bytes consumed so far
+        self._loaded = {}
+        self._maps = {}
+        self._writer = None
+        self._lockfile = None
+        self._lock = threading.RLock()
+        self.refresh()
+
+    # --- Index ---
+
+    def _add(self, entry):
+        self._bills.setdefault(entry.bill_id, {})[entry.version] = entry
+        self._patients.setdefault(entry.patient_id, set()).add(entry.bill_id)
+
+    def refresh(self):
+        # Picks up segments and entries written since the last call, by this
+        # or any other process; returns how many entries were new
+        added = 0
+        with self._lock:
+            try:
+                names = sorted(n for n in os.listdir(self.directory) if n.endswith('.idx'))
+            except FileNotFoundError:
+                return 0
+            for name in names:
+                path = os.path.join(self.directory, name)
+                done = self._loaded.get(name, 0)
+                size = os.path.getsize(path)
+                # A trailing partial entry is still being written
+                complete = size - size % _ENTRY.size
+                if complete <= done:
+                    continue
+                with open(path, 'rb') as f:
+                    f.seek(done)
+                    data = f.read(complete - done)
+                segment = name[:-len('.idx')]
+                for bill, patient, version, at, offset, length, text_size, crc, flags in _ENTRY.iter_unpack(data):
+                    self._add(Entry(bill.rstrip(b'\0').decode('utf-8'), patient.rstrip(b'\0').decode('utf-8'),
+                                    version.hex(), at, segment, offset, length, text_size, crc, flags))
+                    added += 1
+                self._loaded[name] = complete
+        return added
+
+    def _versions(self, bill_id):
+        versions = self._bills.get(str(bill_id))
+        if versions is None and self.refresh():
+            versions = self._bills.get(str(bill_id))
+        return versions or {}
+
+    def get(self, bill_id, version=None):
+        # The bill's latest archived invoice, or the given version; None when
+        # there is none
+        with self._lock:
+            versions = self._versions(bill_id)
+            if version is not None:
+                entry = versions.get(version)
+                if entry is None and self.refresh():
+                    entry = self._versions(bill_id).get(version)
+                return entry
+            return max(versions.values(), key=lambda e: e.archived_at, default=None)
+
+    def has(self, bill_id, version):
+        with self._lock:
+            if version in self._bills.get(str(bill_id), ()):
+                return True
+            # Another process may have archived it since
+            return bool(self.refresh()) and version in self._bills.get(str(bill_id), ())
+
+    def history(self, bill_id):
+        # Every archived version of the bill, oldest first
+        with self._lock:
+            return sorted(self._versions(bill_id).values(), key=lambda e: e.archived_at)
+
+    def for_patient(self, patient_id):
+        # The latest invoice of each of the patient's bills
+        with self._lock:
+            self.refresh()
+            return sorted((self.get(b) for b in self._patients.get(str(patient_id), ())),
+                          key=lambda e: e.archived_at)
+
+    # --- Reading ---
+
+    def _map(self, segment, end):
+        mapped = self._maps.get(segment)
+        if mapped is None or len(mapped) < end:
+            # Segments only grow; remap to see what was appended since
+            with open(os.path.join(self.directory, segment + '.seg'), 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = mapped
+        return mapped
+
+    def read_bytes(self, entry):
+        # The invoice as UTF-8: a memoryview into the segment map for a raw
+        # entry, a decompressed copy otherwise
+        with self._lock:
+            view = memoryview(self._map(entry.segment, entry.offset + entry.length))[
+                entry.offset:entry.offset + entry.length]
+        if entry.flags & _COMPRESSED:
+            return zlib.decompressobj(zdict=_ZDICT).decompress(view)
+        return view
+
+    def read(self, entry):
+        data = self.read_bytes(entry)
+        try:
+            return str(data, 'utf-8')
+        finally:
+            if isinstance(data, memoryview):
+                data.release()
+
+    def verify(self):
+        # [(entry, problem)] for entries whose bytes are missing or damaged
+        problems = []
+        with self._lock:
+            self.refresh()
+            entries = [e for versions in self._bills.values() for e in versions.values()]
+        for entry in entries:
+            try:
+                view = memoryview(self._map(entry.segment, entry.offset + entry.length))[
+                    entry.offset:entry.offset + entry.length]
+                if len(view) < entry.length:
+                    problems.append((entry, "truncated"))
+                elif zlib.crc32(view) != entry.crc:
+                    problems.append((entry, "checksum mismatch"))
+                view.release()
+            except (OSError, ValueError) as e:
+                problems.append((entry, str(e)))
+        return problems
+
+    # --- Writing ---
+
+    def _segment(self, needed):
+        # The segment to append to; called with the directory locked. At
+        # most one segment is open for appends at a time: the newest, until
+        # it is sealed.
+        if self._writer is not None:
+            name, data, index = self._writer
+            data.seek(0, os.SEEK_END)
+            if data.tell() + needed <= self.segment_bytes or data.tell() == 0:
+                return self._writer
+            data.close()
+            index.close()
+            self._writer = None
+        names = sorted(n[:-len('.seg')] for n in os.listdir(self.directory) if n.endswith('.seg'))
+        if names and os.path.getsize(os.path.join(self.directory, names[-1] + '.seg')) + needed <= self.segment_bytes:
+            name = names[-1]
+        else:
+            name = f"{time.time_ns():016x}-{os.getpid()}"
+        self._writer = (name, open(os.path.join(self.directory, name + '.seg'), 'ab'),
+                        open(os.path.join(self.directory, name + '.idx'), 'ab'))
+        self._loaded.setdefault(name + '.idx', 0)
+        return self._writer
+
+    def _lock_directory(self):
+        if self._lockfile is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._lockfile = open(os.path.join(self.directory, '.lock'), 'a+b')
+        _lock_file(self._lockfile)
+
+    def append(self, bill_id, patient_id, version, text):
+        # Archives one rendered invoice; a version already archived is not
+        # stored again. Returns its Entry.
+        with self._lock:
+            existing = self._bills.get(str(bill_id), {}).get(version)
+            if existing is not None:
+                return existing
+            raw = text.encode('utf-8')
+            flags = 0
+            stored = raw
+            if self.compress:
+                packer = zlib.compressobj(6, zdict=_ZDICT)
+                stored = packer.compress(raw) + packer.flush()
+                flags |= _COMPRESSED
+            self._lock_directory()
+            try:
+                name, data, index = self._segment(len(stored))
+                offset = data.tell()
+                # A writer that died mid-entry left a partial one; the
+                # next entry must start on an entry boundary
+                index.seek(0, os.SEEK_END)
+                if index.tell() % _ENTRY.size:
+                    index.truncate(index.tell() - index.tell() % _ENTRY.size)
+                entry = Entry(str(bill_id), str(patient_id), version, time.time_ns(), name, offset,
+                              len(stored), len(raw), zlib.crc32(stored), flags)
+                # Data before index: an index entry never points past the data
+                data.write(stored)
+                data.flush()
+                index.write(_ENTRY.pack(_key(bill_id), _key(patient_id), bytes.fromhex(version), entry.archived_at,
+                                        offset, entry.length, entry.size, entry.crc, flags))
+                index.flush()
+                position = index.tell() - _ENTRY.size
+            finally:
+                _unlock_file(self._lockfile)
+            # Entries other writers added before this one are read on refresh
+            if self._loaded.get(name + '.idx') == position:
+                self._loaded[name + '.idx'] = position + _ENTRY.size
+            self._add(entry)
+            return entry
+
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                self._writer[1].close()
+                self._writer[2].close()
+                self._writer = None
+            if self._lockfile is not None:
+                self._lockfile.close()
+                self._lockfile = None
+            for mapped in self._maps.values():
+                try:
+                    mapped.close()
+                except BufferError:
+                    # A caller still holds a view into it
+                    pass
+            self._maps.clear()
+
+    def stats(self):
+        with self._lock:
+            self.refresh()
+            entries = [e for versions in self._bills.values() for e in versions.values()]
+            segments = {e.segment for e in entries}
+            stored = sum(e.length for e in entries)
+            text = sum(e.size for e in entries)
+            return {
+                'bills': len(self._bills),
+                'patients': len(self._patients),
+                'invoices': len(entries),
+                'segments': len(segments),
+                'stored_bytes': stored,
+                'text_bytes': text,
+                'ratio': text / stored if stored else 0.0,
+            }
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def get_archive():
+    # The process-wide archive in INVOICE_ARCHIVE_DIR, opened on first use
+    global _archive
+    with _archive_lock:
+        if _archive is None:
+            _archive = InvoiceArchive()
+        return _archive
+
+
+def import_files(directory, archive):
+    # Archives the bill_<id>_<version>.txt (or bill_<id>.txt) files of the
+    # old one-file-per-invoice layout; returns how many were new
+    added = 0
+    for name in sorted(os.listdir(directory)):
+        match = re.fullmatch(r'bill_(.+?)(?:_([0-9a-f]{16}))?\.txt', name)
+        if not match:
+            continue
+        with open(os.path.join(directory, name), encoding='utf-8') as f:
+            text = f.read()
+        patient = re.search(r'^Patient ID\s*:\s*(\S+)', text, re.M)
+        bill_id, version = match.group(1), match.group(2)
+        if version is None:
+            version = zlib.crc32(text.encode('utf-8')).to_bytes(4, 'big').hex().rjust(16, '0')
+        if not archive.has(bill_id, version):
+            archive.append(bill_id, patient.group(1) if patient else '', version, text)
+            added += 1
+    return added
+
+
+def _describe(entry):
+    return (f"{entry.bill_id:<12} patient {entry.patient_id:<10} version {entry.version}  "
+            f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry.archived_at / 1e9))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch or re-emit archived invoices.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--bill', help="the bill's latest invoice (or --version)")
+    group.add_argument('--patient', help="list the latest invoice of each of the patient's bills")
+    group.add_argument('--stats', action='store_true')
+    group.add_argument('--verify', action='store_true', help="check every archived invoice's checksum")
+    group.add_argument('--import', dest='import_dir', metavar='DIR', help="archive old invoice text files")
+    parser.add_argument('--version', help="a specific version of --bill")
+    parser.add_argument('--history', action='store_true', help="list every version of --bill")
+    parser.add_argument('--out', help="write the invoice to this file instead of printing it")
+    parser.add_argument('--dir', default=INVOICE_ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    archive = InvoiceArchive(args.dir)
+    try:
+        if args.stats:
+            for key, value in archive.stats().items():
+                print(f"{key:>13}: {value:,.2f}" if isinstance(value, float) else f"{key:>13}: {value:,}")
+        elif args.verify:
+            problems = archive.verify()
+            for entry, problem in problems[:50]:
+                print(f"{_describe(entry)}: {problem}")
+            print(f"{len(problems)} damaged invoices." if problems else "Archive is intact.")
+        elif args.import_dir:
+            print(f"Archived {import_files(args.import_dir, archive):,} invoices from {args.import_dir}.")
+        elif args.patient:
+            entries = archive.for_patient(args.patient)
+            for entry in entries:
+                print(_describe(entry))
+            if not entries:
+                print("No archived invoices for this patient.")
+        elif args.history:
+            entries = archive.history(args.bill)
+            for entry in entries:
+                print(_describe(entry))
+            if not entries:
+                print("No archived invoices for this bill.")
+        else:
+            entry = archive.get(args.bill, args.version)
+            if entry is None:
+                print("No such invoice in the archive.")
+                sys.exit(1)
+            if args.out:
+                with open(args.out, 'wb') as f:
+                    f.write(archive.read_bytes(entry))
+                print(f"Invoice {entry.bill_id} ({entry.version}) written to {args.out}")
+            else:
+                print(archive.read(entry))
+    finally:
+        archive.close()
+
+
+if __name__ == "__main__":
+    main()
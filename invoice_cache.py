@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import reference_cache
+from invoice_archive import get_archive
+from patient import patient_cache
+
+# Rendered invoices are content-addressed: each is archived under a version,
+# a hash of everything printed on the invoice (the bill, its billed
+# services, the consultation charge and the patient, doctor and service
+# names), so an unchanged bill maps to the invoice already in the archive
+# (invoice_archive.py) and is not rendered or stored again. On top of that
+# an in-process memo remembers the current version per bill, so a
+# re-request is answered with no queries at all until something on the
+# bill changes (the write paths invalidate it) or INVOICE_CACHE_TTL passes
+# (changes made elsewhere).
+INVOICE_CACHE_SIZE = int(os.environ.get('HMS_INVOICE_CACHE_SIZE', 500))
+INVOICE_CACHE_TTL = float(os.environ.get('HMS_INVOICE_CACHE_TTL', 300))
+
+Invoice = namedtuple('Invoice', 'bill_id patient_id billing_date version')
+
+
+def invoice_version(bill_id, patient_id, billing_date, patient_name, appointment, services):
+    payload = json.dumps([str(bill_id), str(patient_id), str(billing_date), patient_name, appointment, services],
+                         default=str, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+class InvoiceCache:
+    def __init__(self, capacity=INVOICE_CACHE_SIZE, ttl=INVOICE_CACHE_TTL, clock=time.monotonic):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._clock = clock
+        self._invoices = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, bill_id, patient_id, billing_date):
+        # The current Invoice for the bill as given, or None
+        key = str(bill_id)
+        with self._lock:
+            entry = self._invoices.get(key)
+            if entry is not None and entry[0] <= self._clock():
+                del self._invoices[key]
+                self.expirations += 1
+                entry = None
+            invoice = entry[1] if entry is not None else None
+            if (invoice is None or invoice.patient_id != str(patient_id)
+                    or invoice.billing_date != str(billing_date) or not get_archive().has(key, invoice.version)):
+                self.misses += 1
+                return None
+            self._invoices.move_to_end(key)
+            self.hits += 1
+            return invoice
+
+    def put(self, invoice):
+        with self._lock:
+            self._invoices[invoice.bill_id] = (self._clock() + self.ttl, invoice)
+            self._invoices.move_to_end(invoice.bill_id)
+            while len(self._invoices) > self.capacity:
+                self._invoices.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, bill_id=None, session=None):
+        # Again on commit, as reference_cache does
+        if session is not None:
+            session.on_commit(lambda: self.invalidate(bill_id))
+        with self._lock:
+            self.invalidations += 1
+            if bill_id is None:
+                self._invoices.clear()
+            else:
+                self._invoices.pop(str(bill_id), None)
+
+    def invalidate_patient(self, patient_id, session=None):
+        # For changes to a patient or their appointments
+        if session is not None:
+            session.on_commit(lambda: self.invalidate_patient(patient_id))
+        with self._lock:
+            self.invalidations += 1
+            for key in [k for k, (_, inv) in self._invoices.items() if inv.patient_id == str(patient_id)]:
+                del self._invoices[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._invoices),
+                'capacity': self.capacity,
+                'bytes': sum(sys.getsizeof(inv) + sum(sys.getsizeof(v) for v in inv)
+                             for _, inv in self._invoices.values()),
+                'max_bytes': None,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'negative_hits': 0,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
+
+
+invoices = reference_cache.register('invoices', InvoiceCache())
+
+# Names printed on invoices come from these tables
+patient_cache.on_invalidate(lambda key: invoices.invalidate() if key is None else invoices.invalidate_patient(key))
+reference_cache.doctors.on_invalidate(lambda key: invoices.invalidate())
+reference_cache.services.on_invalidate(lambda key: invoices.invalidate())
@@ -0,0 +1,113 @@
+import argparse
+import os
+import re
+
+# Schema changes live in migrations/<backend>/NNN_name.sql and are applied
+# once each, in order, with the applied versions kept in schema_migrations.
+# SQLite databases are migrated automatically on first connect; for MySQL:
+#   python migrate.py            (apply pending)
+#   python migrate.py --status   (list applied / pending)
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+_DELIMITER = re.compile(r'^\s*DELIMITER\s+(\S+)\s*$', re.IGNORECASE)
+
+
+def migration_files(backend):
+    directory = os.path.join(MIGRATIONS_DIR, backend)
+    if not os.path.isdir(directory):
+        return []
+    return [(name[:-4], os.path.join(directory, name))
+            for name in sorted(os.listdir(directory)) if name.endswith('.sql')]
+
+
+def split_statements(sql):
+    # Honours mysql-client style DELIMITER lines so triggers can contain ';'
+    statements, current, delimiter = [], [], ';'
+    for line in sql.splitlines():
+        match = _DELIMITER.match(line)
+        if match:
+            delimiter = match.group(1)
+            continue
+        if line.strip().startswith('--') and not current:
+            continue
+        current.append(line)
+        if line.rstrip().endswith(delimiter):
+            statement = '\n'.join(current).rstrip()[:-len(delimiter)].strip()
+            if statement:
+                statements.append(statement)
+            current = []
+    tail = '\n'.join(current).strip()
+    if tail:
+        statements.append(tail)
+    return statements
+
+
+def _ensure_table(cursor):
+    cursor.execute("CREATE TABLE IF NOT EXISTS schema_migrations (version VARCHAR(100) PRIMARY KEY, "
+                   "applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+
+
+def applied_versions(cursor):
+    _ensure_table(cursor)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def apply_sqlite(raw):
+    # raw: a sqlite3.Connection
+    cursor = raw.cursor()
+    done = applied_versions(cursor)
+    for version, path in migration_files('sqlite'):
+        if version in done:
+            continue
+        with open(path, encoding='utf-8') as f:
+            raw.executescript(f.read())
+        raw.execute("INSERT OR IGNORE INTO schema_migrations (version) VALUES (?)", (version,))
+        raw.commit()
+    cursor.close()
+
+
+def apply_mysql(conn, verbose=True):
+    cursor = conn.cursor()
+    done = applied_versions(cursor)
+    applied = []
+    for version, path in migration_files('mysql'):
+        if version in done:
+            continue
+        with open(path, encoding='utf-8') as f:
+            for statement in split_statements(f.read()):
+                cursor.execute(statement)
+        cursor.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+        conn.commit()
+        applied.append(version)
+        if verbose:
+            print(f"Applied migration {version}")
+    cursor.close()
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations.")
+    parser.add_argument('--status', action='store_true', help="list migrations without applying them")
+    args = parser.parse_args()
+
+    from db_config import DB_BACKEND, get_connection
+    conn = get_connection()
+    try:
+        if args.status:
+            cursor = conn.cursor()
+            done = applied_versions(cursor)
+            cursor.close()
+            for version, _ in migration_files(DB_BACKEND):
+                print(f"{'applied' if version in done else 'pending':8} {version}")
+        elif DB_BACKEND == 'sqlite':
+            print("SQLite databases are migrated automatically on connect.")
+        else:
+            if not apply_mysql(conn):
+                print("Schema is up to date.")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+-- Change log behind delta_export.py: triggers record every insert, update
+-- and delete on the exported tables with a monotonically increasing seq.
+-- InnoDB does not fire triggers for foreign-key cascades, so BEFORE DELETE
+-- triggers on the parent tables log the child rows a cascade will delete
+-- (or SET NULL) on their behalf.
+CREATE TABLE IF NOT EXISTS change_log (
+    seq BIGINT AUTO_INCREMENT PRIMARY KEY,
+    table_name VARCHAR(30) NOT NULL,
+    row_key VARCHAR(20) NOT NULL,
+    op CHAR(1) NOT NULL,
+    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_change_log_table_seq (table_name, seq)
+);
+
+DELIMITER $$
+CREATE TRIGGER billing_change_ins AFTER INSERT ON billing FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op) VALUES ('billing', NEW.bill_id, 'I');
+END$$
+
+CREATE TRIGGER billing_change_upd AFTER UPDATE ON billing FOR EACH ROW
+BEGIN
+    IF OLD.bill_id <> NEW.bill_id THEN
+        INSERT INTO change_log (table_name, row_key, op) VALUES ('billing', OLD.bill_id, 'D');
+    END IF;
+    INSERT INTO change_log (table_name, row_key, op) VALUES ('billing', NEW.bill_id, 'U');
+END$$
+
+CREATE TRIGGER billing_change_del AFTER DELETE ON billing FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op) VALUES ('billing', OLD.bill_id, 'D');
+END$$
+
+CREATE TRIGGER appointments_change_ins AFTER INSERT ON appointments FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op) VALUES ('appointments', NEW.appt_id, 'I');
+END$$
+
+CREATE TRIGGER appointments_change_upd AFTER UPDATE ON appointments FOR EACH ROW
+BEGIN
+    IF OLD.appt_id <> NEW.appt_id THEN
+        INSERT INTO change_log (table_name, row_key, op) VALUES ('appointments', OLD.appt_id, 'D');
+    END IF;
+    INSERT INTO change_log (table_name, row_key, op) VALUES ('appointments', NEW.appt_id, 'U');
+END$$
+
+CREATE TRIGGER appointments_change_del AFTER DELETE ON appointments FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op) VALUES ('appointments', OLD.appt_id, 'D');
+END$$
+
+CREATE TRIGGER billed_services_change_ins AFTER INSERT ON billed_services FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op) VALUES ('billed_services', NEW.id, 'I');
+END$$
+
+CREATE TRIGGER billed_services_change_upd AFTER UPDATE ON billed_services FOR EACH ROW
+BEGIN
+    IF OLD.id <> NEW.id THEN
+        INSERT INTO change_log (table_name, row_key, op) VALUES ('billed_services', OLD.id, 'D');
+    END IF;
+    INSERT INTO change_log (table_name, row_key, op) VALUES ('billed_services', NEW.id, 'U');
+END$$
+
+CREATE TRIGGER billed_services_change_del AFTER DELETE ON billed_services FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op) VALUES ('billed_services', OLD.id, 'D');
+END$$
+
+-- Cascades from patients delete appointments, bills and billed services
+CREATE TRIGGER patients_change_cascade BEFORE DELETE ON patients FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op)
+        SELECT 'appointments', appt_id, 'D' FROM appointments WHERE patient_id = OLD.patient_id;
+    INSERT INTO change_log (table_name, row_key, op)
+        SELECT 'billed_services', id, 'D' FROM billed_services
+        WHERE patient_id = OLD.patient_id
+           OR bill_id IN (SELECT bill_id FROM billing WHERE patient_id = OLD.patient_id);
+    INSERT INTO change_log (table_name, row_key, op)
+        SELECT 'billing', bill_id, 'D' FROM billing WHERE patient_id = OLD.patient_id;
+END$$
+
+-- Deleting a bill cascades to its billed services
+CREATE TRIGGER billing_change_cascade BEFORE DELETE ON billing FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op)
+        SELECT 'billed_services', id, 'D' FROM billed_services WHERE bill_id = OLD.bill_id;
+END$$
+
+-- ON DELETE SET NULL rewrites the referencing rows
+CREATE TRIGGER doctors_change_cascade BEFORE DELETE ON doctors FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op)
+        SELECT 'appointments', appt_id, 'U' FROM appointments WHERE doctor_id = OLD.doctor_id;
+END$$
+
+CREATE TRIGGER services_change_cascade BEFORE DELETE ON services FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op)
+        SELECT 'billed_services', id, 'U' FROM billed_services WHERE service_id = OLD.service_id;
+END$$
+
+DELIMITER ;
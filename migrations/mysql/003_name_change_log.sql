@@ -0,0 +1,44 @@
+-- Feeds name_index.py: patient and doctor inserts, renames and deletes go
+-- to change_log so every process can bring its trigram index up to date.
+-- Updates that leave the name alone are not logged.
+DELIMITER $$
+CREATE TRIGGER patients_change_ins AFTER INSERT ON patients FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op) VALUES ('patients', NEW.patient_id, 'I');
+END$$
+
+CREATE TRIGGER patients_change_upd AFTER UPDATE ON patients FOR EACH ROW
+BEGIN
+    IF OLD.patient_id <> NEW.patient_id THEN
+        INSERT INTO change_log (table_name, row_key, op) VALUES ('patients', OLD.patient_id, 'D');
+    END IF;
+    IF OLD.patient_id <> NEW.patient_id OR NOT (OLD.name <=> NEW.name) THEN
+        INSERT INTO change_log (table_name, row_key, op) VALUES ('patients', NEW.patient_id, 'U');
+    END IF;
+END$$
+
+CREATE TRIGGER patients_change_del AFTER DELETE ON patients FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op) VALUES ('patients', OLD.patient_id, 'D');
+END$$
+
+CREATE TRIGGER doctors_change_ins AFTER INSERT ON doctors FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op) VALUES ('doctors', NEW.doctor_id, 'I');
+END$$
+
+CREATE TRIGGER doctors_change_upd AFTER UPDATE ON doctors FOR EACH ROW
+BEGIN
+    IF OLD.doctor_id <> NEW.doctor_id THEN
+        INSERT INTO change_log (table_name, row_key, op) VALUES ('doctors', OLD.doctor_id, 'D');
+    END IF;
+    IF OLD.doctor_id <> NEW.doctor_id OR NOT (OLD.name <=> NEW.name) THEN
+        INSERT INTO change_log (table_name, row_key, op) VALUES ('doctors', NEW.doctor_id, 'U');
+    END IF;
+END$$
+
+CREATE TRIGGER doctors_change_del AFTER DELETE ON doctors FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op) VALUES ('doctors', OLD.doctor_id, 'D');
+END$$
+DELIMITER ;
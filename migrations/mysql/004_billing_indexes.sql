@@ -0,0 +1,3 @@
+-- Bill finalization totals, copies and clears a patient's cart by
+-- (patient_id, id); without this index each step scans the whole table.
+CREATE INDEX idx_temp_service_usage_patient ON temp_service_usage (patient_id, id);
@@ -0,0 +1,51 @@
+-- Daily revenue and visit rollups behind rollups.py, kept current by the
+-- Bill and Appointment writes; '' stands for a deleted service or doctor.
+CREATE TABLE IF NOT EXISTS daily_revenue (
+    day DATE PRIMARY KEY,
+    bills INT NOT NULL DEFAULT 0,
+    billed_amount DECIMAL(14,2) NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS daily_service_revenue (
+    day DATE NOT NULL,
+    service_id VARCHAR(10) NOT NULL,
+    line_count INT NOT NULL DEFAULT 0,
+    revenue DECIMAL(14,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, service_id)
+);
+
+CREATE TABLE IF NOT EXISTS daily_doctor_revenue (
+    day DATE NOT NULL,
+    doctor_id VARCHAR(10) NOT NULL,
+    visits INT NOT NULL DEFAULT 0,
+    consulting DECIMAL(14,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, doctor_id)
+);
+
+CREATE TABLE IF NOT EXISTS daily_visits (
+    day DATE PRIMARY KEY,
+    visits INT NOT NULL DEFAULT 0,
+    consulting DECIMAL(14,2) NOT NULL DEFAULT 0
+);
+
+-- Backfill from the existing rows
+INSERT INTO daily_revenue (day, bills, billed_amount)
+SELECT billing_date, COUNT(*), COALESCE(SUM(total_amount), 0)
+FROM billing WHERE billing_date IS NOT NULL
+GROUP BY billing_date;
+
+INSERT INTO daily_service_revenue (day, service_id, line_count, revenue)
+SELECT b.billing_date, COALESCE(bs.service_id, ''), COUNT(*), COALESCE(SUM(bs.cost), 0)
+FROM billed_services bs JOIN billing b ON b.bill_id = bs.bill_id
+WHERE b.billing_date IS NOT NULL
+GROUP BY b.billing_date, COALESCE(bs.service_id, '');
+
+INSERT INTO daily_doctor_revenue (day, doctor_id, visits, consulting)
+SELECT date, COALESCE(doctor_id, ''), COUNT(*), COALESCE(SUM(consulting_charge), 0)
+FROM appointments WHERE date IS NOT NULL
+GROUP BY date, COALESCE(doctor_id, '');
+
+INSERT INTO daily_visits (day, visits, consulting)
+SELECT date, COUNT(*), COALESCE(SUM(consulting_charge), 0)
+FROM appointments WHERE date IS NOT NULL
+GROUP BY date;
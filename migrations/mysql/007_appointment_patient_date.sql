@@ -0,0 +1,4 @@
+-- A patient's appointments in date order: visit gaps (one pass over every
+-- patient, or one patient at a time) and the latest appointment on
+-- invoices read them sorted by date without a filesort.
+CREATE INDEX idx_appointments_patient_date ON appointments (patient_id, date);
@@ -0,0 +1,12 @@
+-- Hand port of the SQLite advice in migrations/sqlite/008_workload_indexes.sql
+-- (index_advisor.py on the workload of benchmarks/bench_index_advisor.py).
+-- Not measured on MySQL; run index_advisor.py --measure against MySQL for
+-- numbers. Online DDL: InnoDB builds each index in place without blocking
+-- reads or writes. billing (patient_id) is left out: InnoDB already indexes
+-- the foreign key.
+
+-- Appointment.filter_appointments: appointments WHERE date BETWEEN ? AND ?
+ALTER TABLE appointments ADD INDEX idx_appointments_date (date), ALGORITHM=INPLACE, LOCK=NONE;
+
+-- batch_invoices: billing WHERE billing_date BETWEEN ? AND ?
+ALTER TABLE billing ADD INDEX idx_billing_billing_date (billing_date), ALGORITHM=INPLACE, LOCK=NONE;
@@ -0,0 +1,5 @@
+-- Hi/lo sequences used by id_allocator.py; one row per entity prefix
+CREATE TABLE IF NOT EXISTS id_sequences (
+    name VARCHAR(20) PRIMARY KEY,
+    next_value BIGINT NOT NULL
+);
@@ -0,0 +1,61 @@
+-- Change log behind delta_export.py: triggers record every insert, update
+-- and delete on the exported tables with a monotonically increasing seq.
+-- SQLite fires triggers for foreign-key cascades, so cascaded deletes and
+-- SET NULL updates are captured by the child tables' own triggers.
+CREATE TABLE IF NOT EXISTS change_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name VARCHAR(30) NOT NULL,
+    row_key VARCHAR(20) NOT NULL,
+    op CHAR(1) NOT NULL,
+    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_change_log_table_seq ON change_log (table_name, seq);
+
+CREATE TRIGGER IF NOT EXISTS billing_change_ins AFTER INSERT ON billing FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op) VALUES ('billing', NEW.bill_id, 'I');
+END;
+
+CREATE TRIGGER IF NOT EXISTS billing_change_upd AFTER UPDATE ON billing FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op) SELECT 'billing', OLD.bill_id, 'D' WHERE OLD.bill_id <> NEW.bill_id;
+    INSERT INTO change_log (table_name, row_key, op) VALUES ('billing', NEW.bill_id, 'U');
+END;
+
+CREATE TRIGGER IF NOT EXISTS billing_change_del AFTER DELETE ON billing FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op) VALUES ('billing', OLD.bill_id, 'D');
+END;
+
+CREATE TRIGGER IF NOT EXISTS appointments_change_ins AFTER INSERT ON appointments FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op) VALUES ('appointments', NEW.appt_id, 'I');
+END;
+
+CREATE TRIGGER IF NOT EXISTS appointments_change_upd AFTER UPDATE ON appointments FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op) SELECT 'appointments', OLD.appt_id, 'D' WHERE OLD.appt_id <> NEW.appt_id;
+    INSERT INTO change_log (table_name, row_key, op) VALUES ('appointments', NEW.appt_id, 'U');
+END;
+
+CREATE TRIGGER IF NOT EXISTS appointments_change_del AFTER DELETE ON appointments FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op) VALUES ('appointments', OLD.appt_id, 'D');
+END;
+
+CREATE TRIGGER IF NOT EXISTS billed_services_change_ins AFTER INSERT ON billed_services FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op) VALUES ('billed_services', NEW.id, 'I');
+END;
+
+CREATE TRIGGER IF NOT EXISTS billed_services_change_upd AFTER UPDATE ON billed_services FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op) SELECT 'billed_services', OLD.id, 'D' WHERE OLD.id <> NEW.id;
+    INSERT INTO change_log (table_name, row_key, op) VALUES ('billed_services', NEW.id, 'U');
+END;
+
+CREATE TRIGGER IF NOT EXISTS billed_services_change_del AFTER DELETE ON billed_services FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op) VALUES ('billed_services', OLD.id, 'D');
+END;
@@ -0,0 +1,36 @@
+-- Feeds name_index.py: patient and doctor inserts, renames and deletes go
+-- to change_log so every process can bring its trigram index up to date.
+-- Updates that leave the name alone are not logged.
+CREATE TRIGGER IF NOT EXISTS patients_change_ins AFTER INSERT ON patients FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op) VALUES ('patients', NEW.patient_id, 'I');
+END;
+
+CREATE TRIGGER IF NOT EXISTS patients_change_upd AFTER UPDATE OF patient_id, name ON patients FOR EACH ROW
+WHEN OLD.patient_id <> NEW.patient_id OR OLD.name IS NOT NEW.name
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op) SELECT 'patients', OLD.patient_id, 'D' WHERE OLD.patient_id <> NEW.patient_id;
+    INSERT INTO change_log (table_name, row_key, op) VALUES ('patients', NEW.patient_id, 'U');
+END;
+
+CREATE TRIGGER IF NOT EXISTS patients_change_del AFTER DELETE ON patients FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op) VALUES ('patients', OLD.patient_id, 'D');
+END;
+
+CREATE TRIGGER IF NOT EXISTS doctors_change_ins AFTER INSERT ON doctors FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op) VALUES ('doctors', NEW.doctor_id, 'I');
+END;
+
+CREATE TRIGGER IF NOT EXISTS doctors_change_upd AFTER UPDATE OF doctor_id, name ON doctors FOR EACH ROW
+WHEN OLD.doctor_id <> NEW.doctor_id OR OLD.name IS NOT NEW.name
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op) SELECT 'doctors', OLD.doctor_id, 'D' WHERE OLD.doctor_id <> NEW.doctor_id;
+    INSERT INTO change_log (table_name, row_key, op) VALUES ('doctors', NEW.doctor_id, 'U');
+END;
+
+CREATE TRIGGER IF NOT EXISTS doctors_change_del AFTER DELETE ON doctors FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, row_key, op) VALUES ('doctors', OLD.doctor_id, 'D');
+END;
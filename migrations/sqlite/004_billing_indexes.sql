@@ -0,0 +1,7 @@
+-- Bill finalization totals, copies and clears a patient's cart by
+-- (patient_id, id); without this index each step scans the whole table.
+CREATE INDEX IF NOT EXISTS idx_temp_service_usage_patient ON temp_service_usage (patient_id, id);
+
+-- Bill totals and invoices read a bill's lines. InnoDB indexes foreign keys
+-- on its own; SQLite does not.
+CREATE INDEX IF NOT EXISTS idx_billed_services_bill ON billed_services (bill_id, id);
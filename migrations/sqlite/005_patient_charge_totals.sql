@@ -0,0 +1,8 @@
+-- Running per-patient charges behind charge_totals.py (HMS_CHARGE_TOTALS=1):
+-- cart services and consulting charges, adjusted by every write that
+-- changes them. A missing row means no charges.
+CREATE TABLE IF NOT EXISTS patient_charge_totals (
+    patient_id INTEGER PRIMARY KEY,
+    service_total DECIMAL(12,2) NOT NULL DEFAULT 0,
+    consulting_total DECIMAL(12,2) NOT NULL DEFAULT 0
+);
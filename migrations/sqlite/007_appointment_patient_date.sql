@@ -0,0 +1,5 @@
+-- A patient's appointments in date order: visit gaps (one pass over every
+-- patient, or one patient at a time), the latest appointment on invoices
+-- and the per-patient charge totals. SQLite does not index the foreign key
+-- on its own, so without this each lookup scans the table.
+CREATE INDEX IF NOT EXISTS idx_appointments_patient_date ON appointments (patient_id, date);
@@ -0,0 +1,16 @@
+-- Suggested by index_advisor.py on 2026-10-18 from the recorded workload
+-- of benchmarks/bench_index_advisor.py (200,000 appointments and bills).
+-- SQLite builds each index in one write transaction; readers carry on in WAL mode.
+
+-- 20x SELECT bill_id, billing_date FROM billing WHERE patient_id=?
+-- measured: 23.78 ms -> 0.02 ms
+CREATE INDEX IF NOT EXISTS idx_billing_patient_id ON billing (patient_id);
+
+-- 5x SELECT * FROM appointments WHERE date BETWEEN ? and ?
+-- measured: 36.27 ms -> 3.03 ms
+CREATE INDEX IF NOT EXISTS idx_appointments_date ON appointments (date);
+
+-- 1x SELECT b.bill_id, b.patient_id, b.billing_date, p.name FROM billing b LEFT JOIN patients p ON p.patient_id = b
+-- 1x SELECT a.patient_id, d.name, d.specialization, a.consulting_charge FROM ( SELECT patient_id, doctor_id, consul
+-- measured: 85.28 ms -> 10.70 ms
+CREATE INDEX IF NOT EXISTS idx_billing_billing_date ON billing (billing_date);
@@ -0,0 +1,440 @@
+import argparse
+import atexit
+import datetime
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+import db_config
+from db_config import get_connection
+from delta_export import DELTA_GAP_TIMEOUT, KEY_BATCH, safe_high_water
+
+# In-process trigram index over patient and doctor names, replacing the
+# LIKE '%x%' scans of search_by_name. The index has two levels: each
+# distinct word, padded as "  word ", is split into its 3-character slices
+# with a posting set per trigram listing the words containing it, and each
+# word lists the names it appears in. A query word is matched against the
+# vocabulary by the share of its trigrams a word contains, so "smth" still
+# finds "smith" and "jo" finds "john"; a name scores the average of its best
+# match for each query word. The vocabulary is far smaller than the table,
+# so trigram postings stay short at a million names.
+# The index is saved as JSON to name_index_<table>.json in NAME_INDEX_DIR
+# and reloaded at startup; its change_log mark also goes to
+# name_index_<table>.mark, below which delta_export.py --prune drops the
+# name tables' change_log rows.
+# Writes made here update it directly; writes by other processes reach it
+# through change_log (migration 003), replayed before each search.
+#   python name_index.py --rebuild
+#   python name_index.py --table doctors --search "jon smth"
+NAME_INDEX_DIR = os.environ.get('HMS_NAME_INDEX_DIR', os.path.join("output", "name_index"))
+NAME_SEARCH_LIMIT = int(os.environ.get('HMS_NAME_SEARCH_LIMIT', 20))
+# Share of a query word's trigrams a word must contain to count as a match
+NAME_MATCH_THRESHOLD = float(os.environ.get('HMS_NAME_MATCH_THRESHOLD', 0.3))
+# Vocabulary words considered per query word, best first
+WORD_MATCHES = 50
+INDEX_VERSION = 3
+
+# table: key column
+NAME_TABLES = {
+    'patients': 'patient_id',
+    'doctors': 'doctor_id',
+}
+
+_WORD = re.compile(r'[^\W_]+')
+
+
+def words(text):
+    return list(dict.fromkeys(_WORD.findall(str(text or '').lower())))
+
+
+def trigrams(word):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _source():
+    # Identifies the database an index file was built from
+    if db_config.DB_BACKEND == 'sqlite':
+        return ('sqlite', os.path.abspath(db_config.SQLITE_PATH))
+    return ('mysql', db_config.DB_CONFIG['host'], db_config.DB_CONFIG['database'])
+
+
+class TrigramIndex:
+    # Names live in slots and words in word ids; freed slots and ids are
+    # reused by later adds.
+    #   grams:      trigram -> {word id}
+    #   word_names: word id -> {slot}
+    #   name_words: slot -> (word id, ...)
+    def __init__(self, table):
+        self.table = table
+        self.key_column = NAME_TABLES[table]
+        self.keys = []
+        self.names = []
+        self.name_words = []
+        self.slots = {}
+        self.free = []
+        self.vocab = {}
+        self.word_list = []
+        self.word_sizes = []
+        self.word_names = []
+        self.free_words = []
+        self.grams = {}
+        self.mark = 0
+        self.dirty = False
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.slots)
+
+    def _word_id(self, word):
+        wid = self.vocab.get(word)
+        if wid is not None:
+            return wid
+        grams = trigrams(word)
+        if self.free_words:
+            wid = self.free_words.pop()
+            self.word_list[wid], self.word_sizes[wid], self.word_names[wid] = word, len(grams), set()
+        else:
+            wid = len(self.word_list)
+            self.word_list.append(word)
+            self.word_sizes.append(len(grams))
+            self.word_names.append(set())
+        self.vocab[word] = wid
+        for gram in grams:
+            entry = self.grams.get(gram)
+            if entry is None:
+                self.grams[gram] = {wid}
+            else:
+                entry.add(wid)
+        return wid
+
+    def _drop_word(self, wid):
+        word = self.word_list[wid]
+        for gram in trigrams(word):
+            entry = self.grams[gram]
+            entry.discard(wid)
+            if not entry:
+                del self.grams[gram]
+        del self.vocab[word]
+        self.word_list[wid] = self.word_names[wid] = None
+        self.free_words.append(wid)
+
+    def add(self, key, name):
+        key = str(key)
+        with self.lock:
+            self.remove(key)
+            wids = tuple(self._word_id(w) for w in words(name))
+            if self.free:
+                slot = self.free.pop()
+                self.keys[slot], self.names[slot], self.name_words[slot] = key, name, wids
+            else:
+                slot = len(self.keys)
+                self.keys.append(key)
+                self.names.append(name)
+                self.name_words.append(wids)
+            self.slots[key] = slot
+            for wid in wids:
+                self.word_names[wid].add(slot)
+            self.dirty = True
+
+    def remove(self, key):
+        key = str(key)
+        with self.lock:
+            slot = self.slots.pop(key, None)
+            if slot is None:
+                return
+            for wid in self.name_words[slot]:
+                holders = self.word_names[wid]
+                holders.discard(slot)
+                if not holders:
+                    self._drop_word(wid)
+            self.keys[slot] = self.names[slot] = None
+            self.name_words[slot] = ()
+            self.free.append(slot)
+            self.dirty = True
+
+    def match_words(self, word, threshold=NAME_MATCH_THRESHOLD):
+        # [(share, word id)] for the vocabulary words closest to `word`
+        grams = trigrams(word)
+        wanted = len(grams)
+        need = max(1, math.ceil(threshold * wanted))
+        hits = Counter()
+        for gram in grams:
+            hits.update(self.grams.get(gram, ()))
+        sizes = self.word_sizes
+        scored = [(n / wanted, n / (wanted + sizes[wid] - n), wid) for wid, n in hits.items() if n >= need]
+        return [(share, wid) for share, _, wid in heapq.nlargest(WORD_MATCHES, scored)]
+
+    def search(self, query, limit=NAME_SEARCH_LIMIT, threshold=NAME_MATCH_THRESHOLD):
+        # Returns [(key, name, similarity)], best first. Names matching more
+        # of the query words come first: each matched word adds the number of
+        # query words plus its share, so no amount of share makes up for a
+        # missing word.
+        query_words = words(query)
+        if not query_words:
+            return []
+        count = len(query_words)
+        with self.lock:
+            bests = []
+            for word in query_words:
+                # Best match first, so a name keeps its best share for this word
+                best = {}
+                for share, wid in self.match_words(word, threshold):
+                    holders = self.word_names[wid]
+                    best.update(dict.fromkeys(holders.difference(best) if best else holders, count + share))
+                bests.append(best)
+            bests.sort(key=len)
+            common = set(bests[0]).intersection(*bests[1:]) if count > 1 else bests[0].keys()
+            if count > 1 and len(common) >= limit:
+                # Enough names match every word; the rest cannot rank
+                totals = {slot: sum(best[slot] for best in bests) for slot in common}
+            else:
+                totals = dict(bests[-1])
+                for best in bests[:-1]:
+                    for slot, value in best.items():
+                        totals[slot] = totals.get(slot, 0) + value
+            # Ties go to the name with the fewest extra words
+            name_words = self.name_words
+            top = heapq.nlargest(limit * 2, totals, key=totals.get)
+            top.sort(key=lambda slot: (totals[slot], -len(name_words[slot])), reverse=True)
+            results = []
+            for slot in top[:limit]:
+                matched = sum(slot in best for best in bests)
+                results.append((self.keys[slot], self.names[slot], round((totals[slot] - matched * count) / count, 3)))
+            return results
+
+    @classmethod
+    def build(cls, table, session=None):
+        index = cls(table)
+        conn = get_connection(session)
+        cursor = conn.cursor()
+        try:
+            # Changes newer than the gap timeout may belong to transactions
+            # this read cannot see yet; the first sync replays them
+            cursor.execute("SELECT CURRENT_TIMESTAMP")
+            now = cursor.fetchone()[0]
+            cursor.execute("SELECT MAX(seq) FROM change_log WHERE changed_at < %s",
+                           (_seconds_before(now, DELTA_GAP_TIMEOUT),))
+            index.mark = cursor.fetchone()[0] or 0
+            cursor.close()
+            cursor = conn.cursor(buffered=False)
+            cursor.execute(f"SELECT {index.key_column}, name FROM {table}")
+            while True:
+                rows = cursor.fetchmany(5000)
+                if not rows:
+                    break
+                for key, name in rows:
+                    index.add(key, name)
+        finally:
+            cursor.close()
+            conn.close()
+        return index
+
+    def sync(self, session=None):
+        # Applies the inserts, renames and deletes logged since the mark
+        conn = get_connection(session)
+        cursor = conn.cursor()
+        try:
+            with self.lock:
+                high = safe_high_water(cursor, self.mark)
+                if high <= self.mark:
+                    return 0
+                cursor.execute("SELECT DISTINCT row_key FROM change_log WHERE table_name = %s AND seq > %s AND seq <= %s",
+                               (self.table, self.mark, high))
+                changed = [row[0] for row in cursor.fetchall()]
+                for i in range(0, len(changed), KEY_BATCH):
+                    batch = changed[i:i + KEY_BATCH]
+                    cursor.execute(f"SELECT {self.key_column}, name FROM {self.table} "
+                                   f"WHERE {self.key_column} IN ({', '.join(['%s'] * len(batch))})", tuple(batch))
+                    present = {str(key): name for key, name in cursor.fetchall()}
+                    for key in batch:
+                        if key in present:
+                            self.add(key, present[key])
+                        else:
+                            self.remove(key)
+                self.mark = high
+                self.dirty = True
+                return len(changed)
+        finally:
+            cursor.close()
+            conn.close()
+
+    def save(self, path):
+        with self.lock:
+            state = {
+                'version': INDEX_VERSION,
+                'source': _source(),
+                'table': self.table,
+                'mark': self.mark,
+                'keys': self.keys,
+                'names': self.names,
+                'name_words': self.name_words,
+                'word_list': self.word_list,
+                'word_sizes': self.word_sizes,
+                'word_names': [None if s is None else list(s) for s in self.word_names],
+                'grams': {gram: list(wids) for gram, wids in self.grams.items()},
+            }
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            tmp = path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(state, f, separators=(',', ':'))
+            os.replace(tmp, path)
+            # The mark alone, for delta_export.py --prune to read cheaply
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'source': _source(), 'mark': self.mark}, f)
+            os.replace(tmp, os.path.splitext(path)[0] + '.mark')
+            self.dirty = False
+
+    @classmethod
+    def load(cls, table, path):
+        # None when the file is missing, unreadable or from another database
+        try:
+            with open(path, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (not isinstance(state, dict) or state.get('version') != INDEX_VERSION
+                or state.get('table') != table or state.get('source') != list(_source())):
+            return None
+        index = cls(table)
+        try:
+            for field in ('mark', 'keys', 'names', 'word_list', 'word_sizes'):
+                setattr(index, field, state[field])
+            index.name_words = [tuple(wids) for wids in state['name_words']]
+            index.word_names = [None if s is None else set(s) for s in state['word_names']]
+            index.grams = {gram: set(wids) for gram, wids in state['grams'].items()}
+        except (KeyError, TypeError, AttributeError):
+            return None
+        index.slots = {key: slot for slot, key in enumerate(index.keys) if key is not None}
+        index.free = [slot for slot, key in enumerate(index.keys) if key is None]
+        index.vocab = {word: wid for wid, word in enumerate(index.word_list) if word is not None}
+        index.free_words = [wid for wid, word in enumerate(index.word_list) if word is None]
+        return index
+
+
+def _seconds_before(value, seconds):
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime.fromisoformat(str(value))
+    return (value - datetime.timedelta(seconds=seconds)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def index_path(table):
+    return os.path.join(NAME_INDEX_DIR, f"name_index_{table}.json")
+
+
+def mark_path(table):
+    return os.path.join(NAME_INDEX_DIR, f"name_index_{table}.mark")
+
+
+def saved_marks():
+    # {table: change_log seq} of the saved indexes built from this database;
+    # their change_log rows up to the mark are no longer needed
+    marks = {}
+    for table in NAME_TABLES:
+        try:
+            with open(mark_path(table), encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if isinstance(state, dict) and state.get('source') == list(_source()):
+            marks[table] = state['mark']
+    return marks
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _out_of_step(index):
+    # A count that disagrees after a sync means changes were missed (or the
+    # database was recreated under the same name)
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT COUNT(*) FROM {index.table}")
+        return len(index) != cursor.fetchone()[0]
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def get_index(table, rebuild=False):
+    with _indexes_lock:
+        index = None if rebuild else _indexes.get(table)
+        if index is None:
+            path = index_path(table)
+            index = None if rebuild else TrigramIndex.load(table, path)
+            if index is not None:
+                index.sync()
+            if index is None or _out_of_step(index):
+                index = TrigramIndex.build(table)
+            if index.dirty:
+                index.save(path)
+            _indexes[table] = index
+    return index
+
+
+def warm():
+    # Loads (or builds) every index; meant for a background thread at startup
+    for table in NAME_TABLES:
+        try:
+            get_index(table)
+        except Exception as e:
+            print(f"Name index for {table} unavailable:", e)
+
+
+def search(table, query, limit=NAME_SEARCH_LIMIT, threshold=NAME_MATCH_THRESHOLD):
+    index = get_index(table)
+    index.sync()
+    return index.search(query, limit, threshold)
+
+
+def record(table, key, name=None):
+    # Called after a committed add/update (name given) or delete (name None).
+    # Indexes not loaded yet pick the change up from change_log instead.
+    index = _indexes.get(table)
+    if index is None:
+        return
+    if name is None:
+        index.remove(key)
+    else:
+        index.add(key, name)
+
+
+def save_all():
+    for table, index in list(_indexes.items()):
+        if index.dirty:
+            try:
+                index.save(index_path(table))
+            except OSError as e:
+                print(f"Could not save the {table} name index:", e)
+
+
+atexit.register(save_all)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trigram name index for patient and doctor search.")
+    parser.add_argument('--table', choices=list(NAME_TABLES), default='patients')
+    parser.add_argument('--rebuild', action='store_true', help="rebuild the index files from the database")
+    parser.add_argument('--search', metavar='NAME')
+    parser.add_argument('--limit', type=int, default=NAME_SEARCH_LIMIT)
+    args = parser.parse_args()
+
+    if args.rebuild:
+        for table in NAME_TABLES:
+            start = time.perf_counter()
+            index = get_index(table, rebuild=True)
+            print(f"{table}: {len(index)} names indexed in {time.perf_counter() - start:.2f}s")
+    if args.search is not None:
+        for key, name, similarity in search(args.table, args.search, args.limit):
+            print(f"{similarity:.3f}  {key} | {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import os
+
+from db_config import get_connection
+
+# Keyset (seek) pagination for the listings. Each page is one indexed range
+# scan continuing after the last row of the previous page,
+#   WHERE (sort > last_sort OR (sort = last_sort AND key > last_key))
+#   ORDER BY sort, key LIMIT n
+# so page 10,000 costs the same as page 1, and each page runs on its own
+# pooled connection, so nothing is held open while a user reads a page.
+# Rows whose sort column is NULL cannot be compared; they come last, paged
+# on the key alone.
+PAGE_SIZE = int(os.environ.get('HMS_PAGE_SIZE', 20))
+# Page size for non-interactive listings that stream every row
+BATCH_PAGE_SIZE = int(os.environ.get('HMS_BATCH_PAGE_SIZE', 1000))
+
+# table: (primary key, listed columns in SELECT * order)
+LISTINGS = {
+    'patients': ('patient_id', ['patient_id', 'name', 'age', 'gender', 'admission_date', 'contact_no']),
+    'doctors': ('doctor_id', ['doctor_id', 'name', 'specialization', 'contact_no']),
+    'services': ('service_id', ['service_id', 'service_name', 'cost']),
+    'appointments': ('appt_id', ['appt_id', 'patient_id', 'doctor_id', 'date', 'diagnosis', 'consulting_charge']),
+    'billing': ('bill_id', ['bill_id', 'patient_id', 'total_amount', 'billing_date']),
+}
+
+FILTER_OPERATORS = {'=', '!=', '<', '<=', '>', '>=', 'LIKE'}
+
+
+def _where(columns, filters):
+    # filters: {column: value} for equality, or (column, operator, value) tuples
+    if isinstance(filters, dict):
+        filters = [(column, '=', value) for column, value in filters.items()]
+    clauses, params = [], []
+    for column, op, value in filters or ():
+        op = op.upper()
+        if column not in columns:
+            raise ValueError(f"Unknown column '{column}'.")
+        if op not in FILTER_OPERATORS:
+            raise ValueError(f"Unsupported filter operator '{op}'.")
+        if value is None:
+            if op not in ('=', '!='):
+                raise ValueError("NULL can only be compared with = or !=.")
+            clauses.append(f"{column} IS {'NOT ' if op == '!=' else ''}NULL")
+        else:
+            clauses.append(f"{column} {op} %s")
+            params.append(value)
+    return clauses, params
+
+
+def iter_pages(table, page_size=PAGE_SIZE, filters=None, sort=None, descending=False, session=None):
+    key, columns = LISTINGS[table]
+    sort = sort or key
+    if sort not in columns:
+        raise ValueError(f"Cannot sort {table} by '{sort}'.")
+    if page_size < 1:
+        raise ValueError("Page size must be at least 1.")
+    base_clauses, base_params = _where(columns, filters)
+    after, direction = ('<', 'DESC') if descending else ('>', 'ASC')
+    select = f"SELECT {', '.join(columns)} FROM {table}"
+    sort_index, key_index = columns.index(sort), columns.index(key)
+
+    # Phase 1 pages on (sort, key) over non-NULL sort values; phase 2 pages on
+    # the key over the NULLs. With sort == key there is only phase 1.
+    phases = [(sort, True)] if sort == key else [(sort, True), (sort, False)]
+    for column, not_null in phases:
+        last = None
+        while True:
+            clauses, params = list(base_clauses), list(base_params)
+            if sort != key:
+                clauses.append(f"{column} IS {'NOT ' if not_null else ''}NULL")
+            if last is not None:
+                if sort != key and not_null:
+                    clauses.append(f"({sort} {after} %s OR ({sort} = %s AND {key} {after} %s))")
+                    params += [last[sort_index], last[sort_index], last[key_index]]
+                else:
+                    clauses.append(f"{key} {after} %s")
+                    params.append(last[key_index])
+            order = f"{sort} {direction}, {key} {direction}" if sort != key and not_null else f"{key} {direction}"
+            sql = select + (" WHERE " + " AND ".join(clauses) if clauses else "") + f" ORDER BY {order} LIMIT %s"
+            params.append(page_size)
+
+            conn = get_connection(session)
+            cursor = conn.cursor()
+            try:
+                cursor.execute(sql, tuple(params))
+                page = cursor.fetchall()
+            finally:
+                cursor.close()
+                conn.close()
+            if page:
+                yield page
+            if len(page) < page_size:
+                break
+            last = page[-1]
+
+
+def iter_rows(table, page_size=PAGE_SIZE, filters=None, sort=None, descending=False, session=None):
+    for page in iter_pages(table, page_size, filters, sort, descending, session):
+        yield from page
@@ -1,24 +1,37 @@
 from db_config import get_connection
-from datetime import datetime, date
+from datetime import date
+from id_allocator import next_id
+import name_index
+import pagination
+import reference_cache
+import rollups
+import scheduling
 from person import Person
-import re
+from validation import PATIENT_SCHEMA
 import mysql.connector
 from mysql.connector import IntegrityError, Error
+import os
+
+# Patients looked up during one desk interaction (edit, days admitted,
+# invoice header) come from an LRU cache bounded by entry count and memory;
+# unknown IDs are remembered briefly so repeated typos skip the table.
+# Deleting a patient cascades to their appointments and bills: caches of
+# data derived from those register with patient_cache.on_invalidate().
+PATIENT_CACHE_SIZE = int(os.environ.get('HMS_PATIENT_CACHE_SIZE', 10000))
+PATIENT_CACHE_MB = float(os.environ.get('HMS_PATIENT_CACHE_MB', 16))
+PATIENT_CACHE_TTL = float(os.environ.get('HMS_PATIENT_CACHE_TTL', 60))
+PATIENT_NEGATIVE_TTL = float(os.environ.get('HMS_PATIENT_NEGATIVE_TTL', 30))
+
+patient_cache = reference_cache.register('patients', reference_cache.ReadThroughCache(
+    'patients', 'patient_id', capacity=PATIENT_CACHE_SIZE, ttl=PATIENT_CACHE_TTL,
+    max_bytes=int(PATIENT_CACHE_MB * 1024 * 1024), negative_ttl=PATIENT_NEGATIVE_TTL))
 
 def auto_patient_id():
-    from db_config import get_connection
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT MAX(patient_id) FROM patients")
-    row = cursor.fetchone()
-    cursor.close()
-    conn.close()
-    max_id = row[0]
-    if max_id is None:
-        return 1001
-    return int(max_id) + 1
+    return next_id('patient')
 
 class Patient(Person):
+    VIEW_HEADER = "Patient ID | Name | Age | Gender | Admission Date | Contact Number"
+
     def __init__(self, patient_id, name, age, gender, admission_date, contact_no):
         super().__init__(patient_id, name, contact_no)
         self.patient_id = patient_id
@@ -28,40 +41,25 @@ class Patient(Person):
     
     # CRUD Operations
     
-    def add(self):
-        # Name Validation
-        if not self.name or not re.match(r'^[A-Za-z. ]+$', self.name):              
-            print("Invalid Name.")
-            return False
-        # Age validation
-        try:
-            age = int(self.age)
-            if age < 0 or age > 120:
-                print("Invalid Age. Must be between 0 and 120.")
-                return False
-        except ValueError:
-            print("Invalid Age. Must be a number.")
-            return False
-        # Gender validation
-        if self.gender not in ['M', 'F', 'Other']:
-            print("Invalid Gender. Choose from M, F, Other.")
-            return False
-        # Admission date validation
-        if not re.match(r'^\d{4}-\d{2}-\d{2}$', self.admission_date):
-            print("Invalid Admission Date. Use YYYY-MM-DD format.")
-            return False
-        # Contact number validation
-        if not self.contact_no.isdigit() or len(self.contact_no) < 10:
-            print("Invalid Contact Number. Must be at least 10 digits.")
+    def add(self, session=None):
+        values, errors = PATIENT_SCHEMA.validate(self)
+        if errors:
+            print(errors[0].message)
             return False
+        age = values['age']
 
         # Insertion into DB with exception handling 
         try:
-            conn = get_connection()
+            conn = get_connection(session)
             cursor = conn.cursor()
             sql = "INSERT INTO patients (patient_id, name, age, gender, admission_date, contact_no) VALUES (%s, %s, %s, %s, %s, %s)"
             cursor.execute(sql, (self.patient_id, self.name, age, self.gender, self.admission_date, self.contact_no))
             conn.commit()
+            # Inside a session the change reaches the index through change_log
+            if session is None:
+                name_index.record('patients', self.patient_id, self.name)
+            # Forget an earlier "not found" for this ID
+            patient_cache.invalidate(self.patient_id, session)
             return True
         except mysql.connector.errors.IntegrityError as e:
             if "PRIMARY" in str(e):
@@ -76,41 +74,17 @@ class Patient(Person):
             if 'cursor' in locals(): cursor.close()
             if 'conn' in locals(): conn.close()
 
-    def update(self):
-        # Name validation
-        if not self.name or not re.match(r'^[A-Za-z. ]+$', self.name):
-            print("Invalid Name.")
-            return False
-        # Age validation
-        try:
-            age = int(self.age)
-            if age < 0 or age > 120:
-                print("Invalid Age. Must be between 0 and 120.")
-                return False
-        except ValueError:
-            print("Invalid Age.")
-            return False
-        # Gender validation
-        if self.gender not in ['M', 'F', 'Other']:
-            print("Invalid Gender. Choose from M, F, Other.")
-            return False
-        # Admission date validation
-        try:
-            if isinstance(self.admission_date, date):
-                self.admission_date = self.admission_date.strftime("%Y-%m-%d")
-            else:
-                datetime.strptime(self.admission_date, "%Y-%m-%d")
-        except ValueError:
-            print("Invalid Admission Date. Use YYYY-MM-DD format.")
-            return False
-        # Contact number validation
-        if not self.contact_no.isdigit() or len(self.contact_no) < 10:
-            print("Invalid Contact Number. Must be at least 10 digits.")
+    def update(self, session=None):
+        values, errors = PATIENT_SCHEMA.validate(self)
+        if errors:
+            print(errors[0].message)
             return False
+        age = values['age']
+        self.admission_date = values['admission_date']
         
         # Updating in the DB with exception handling
         try:
-            conn = get_connection()
+            conn = get_connection(session)
             cursor = conn.cursor()
             sql = "UPDATE patients SET name=%s, age=%s, gender=%s, admission_date=%s, contact_no=%s WHERE patient_id=%s"
             cursor.execute(sql, (self.name, age, self.gender, self.admission_date, self.contact_no, self.patient_id))
@@ -120,6 +94,9 @@ class Patient(Person):
                 return False
             else:
                 print("Sucessfully updated the patient details.")
+                patient_cache.invalidate(self.patient_id, session)
+                if session is None:
+                    name_index.record('patients', self.patient_id, self.name)
                 return True
         except mysql.connector.errors.IntegrityError as e:
             print("Integrity error in database: ", e)
@@ -132,12 +109,9 @@ class Patient(Person):
             if 'conn' in locals(): conn.close()
             
     @staticmethod
-    def get_by_id(patient_id):
+    def get_by_id(patient_id, session=None):
         try:
-            conn = get_connection()
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM patients WHERE patient_id = %s", (patient_id,))
-            row = cursor.fetchone()
+            row = patient_cache.get(patient_id, session)
             if row:
                 return Patient(**row)
             else:
@@ -145,24 +119,31 @@ class Patient(Person):
         except Exception as e:
             print("Error retrieving patient record:", e)
             return None
-        finally:
-            if 'cursor' in locals(): cursor.close()
-            if 'conn' in locals(): conn.close()
 
 
     @staticmethod
-    def delete(patient_id):
+    def delete(patient_id, session=None):
         try:
-            conn = get_connection()
+            conn = get_connection(session)
             cursor = conn.cursor()
+            # The patient's bills and appointments go with them
+            before = {**rollups.bills(conn, rollups.keys(conn, 'billing', 'patient_id', patient_id)),
+                      **rollups.appointments(conn, rollups.keys(conn, 'appointments', 'patient_id', patient_id))}
+            booked = scheduling.slots(conn, 'patient_id', patient_id)
             sql = """DELETE FROM patients WHERE patient_id=%s"""
             cursor.execute(sql, (patient_id,))
+            rollups.apply(conn, before, {})
             conn.commit()
             if cursor.rowcount == 0:
                 print(f"No patient found with ID '{patient_id}'.")
                 return False
             else:
                 print("Successfully deleted the patient")
+                patient_cache.invalidate(patient_id, session)
+                for slot in booked:
+                    scheduling.moved(slot, None, session)
+                if session is None:
+                    name_index.record('patients', patient_id)
                 return True
         except Error as e:
             print("Error while deleting patient:", e)
@@ -176,31 +157,30 @@ class Patient(Person):
 
     @staticmethod
     def view():
+        # Streams every row page by page instead of one fetchall()
         try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM patients")
-            rows = cursor.fetchall()
-            print("Patient ID | Name | Age | Gender | Admission Date | Contact Number")
-            for row in rows:
+            print(Patient.VIEW_HEADER)
+            for row in Patient.iter_all(page_size=pagination.BATCH_PAGE_SIZE):
                 print(" | ".join(str(x) for x in row))
         except Error as e:
             print("Error while viewing patients:", e)
         except Exception as e:
             print("Error while viewing patients:", e)
-        finally:
-            if 'cursor' in locals(): cursor.close()
-            if 'conn' in locals(): conn.close()
 
     @staticmethod
-    def days_admitted(patient_id):
-        conn = get_connection()
-        cursor = conn.cursor()
+    def iter_pages(page_size=pagination.PAGE_SIZE, filters=None, sort=None, descending=False, session=None):
+        return pagination.iter_pages('patients', page_size, filters, sort, descending, session)
+
+    @staticmethod
+    def iter_all(page_size=pagination.PAGE_SIZE, filters=None, sort=None, descending=False, session=None):
+        return pagination.iter_rows('patients', page_size, filters, sort, descending, session)
+
+    @staticmethod
+    def days_admitted(patient_id, session=None):
         try:
-            cursor.execute("SELECT admission_date FROM patients WHERE patient_id=%s", (patient_id,))
-            row = cursor.fetchone()
-            if row and row[0]:
-                admission_date = row[0]
+            row = patient_cache.get(patient_id, session)
+            if row and row['admission_date']:
+                admission_date = row['admission_date']
                 today = date.today()
                 days = (today - admission_date).days
                 print(f"Patient {patient_id} has been admitted for {days} days.")
@@ -211,18 +191,29 @@ class Patient(Person):
         except Exception as e:
             print("Error calculating days admitted:", e)
             return None
-        finally:
-            cursor.close()
-            conn.close()
 
     @staticmethod
-    def search_by_name(name_substring):
+    def search_by_name(name_substring, limit=name_index.NAME_SEARCH_LIMIT):
+        # Ranked, typo-tolerant matches from the trigram index; falls back to
+        # the LIKE scan if the index cannot be used
+        try:
+            ids = [key for key, _, _ in name_index.search('patients', name_substring, limit)]
+        except Exception as e:
+            print("Name index unavailable, searching the table instead:", e)
+            ids = None
         conn = get_connection()
         cursor = conn.cursor()
         try:
-            search_pattern = f"%{name_substring}%"
-            cursor.execute("SELECT * FROM patients WHERE name LIKE %s", (search_pattern,))
-            rows = cursor.fetchall()
+            if ids is None:
+                search_pattern = f"%{name_substring}%"
+                cursor.execute("SELECT * FROM patients WHERE name LIKE %s", (search_pattern,))
+                rows = cursor.fetchall()
+            elif ids:
+                cursor.execute(f"SELECT * FROM patients WHERE patient_id IN ({', '.join(['%s'] * len(ids))})", tuple(ids))
+                rank = {key: i for i, key in enumerate(ids)}
+                rows = sorted(cursor.fetchall(), key=lambda row: rank.get(str(row[0]), len(rank)))
+            else:
+                rows = []
             if rows:
                 print("Patient_ID | Name | Age | Gender | Admission Date | Contact Number")
                 for row in rows:
@@ -0,0 +1,362 @@
+import argparse
+import atexit
+import datetime
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+
+# Instrumentation of every cursor handed out by get_connection(). Off unless
+# HMS_QUERY_STATS=1; statistics are merged into HMS_QUERY_STATS_FILE at exit
+# and read back by the report:  python query_stats.py --top 10
+QUERY_STATS_ENABLED = os.environ.get('HMS_QUERY_STATS', '0') == '1'
+QUERY_STATS_FILE = os.environ.get('HMS_QUERY_STATS_FILE', 'query_stats.json')
+SLOW_QUERY_MS = float(os.environ.get('HMS_SLOW_QUERY_MS', 200))
+SLOW_QUERY_LOG = os.environ.get('HMS_SLOW_QUERY_LOG', 'slow_query.log')
+# Parameters can hold patient data, so they stay out of the log by default
+SLOW_QUERY_LOG_PARAMS = os.environ.get('HMS_SLOW_QUERY_LOG_PARAMS', '0') == '1'
+
+# Latency histogram bucket upper bounds, in milliseconds
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float('inf'))
+
+# Frames from these modules are skipped when attributing a call site
+_INTERNAL_FILES = {'db_config.py', 'statement_cache.py', 'sqlite_backend.py', 'query_stats.py'}
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|\?")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    # Statements differing only in literals/placeholders share one entry
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def _call_site():
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = os.path.basename(frame.f_code.co_filename)
+        if filename not in _INTERNAL_FILES:
+            return f"{filename}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return 'unknown'
+
+
+class StatementStats:
+    def __init__(self, statement):
+        self.statement = statement
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.histogram = [0] * len(BUCKETS_MS)
+        self.call_sites = Counter()
+        self.sample = None
+
+    def add(self, elapsed_ms, rows, call_site, sql, params, error):
+        self.count += 1
+        self.errors += 1 if error else 0
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.rows += max(rows, 0)
+        for i, bound in enumerate(BUCKETS_MS):
+            if elapsed_ms <= bound:
+                self.histogram[i] += 1
+                break
+        self.call_sites[call_site] += 1
+        self.sample = (sql, params)
+
+    def percentile(self, pct):
+        # Upper bound of the bucket holding the requested rank
+        if not self.count:
+            return 0.0
+        rank = self.count * pct / 100.0
+        seen = 0
+        for bound, n in zip(BUCKETS_MS, self.histogram):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    @property
+    def mean_ms(self):
+        return self.total_ms / self.count if self.count else 0.0
+
+    def to_dict(self):
+        return {
+            'statement': self.statement,
+            'count': self.count,
+            'errors': self.errors,
+            'total_ms': self.total_ms,
+            'max_ms': self.max_ms,
+            'rows': self.rows,
+            'histogram': self.histogram,
+            'call_sites': dict(self.call_sites),
+            'sample': sample_dict(self.sample),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls(data['statement'])
+        stats.count = data['count']
+        stats.errors = data.get('errors', 0)
+        stats.total_ms = data['total_ms']
+        stats.max_ms = data['max_ms']
+        stats.rows = data['rows']
+        stats.histogram = list(data['histogram'])
+        stats.call_sites = Counter(data['call_sites'])
+        stats.sample = data.get('sample')
+        return stats
+
+    def merge(self, other):
+        self.count += other.count
+        self.errors += other.errors
+        self.total_ms += other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+        self.rows += other.rows
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+        self.call_sites.update(other.call_sites)
+        self.sample = other.sample or self.sample
+
+
+# The last statement text of each entry is kept with the statistics so the
+# index advisor can EXPLAIN it; its parameters only as types unless
+# HMS_SLOW_QUERY_LOG_PARAMS=1, with the values as text
+def sample_dict(sample):
+    # {'sql', 'types', 'params'} from a recorded (sql, params) sample; samples
+    # read back from the file are already in this form
+    if sample is None or isinstance(sample, dict):
+        return sample
+    sql, params = sample
+    if params and isinstance(params, list) and isinstance(params[0], (tuple, list)):
+        params = params[0]  # executemany: the first row
+    params = list(params or ())
+    return {'sql': sql, 'types': [type(p).__name__ for p in params],
+            'params': [None if p is None else str(p) for p in params] if SLOW_QUERY_LOG_PARAMS else None}
+
+
+class QueryRecorder:
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS, slow_query_log=SLOW_QUERY_LOG):
+        self.slow_query_ms = slow_query_ms
+        self.slow_query_log = slow_query_log
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, sql, params, elapsed_ms, rows, call_site, error=False):
+        statement = normalize_sql(sql)
+        with self._lock:
+            stats = self._stats.get(statement)
+            if stats is None:
+                stats = self._stats[statement] = StatementStats(statement)
+            stats.add(elapsed_ms, rows, call_site, sql, params, error)
+        if self.slow_query_log and elapsed_ms >= self.slow_query_ms:
+            self._log_slow(statement, params, elapsed_ms, rows, call_site)
+
+    def _log_slow(self, statement, params, elapsed_ms, rows, call_site):
+        line = f"{datetime.datetime.now().isoformat(timespec='seconds')} {elapsed_ms:.1f}ms rows={rows} {call_site} | {statement}"
+        if SLOW_QUERY_LOG_PARAMS and params:
+            line += f" | params={params!r}"
+        try:
+            with self._lock, open(self.slow_query_log, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+        except OSError:
+            pass
+
+    def statements(self):
+        with self._lock:
+            return list(self._stats.values())
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def save(self, path=QUERY_STATS_FILE):
+        # Accumulate across runs so the report covers more than one process
+        merged = {s.statement: s for s in load_stats(path)}
+        for stats in self.statements():
+            if stats.statement in merged:
+                merged[stats.statement].merge(stats)
+            else:
+                merged[stats.statement] = stats
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump([s.to_dict() for s in merged.values()], f)
+        os.replace(tmp, path)
+        self.reset()
+
+
+def load_stats(path=QUERY_STATS_FILE):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [StatementStats.from_dict(d) for d in json.load(f)]
+
+
+class InstrumentedCursor:
+    # Times execute() plus the fetches that follow it; the statement is
+    # recorded when the cursor runs its next statement or is closed.
+    def __init__(self, cursor, recorder):
+        self._cursor = cursor
+        self._recorder = recorder
+        self._pending = None
+
+    def _finish(self):
+        if self._pending is None:
+            return
+        sql, params, elapsed, fetched, call_site, error = self._pending
+        self._pending = None
+        rows = fetched
+        if not fetched and not getattr(self._cursor, 'with_rows', False):
+            # DML: report affected rows
+            rowcount = getattr(self._cursor, 'rowcount', -1)
+            rows = rowcount if rowcount and rowcount > 0 else 0
+        self._recorder.record(sql, params, elapsed * 1000.0, rows, call_site, error)
+
+    def _run(self, method, sql, params):
+        self._finish()
+        call_site = _call_site()
+        start = time.perf_counter()
+        try:
+            result = method(sql, params) if params is not None else method(sql)
+        except Exception:
+            self._pending = [sql, params, time.perf_counter() - start, 0, call_site, True]
+            self._finish()
+            raise
+        self._pending = [sql, params, time.perf_counter() - start, 0, call_site, False]
+        return result
+
+    def execute(self, operation, params=None):
+        return self._run(self._cursor.execute, operation, params)
+
+    def executemany(self, operation, seq_params):
+        seq_params = list(seq_params)
+        return self._run(self._cursor.executemany, operation, seq_params)
+
+    def _fetch(self, method, *args):
+        start = time.perf_counter()
+        result = method(*args)
+        if self._pending is not None:
+            self._pending[2] += time.perf_counter() - start
+            if isinstance(result, list):
+                self._pending[3] += len(result)
+            elif result is not None:
+                self._pending[3] += 1
+        return result
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(self._cursor.fetchmany, size) if size else self._fetch(self._cursor.fetchmany)
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def close(self):
+        self._finish()
+        self._cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+recorder = None
+_save_registered = False
+
+
+def enable(slow_query_ms=SLOW_QUERY_MS, slow_query_log=SLOW_QUERY_LOG):
+    # Switch recording on for the rest of the process (e.g. from a tool);
+    # what is recorded is saved to QUERY_STATS_FILE at exit
+    global recorder, _save_registered
+    if recorder is None:
+        recorder = QueryRecorder(slow_query_ms, slow_query_log)
+    if not _save_registered:
+        atexit.register(_save_at_exit)
+        _save_registered = True
+    return recorder
+
+
+def disable():
+    global recorder
+    recorder = None
+
+
+def instrument(cursor):
+    if recorder is None:
+        return cursor
+    return InstrumentedCursor(cursor, recorder)
+
+
+def _save_at_exit():
+    # Nothing to save once disable() has switched recording off
+    if recorder is None:
+        return
+    try:
+        recorder.save(QUERY_STATS_FILE)
+    except OSError as e:
+        print("Could not save query statistics:", e)
+
+
+if QUERY_STATS_ENABLED:
+    enable()
+
+
+def report(statements, top=10, sort='total'):
+    keys = {
+        'total': lambda s: s.total_ms,
+        'mean': lambda s: s.mean_ms,
+        'p95': lambda s: s.percentile(95),
+        'max': lambda s: s.max_ms,
+        'count': lambda s: s.count,
+        'rows': lambda s: s.rows,
+    }
+    ranked = sorted(statements, key=keys[sort], reverse=True)[:top]
+    lines = [f"{'#':>3} {'calls':>8} {'total ms':>11} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>9} {'rows':>9}  statement"]
+    for i, s in enumerate(ranked, 1):
+        lines.append(f"{i:>3} {s.count:>8} {s.total_ms:>11.1f} {s.mean_ms:>8.2f} {s.percentile(50):>8.2f} "
+                     f"{s.percentile(95):>8.2f} {s.percentile(99):>8.2f} {s.max_ms:>9.2f} {s.rows:>9}  {s.statement[:100]}")
+        for site, n in s.call_sites.most_common(3):
+            lines.append(f"{'':>44}called {n}x from {site}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Top-N statement report from recorded query statistics.")
+    parser.add_argument('--file', default=QUERY_STATS_FILE)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--sort', choices=['total', 'mean', 'p95', 'max', 'count', 'rows'], default='total')
+    parser.add_argument('--reset', action='store_true', help="delete the statistics file after reporting")
+    args = parser.parse_args()
+
+    statements = load_stats(args.file)
+    if not statements:
+        print(f"No query statistics recorded in {args.file}. Run the application with HMS_QUERY_STATS=1.")
+        return
+    print(report(statements, args.top, args.sort))
+    if args.reset:
+        os.remove(args.file)
+
+
+if __name__ == "__main__":
+    main()
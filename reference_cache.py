@@ -0,0 +1,225 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from db_config import get_connection
+
+# Process-local read-through cache for the reference tables: the services
+# catalog and the doctor directory change rarely but are read on every
+# service usage entry, invoice and edit. Rows are kept for at most
+# REFERENCE_CACHE_TTL seconds (which bounds how stale a change made by
+# another process can be) and the least recently used rows are dropped
+# beyond REFERENCE_CACHE_SIZE. Updates and deletes made here invalidate
+# their row at once, and again when their Session commits. Reads inside a
+# Session go straight to the table, since the transaction may hold changes
+# the cache has not seen.
+# The same cache, with a memory budget and a negative cache for unknown
+# keys, backs Patient.get_by_id (see patient.py).
+REFERENCE_CACHE_SIZE = int(os.environ.get('HMS_REFERENCE_CACHE_SIZE', 1000))
+REFERENCE_CACHE_TTL = float(os.environ.get('HMS_REFERENCE_CACHE_TTL', 300))
+
+
+# Marks a key known not to exist
+_MISSING = object()
+
+
+def _row_bytes(row):
+    # Rough in-memory size: the dict plus its values (keys are shared)
+    if row is _MISSING:
+        return sys.getsizeof(row)
+    return sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row.values())
+
+
+class ReadThroughCache:
+    # max_bytes bounds the estimated size of the cached rows; with
+    # negative_ttl > 0, keys found missing are remembered that long.
+    def __init__(self, table, key_column, capacity=REFERENCE_CACHE_SIZE, ttl=REFERENCE_CACHE_TTL,
+                 max_bytes=None, negative_ttl=0, clock=time.monotonic):
+        self.table = table
+        self.key_column = key_column
+        self.capacity = capacity
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.negative_ttl = negative_ttl
+        self._clock = clock
+        # key: (expires, row or _MISSING, estimated bytes)
+        self._rows = OrderedDict()
+        self._bytes = 0
+        self._listeners = []
+        self._lock = threading.Lock()
+        # Bumped by every invalidation; a load that started before one is
+        # not cached, so a row read just before a commit cannot outlive it
+        self._generation = 0
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _lookup(self, key):
+        now = self._clock()
+        entry = self._rows.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            self._discard(key)
+            self.expirations += 1
+            return None
+        self._rows.move_to_end(key)
+        return entry[1]
+
+    def _discard(self, key):
+        entry = self._rows.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def _store(self, key, row, generation, ttl=None):
+        if generation != self._generation:
+            return
+        self._discard(key)
+        size = _row_bytes(row)
+        self._rows[key] = (self._clock() + (self.ttl if ttl is None else ttl), row, size)
+        self._bytes += size
+        while self._rows and (len(self._rows) > self.capacity
+                              or (self.max_bytes is not None and self._bytes > self.max_bytes)):
+            _, (_, _, size) = self._rows.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+
+    def _fetch(self, keys, session=None):
+        conn = get_connection(session)
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(f"SELECT * FROM {self.table} WHERE {self.key_column} IN ({', '.join(['%s'] * len(keys))})",
+                           tuple(keys))
+            return {str(row[self.key_column]): row for row in cursor.fetchall()}
+        finally:
+            cursor.close()
+            conn.close()
+
+    def get(self, key, session=None):
+        # A copy of the row as a dict, or None when there is no such row
+        return next(iter(self.get_many([key], session).values()), None)
+
+    def get_many(self, keys, session=None):
+        # {key: row} for the keys that exist; the misses share one query
+        keys = [str(k) for k in dict.fromkeys(keys)]
+        if session is not None:
+            return self._fetch(keys, session) if keys else {}
+        found, missing, negative = {}, [], 0
+        with self._lock:
+            for key in keys:
+                row = self._lookup(key)
+                if row is None:
+                    missing.append(key)
+                elif row is _MISSING:
+                    negative += 1
+                else:
+                    found[key] = dict(row)
+            self.hits += len(found)
+            self.negative_hits += negative
+            self.misses += len(missing)
+            generation = self._generation
+        if missing:
+            loaded = self._fetch(missing)
+            with self._lock:
+                for key, row in loaded.items():
+                    self._store(key, row, generation)
+                if self.negative_ttl > 0:
+                    for key in missing:
+                        if key not in loaded:
+                            self._store(key, _MISSING, generation, self.negative_ttl)
+            found.update((key, dict(row)) for key, row in loaded.items())
+        return found
+
+    def invalidate(self, key=None, session=None):
+        # Drops one row (or a remembered miss), or every row when no key is
+        # given, then tells the listeners. Inside a Session the change is not
+        # committed yet, so the row is dropped again once it is.
+        if session is not None:
+            session.on_commit(lambda: self.invalidate(key))
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            if key is None:
+                self._rows.clear()
+                self._bytes = 0
+            else:
+                self._discard(str(key))
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(key)
+
+    def on_invalidate(self, listener):
+        # listener(key) runs after every invalidation (key None: everything),
+        # for caches holding data derived from this table's rows
+        with self._lock:
+            self._listeners.append(listener)
+
+    def warm(self):
+        # Loads up to `capacity` rows with one query; returns how many
+        with self._lock:
+            generation = self._generation
+        conn = get_connection()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(f"SELECT * FROM {self.table} ORDER BY {self.key_column} LIMIT %s", (self.capacity,))
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+        with self._lock:
+            for row in rows:
+                self._store(str(row[self.key_column]), row, generation)
+        return len(rows)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                'size': len(self._rows),
+                'capacity': self.capacity,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
+
+
+services = ReadThroughCache('services', 'service_id')
+doctors = ReadThroughCache('doctors', 'doctor_id')
+CACHES = {'services': services, 'doctors': doctors}
+
+
+def register(name, cache):
+    # Adds a cache to cache_stats(); warm() only loads the reference tables
+    CACHES[name] = cache
+    return cache
+
+
+def warm():
+    # Bulk load at startup; a failure only means the first reads go to the table
+    for name in ('services', 'doctors'):
+        try:
+            CACHES[name].warm()
+        except Exception as e:
+            print(f"Could not warm the {name} cache:", e)
+
+
+def cache_stats():
+    return {name: cache.stats() for name, cache in CACHES.items()}
+
+
+if __name__ == "__main__":
+    warm()
+    for name, stats in cache_stats().items():
+        print(f"{name}: {stats}")
@@ -0,0 +1,283 @@
+import argparse
+import datetime
+
+import db_config
+from db_config import get_connection
+
+# Daily rollups behind the finance dashboards (migration 006), so a report
+# reads one row per day (per service, per doctor) instead of scanning
+# billing, billed_services and appointments:
+#   daily_revenue          day: bills, billed amount
+#   daily_service_revenue  day, service: billed lines, revenue
+#   daily_doctor_revenue   day, doctor: visits, consulting charges
+#   daily_visits           day: visits, consulting charges
+# Bill and Appointment writes, and the Patient, Doctor and Service deletes
+# that cascade to them, snapshot what the rows they touch contribute before
+# and after the change and apply the difference in the same transaction.
+# Lines whose service or doctor has been deleted are kept under the key ''.
+# Writes that bypass the entity classes (bulk loads, SQL run by hand) are
+# not seen; after those run
+#   python rollups.py --rebuild     (or --verify to list the drift)
+#   python rollups.py --report daily|monthly|services|doctors --from 2024-03-01 --to 2024-03-31
+
+# table: (key columns, value columns, grouped query over the base tables)
+ROLLUPS = {
+    'daily_revenue': (('day',), ('bills', 'billed_amount'), """
+        SELECT billing_date, COUNT(*), COALESCE(SUM(total_amount), 0)
+        FROM billing WHERE billing_date IS NOT NULL {where}
+        GROUP BY billing_date
+    """),
+    'daily_service_revenue': (('day', 'service_id'), ('line_count', 'revenue'), """
+        SELECT b.billing_date, COALESCE(bs.service_id, ''), COUNT(*), COALESCE(SUM(bs.cost), 0)
+        FROM billed_services bs JOIN billing b ON b.bill_id = bs.bill_id
+        WHERE b.billing_date IS NOT NULL {where}
+        GROUP BY b.billing_date, COALESCE(bs.service_id, '')
+    """),
+    'daily_doctor_revenue': (('day', 'doctor_id'), ('visits', 'consulting'), """
+        SELECT date, COALESCE(doctor_id, ''), COUNT(*), COALESCE(SUM(consulting_charge), 0)
+        FROM appointments WHERE date IS NOT NULL {where}
+        GROUP BY date, COALESCE(doctor_id, '')
+    """),
+    'daily_visits': (('day',), ('visits', 'consulting'), """
+        SELECT date, COUNT(*), COALESCE(SUM(consulting_charge), 0)
+        FROM appointments WHERE date IS NOT NULL {where}
+        GROUP BY date
+    """),
+}
+
+# The rollups fed by each base table, and how to narrow their grouped
+# queries to some of its rows
+BILL_ROLLUPS = {'daily_revenue': "AND bill_id IN ({keys})", 'daily_service_revenue': "AND b.bill_id IN ({keys})"}
+APPOINTMENT_ROLLUPS = {'daily_doctor_revenue': "AND appt_id IN ({keys})", 'daily_visits': "AND appt_id IN ({keys})"}
+ROLLUP_BATCH = 500
+
+
+def _grouped(cursor, table, where='', args=()):
+    cursor.execute(ROLLUPS[table][2].format(where=where), args)
+    return cursor.fetchall()
+
+
+# The helpers below take the writer's connection and use their own cursor,
+# so the writer's cursor keeps the rowcount of its own statement
+
+def _snapshot(conn, rollups, ids):
+    # {table: [row, ...]}: what the given base rows contribute to each rollup
+    ids = list(dict.fromkeys(ids))
+    snapshot = {table: [] for table in rollups} if ids else {}
+    cursor = conn.cursor()
+    try:
+        for start in range(0, len(ids), ROLLUP_BATCH):
+            chunk = tuple(ids[start:start + ROLLUP_BATCH])
+            keys = ', '.join(['%s'] * len(chunk))
+            for table, where in rollups.items():
+                snapshot[table].extend(_grouped(cursor, table, where.format(keys=keys), chunk))
+    finally:
+        cursor.close()
+    return snapshot
+
+
+def bills(conn, bill_ids):
+    return _snapshot(conn, BILL_ROLLUPS, bill_ids)
+
+
+def appointments(conn, appt_ids):
+    return _snapshot(conn, APPOINTMENT_ROLLUPS, appt_ids)
+
+
+def keys(conn, table, column, value):
+    # Bill or appointment ids of the rows in table whose column equals value,
+    # for writes that cascade to them
+    key = 'appt_id' if table == 'appointments' else 'bill_id'
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT DISTINCT {key} FROM {table} WHERE {column}=%s", (value,))
+        return [row[0] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def apply(conn, before, after):
+    # Adds the change from the before to the after snapshot to the rollup
+    # rows, in the writer's transaction
+    cursor = conn.cursor()
+    try:
+        for table in set(before) | set(after):
+            key_columns, value_columns, _ = ROLLUPS[table]
+            width = len(key_columns)
+            deltas = {}
+            for sign, rows in ((-1, before.get(table, ())), (1, after.get(table, ()))):
+                for row in rows:
+                    key = tuple(str(k) for k in row[:width])
+                    current = deltas.get(key, [0] * len(value_columns))
+                    deltas[key] = [c + sign * (v or 0) for c, v in zip(current, row[width:])]
+            rows = [key + tuple(values) for key, values in deltas.items() if any(values)]
+            if rows:
+                cursor.executemany(_upsert(table), rows)
+    finally:
+        cursor.close()
+
+
+def _upsert(table):
+    key_columns, value_columns, _ = ROLLUPS[table]
+    columns = key_columns + value_columns
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+    if db_config.DB_BACKEND == 'sqlite':
+        return sql + (f" ON CONFLICT({', '.join(key_columns)}) DO UPDATE SET "
+                      + ', '.join(f"{c} = {c} + excluded.{c}" for c in value_columns))
+    return sql + " ON DUPLICATE KEY UPDATE " + ', '.join(f"{c} = {c} + VALUES({c})" for c in value_columns)
+
+
+def rebuild(session=None):
+    # Recomputes every rollup from the base tables; returns {table: rows}
+    conn = get_connection(session)
+    cursor = conn.cursor()
+    counts = {}
+    try:
+        for table in ROLLUPS:
+            rows = _grouped(cursor, table)
+            cursor.execute(f"DELETE FROM {table}")
+            key_columns, value_columns, _ = ROLLUPS[table]
+            columns = key_columns + value_columns
+            cursor.executemany(f"INSERT INTO {table} ({', '.join(columns)}) "
+                               f"VALUES ({', '.join(['%s'] * len(columns))})", rows)
+            counts[table] = len(rows)
+        conn.commit()
+        return counts
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def verify(session=None):
+    # [(table, key, stored, actual)] for rollup rows that differ from the
+    # base tables; rows left at zero by deletes count as matching
+    conn = get_connection(session)
+    cursor = conn.cursor()
+    drift = []
+    try:
+        for table, (key_columns, value_columns, _) in ROLLUPS.items():
+            width = len(key_columns)
+            actual = {tuple(str(k) for k in row[:width]): tuple(float(v) for v in row[width:])
+                      for row in _grouped(cursor, table)}
+            cursor.execute(f"SELECT {', '.join(key_columns + value_columns)} FROM {table}")
+            stored = {tuple(str(k) for k in row[:width]): tuple(float(v) for v in row[width:])
+                      for row in cursor.fetchall()}
+            zero = (0.0,) * len(value_columns)
+            for key in sorted(actual.keys() | stored.keys()):
+                want, have = actual.get(key, zero), stored.get(key, zero)
+                if any(abs(w - h) >= 0.005 for w, h in zip(want, have)):
+                    drift.append((table, key, have, want))
+    finally:
+        cursor.close()
+        conn.close()
+    return drift
+
+
+# --- Dashboard queries ---
+
+def _between(table, columns, start, end, group=''):
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT {columns} FROM {table} WHERE day BETWEEN %s AND %s {group}", (start, end))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def daily_report(start, end):
+    # [(day, bills, billed_amount, visits, consulting)]
+    days = {}
+    for day, bills, amount in _between('daily_revenue', 'day, bills, billed_amount', start, end):
+        days[str(day)] = [bills, float(amount), 0, 0.0]
+    for day, visits, consulting in _between('daily_visits', 'day, visits, consulting', start, end):
+        row = days.setdefault(str(day), [0, 0.0, 0, 0.0])
+        row[2], row[3] = int(visits), float(consulting)
+    return [(day,) + tuple(values) for day, values in sorted(days.items()) if any(values)]
+
+
+def monthly_report(start, end):
+    # daily_report summed per YYYY-MM
+    months = {}
+    for day, *values in daily_report(start, end):
+        current = months.get(day[:7], [0, 0.0, 0, 0.0])
+        months[day[:7]] = [c + v for c, v in zip(current, values)]
+    return [(month,) + tuple(values) for month, values in sorted(months.items())]
+
+
+def service_report(start, end):
+    # [(service_id, service_name, lines, revenue)], highest revenue first
+    rows = _between('daily_service_revenue', 'service_id, SUM(line_count), SUM(revenue)', start, end,
+                    'GROUP BY service_id')
+    names = _names('services', 'service_id', 'service_name', [r[0] for r in rows])
+    return sorted(((sid, names.get(sid, '(deleted)'), int(lines), float(revenue)) for sid, lines, revenue in rows
+                   if lines), key=lambda r: -r[3])
+
+
+def doctor_report(start, end):
+    # [(doctor_id, name, visits, consulting)], most visits first
+    rows = _between('daily_doctor_revenue', 'doctor_id, SUM(visits), SUM(consulting)', start, end,
+                    'GROUP BY doctor_id')
+    names = _names('doctors', 'doctor_id', 'name', [r[0] for r in rows])
+    return sorted(((did, names.get(did, '(none)'), int(visits), float(consulting)) for did, visits, consulting in rows
+                   if visits), key=lambda r: -r[2])
+
+
+def _names(table, key, column, ids):
+    ids = [i for i in ids if i]
+    if not ids:
+        return {}
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT {key}, {column} FROM {table} WHERE {key} IN ({', '.join(['%s'] * len(ids))})",
+                       tuple(ids))
+        return {str(k): name for k, name in cursor.fetchall()}
+    finally:
+        cursor.close()
+        conn.close()
+
+
+REPORTS = {
+    'daily': (daily_report, ('Day', 'Bills', 'Billed', 'Visits', 'Consulting')),
+    'monthly': (monthly_report, ('Month', 'Bills', 'Billed', 'Visits', 'Consulting')),
+    'services': (service_report, ('Service', 'Name', 'Lines', 'Revenue')),
+    'doctors': (doctor_report, ('Doctor', 'Name', 'Visits', 'Consulting')),
+}
+
+
+def print_report(name, start, end):
+    report, header = REPORTS[name]
+    rows = report(start, end)
+    if not rows:
+        print("No activity in this period.")
+        return
+    print(' | '.join(f"{h:>12}" for h in header))
+    for row in rows:
+        print(' | '.join(f"{v:>12,.2f}" if isinstance(v, float) else f"{str(v):>12}" for v in row))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Daily revenue and visit rollups.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--rebuild', action='store_true', help="recompute the rollups from the base tables")
+    group.add_argument('--verify', action='store_true', help="list rollup rows that have drifted")
+    group.add_argument('--report', choices=sorted(REPORTS))
+    parser.add_argument('--from', dest='start', type=datetime.date.fromisoformat, default=datetime.date.min)
+    parser.add_argument('--to', dest='end', type=datetime.date.fromisoformat, default=datetime.date.max)
+    args = parser.parse_args()
+    if args.rebuild:
+        for table, count in rebuild().items():
+            print(f"{table}: {count:,} rows")
+    elif args.verify:
+        drift = verify()
+        for table, key, have, want in drift[:50]:
+            print(f"{table} {'/'.join(key)}: stored {have}, actual {want}")
+        print(f"{len(drift)} rollup rows out of step." if drift else "Rollups are up to date.")
+    else:
+        print_report(args.report, args.start.isoformat(), args.end.isoformat())
+
+
+if __name__ == "__main__":
+    main()
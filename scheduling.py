@@ -0,0 +1,347 @@
+import argparse
+import datetime
+import heapq
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_right
+
+import db_config
+from db_config import get_connection
+
+# Doctor availability. Appointments are booked by the day, so a slot is a
+# (doctor, day) pair that holds up to DOCTOR_DAILY_CAPACITY appointments.
+# The Schedule keeps per doctor the runs of consecutive full days as sorted
+# arrays of day ordinals (plus counts for days that are partly booked), so
+# "is this day free" and "first free day on or after d" are one bisect, and
+# the next free slots for a specialization merge its doctors with a heap.
+# It is loaded from the daily_doctor_revenue rollup (migration 006) on first
+# use, kept current by the Appointment and Doctor writes of this process and
+# reloaded after SCHEDULE_TTL seconds to see other processes' bookings.
+# Double-booking is rejected before the write, inside its transaction: the
+# rollup row of the (doctor, day) is locked and read, and the appointment
+# is only inserted when the doctor has room. HMS_DOCTOR_DAILY_CAPACITY
+# unset or 0 means no limit: every day stays free and nothing is locked.
+#   python scheduling.py --free D12 --date 2024-03-01
+#   python scheduling.py --next Cardiology --from 2024-03-01 --count 5
+DOCTOR_DAILY_CAPACITY = int(os.environ.get('HMS_DOCTOR_DAILY_CAPACITY', 0))
+SCHEDULE_TTL = float(os.environ.get('HMS_SCHEDULE_TTL', 300))
+
+
+def _ordinal(day):
+    if isinstance(day, str):
+        day = datetime.date.fromisoformat(day[:10])
+    return day.toordinal()
+
+
+class DoctorCalendar:
+    # starts[i]..ends[i] are full days, sorted, with a free day between
+    # runs; partial holds the counts of booked days below capacity and
+    # extra the bookings beyond capacity of full days (loaded data only).
+    # Capacity 0 is unlimited: no day is ever full.
+    __slots__ = ('capacity', 'starts', 'ends', 'partial', 'extra')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.starts = array('l')
+        self.ends = array('l')
+        self.partial = {}
+        self.extra = {}
+
+    def _run(self, day):
+        i = bisect_right(self.starts, day) - 1
+        return i if i >= 0 and self.ends[i] >= day else -1
+
+    def booked(self, day):
+        if self._run(day) >= 0:
+            return self.capacity + self.extra.get(day, 0)
+        return self.partial.get(day, 0)
+
+    def is_free(self, day):
+        return self._run(day) < 0
+
+    def next_free(self, day):
+        i = self._run(day)
+        return day if i < 0 else self.ends[i] + 1
+
+    def book(self, day):
+        if self._run(day) >= 0:
+            self.extra[day] = self.extra.get(day, 0) + 1
+            return
+        count = self.partial.pop(day, 0) + 1
+        if not self.capacity or count < self.capacity:
+            self.partial[day] = count
+            return
+        # Joins the runs ending the day before and starting the day after
+        i = bisect_right(self.starts, day)
+        left = i > 0 and self.ends[i - 1] == day - 1
+        right = i < len(self.starts) and self.starts[i] == day + 1
+        if left and right:
+            self.ends[i - 1] = self.ends[i]
+            del self.starts[i], self.ends[i]
+        elif left:
+            self.ends[i - 1] = day
+        elif right:
+            self.starts[i] = day
+        else:
+            self.starts.insert(i, day)
+            self.ends.insert(i, day)
+
+    def release(self, day):
+        i = self._run(day)
+        if i < 0:
+            count = self.partial.pop(day, 0) - 1
+            if count > 0:
+                self.partial[day] = count
+            return
+        if self.extra.get(day):
+            self.extra[day] -= 1
+            if not self.extra[day]:
+                del self.extra[day]
+            return
+        start, end = self.starts[i], self.ends[i]
+        if start == end:
+            del self.starts[i], self.ends[i]
+        elif day == start:
+            self.starts[i] = day + 1
+        elif day == end:
+            self.ends[i] = day - 1
+        else:
+            self.ends[i] = day - 1
+            self.starts.insert(i + 1, day + 1)
+            self.ends.insert(i + 1, end)
+        if self.capacity > 1:
+            self.partial[day] = self.capacity - 1
+
+    @classmethod
+    def from_days(cls, capacity, days):
+        # days: (ordinal, bookings) sorted by day, built in one pass
+        calendar = cls(capacity)
+        starts, ends = calendar.starts, calendar.ends
+        for day, count in days:
+            if not capacity or count < capacity:
+                calendar.partial[day] = count
+                continue
+            if count > capacity:
+                calendar.extra[day] = count - capacity
+            if ends and ends[-1] == day - 1:
+                ends[-1] = day
+            else:
+                starts.append(day)
+                ends.append(day)
+        return calendar
+
+
+class Schedule:
+    def __init__(self, capacity=DOCTOR_DAILY_CAPACITY):
+        self.capacity = capacity
+        self.calendars = {}
+        self.specializations = {}
+        # lower-cased specialization: set of doctor ids
+        self.doctors = {}
+        self.loaded_at = time.monotonic()
+
+    def add_doctor(self, doctor_id, specialization):
+        self.drop_doctor(doctor_id, keep_calendar=True)
+        self.specializations[str(doctor_id)] = specialization
+        self.doctors.setdefault((specialization or '').lower(), set()).add(str(doctor_id))
+        self.calendars.setdefault(str(doctor_id), DoctorCalendar(self.capacity))
+
+    def drop_doctor(self, doctor_id, keep_calendar=False):
+        specialization = self.specializations.pop(str(doctor_id), None)
+        if specialization is not None:
+            self.doctors[(specialization or '').lower()].discard(str(doctor_id))
+        if not keep_calendar:
+            self.calendars.pop(str(doctor_id), None)
+
+    def book(self, doctor_id, day):
+        calendar = self.calendars.get(str(doctor_id))
+        if calendar is not None:
+            calendar.book(_ordinal(day))
+
+    def release(self, doctor_id, day):
+        calendar = self.calendars.get(str(doctor_id))
+        if calendar is not None:
+            calendar.release(_ordinal(day))
+
+    def is_free(self, doctor_id, day):
+        calendar = self.calendars.get(str(doctor_id))
+        return calendar is not None and calendar.is_free(_ordinal(day))
+
+    def next_free(self, specialization, start, count=1):
+        # [(date, doctor_id)] of the first count free slots on or after
+        # start among the doctors of the specialization, earliest first
+        start = _ordinal(start)
+        heap = [(self.calendars[d].next_free(start), d) for d in self.doctors.get(specialization.lower(), ())]
+        heapq.heapify(heap)
+        slots = []
+        while heap and len(slots) < count:
+            day, doctor_id = heapq.heappop(heap)
+            slots.append((datetime.date.fromordinal(day), doctor_id))
+            heapq.heappush(heap, (self.calendars[doctor_id].next_free(day + 1), doctor_id))
+        return slots
+
+    @classmethod
+    def load(cls, capacity=DOCTOR_DAILY_CAPACITY, session=None):
+        conn = get_connection(session)
+        cursor = conn.cursor()
+        try:
+            schedule = cls(capacity)
+            cursor.execute("SELECT doctor_id, specialization FROM doctors")
+            for doctor_id, specialization in cursor.fetchall():
+                schedule.add_doctor(doctor_id, specialization)
+            cursor.close()
+            # One pass over the bookings, a doctor at a time
+            cursor = conn.cursor(buffered=False)
+            cursor.execute("SELECT doctor_id, day, visits FROM daily_doctor_revenue "
+                           "WHERE doctor_id <> '' AND visits > 0 ORDER BY doctor_id, day")
+            current, days = None, []
+            while True:
+                rows = cursor.fetchmany(10000)
+                for doctor_id, day, visits in rows:
+                    if doctor_id != current:
+                        schedule._fill(current, days)
+                        current, days = doctor_id, []
+                    days.append((_ordinal(str(day)), int(visits)))
+                if not rows:
+                    break
+            schedule._fill(current, days)
+            return schedule
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _fill(self, doctor_id, days):
+        if days and str(doctor_id) in self.calendars:
+            self.calendars[str(doctor_id)] = DoctorCalendar.from_days(self.capacity, days)
+
+
+_schedule = None
+_lock = threading.Lock()
+
+
+def get_schedule():
+    # The process-wide Schedule, loaded on first use and after SCHEDULE_TTL
+    global _schedule
+    with _lock:
+        if _schedule is None or time.monotonic() - _schedule.loaded_at > SCHEDULE_TTL:
+            _schedule = Schedule.load()
+        return _schedule
+
+
+def invalidate():
+    global _schedule
+    with _lock:
+        _schedule = None
+
+
+def _loaded():
+    with _lock:
+        return _schedule
+
+
+# --- Hooks for the entity classes ---
+
+def slots(conn, column, value):
+    # [(doctor_id, date)] of the appointments whose column equals value,
+    # read before they change
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT doctor_id, date FROM appointments WHERE {column}=%s", (value,))
+        return [(doctor_id, str(day)) for doctor_id, day in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def slot(conn, appt_id):
+    # (doctor_id, date) of an appointment, or None
+    booked = slots(conn, 'appt_id', appt_id)
+    return booked[0] if booked else None
+
+
+def has_room(conn, doctor_id, day):
+    # Checked before the booking is written, with the (day, doctor) rollup
+    # row locked until commit, so a rejected booking has written no
+    # appointment and used no change_log seq. SQLite: BEGIN IMMEDIATE takes
+    # the database write lock. MySQL: a zero-visit row is upserted first so
+    # there is always a row to lock; FOR UPDATE on a missing row only takes
+    # a gap lock, which two first bookings of the day could both hold.
+    if not doctor_id or not DOCTOR_DAILY_CAPACITY:
+        return True
+    cursor = conn.cursor()
+    try:
+        if db_config.DB_BACKEND == 'sqlite':
+            if not conn.in_transaction:
+                cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT visits FROM daily_doctor_revenue WHERE day=%s AND doctor_id=%s", (str(day), doctor_id))
+        else:
+            cursor.execute("INSERT INTO daily_doctor_revenue (day, doctor_id, visits, consulting) VALUES (%s, %s, 0, 0) "
+                           "ON DUPLICATE KEY UPDATE visits = visits", (str(day), doctor_id))
+            cursor.execute("SELECT visits FROM daily_doctor_revenue WHERE day=%s AND doctor_id=%s FOR UPDATE",
+                           (str(day), doctor_id))
+        row = cursor.fetchone()
+        return row is None or row[0] < DOCTOR_DAILY_CAPACITY
+    finally:
+        cursor.close()
+
+
+def moved(before, after, session=None):
+    # Applies a committed booking change ((doctor_id, date) or None on
+    # either side) to the loaded schedule. Inside a Session the change may
+    # still roll back, so the schedule is reloaded on next use instead.
+    schedule = _loaded()
+    if schedule is None:
+        return
+    if session is not None:
+        invalidate()
+        return
+    with _lock:
+        if before and before[0]:
+            schedule.release(*before)
+        if after and after[0]:
+            schedule.book(*after)
+
+
+def doctor_changed(doctor_id, specialization=None, session=None):
+    # specialization None: the doctor was deleted
+    schedule = _loaded()
+    if schedule is None:
+        return
+    if session is not None:
+        invalidate()
+        return
+    with _lock:
+        if specialization is None:
+            schedule.drop_doctor(doctor_id)
+        else:
+            schedule.add_doctor(doctor_id, specialization)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Doctor availability.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--free', metavar='DOCTOR_ID', help="is the doctor free on --date")
+    group.add_argument('--next', metavar='SPECIALIZATION', help="next free slots for a specialization")
+    parser.add_argument('--date', '--from', dest='day', type=datetime.date.fromisoformat, default=datetime.date.today())
+    parser.add_argument('--count', type=int, default=5)
+    args = parser.parse_args()
+    schedule = get_schedule()
+    if args.free:
+        if args.free not in schedule.calendars:
+            print(f"Doctor ID '{args.free}' not found.")
+        elif schedule.is_free(args.free, args.day):
+            print(f"Doctor {args.free} is free on {args.day}.")
+        else:
+            following = datetime.date.fromordinal(schedule.calendars[args.free].next_free(args.day.toordinal()))
+            print(f"Doctor {args.free} is fully booked on {args.day}; next free day {following}.")
+    else:
+        slots = schedule.next_free(args.next, args.day, args.count)
+        if not slots:
+            print(f"No doctors with specialization '{args.next}'.")
+        for day, doctor_id in slots:
+            print(f"{day}  {doctor_id}")
+
+
+if __name__ == "__main__":
+    main()
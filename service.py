@@ -1,43 +1,35 @@
-import re
 from db_config import get_connection
+from id_allocator import next_id
+import charge_totals
+import pagination
+import reference_cache
+import rollups
+from validation import SERVICE_SCHEMA, SERVICE_USAGE_SCHEMA
 import mysql.connector
 from mysql.connector import IntegrityError, Error
 
 def auto_service_id():
-    from db_config import get_connection
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT service_id FROM services WHERE service_id LIKE 'S%'")
-    ids = [int(row[0][1:]) for row in cursor.fetchall() if row[0][1:].isdigit()]
-    cursor.close()
-    conn.close()
-    next_num = max(ids) + 1 if ids else 1
-    return f"S{next_num:02d}"
+    return next_id('service')
 
 class Service:
+    VIEW_HEADER = "Service_ID | Service Name | Cost"
+
     def __init__(self, service_id, service_name, cost):
         self.service_id = service_id
         self.service_name = service_name
         self.cost = cost
         
     # CRUD OPERATIONS
-    def add(self):
-        # Validate service name
-        if not self.service_name or not re.match(r'^[A-Za-z0-9\s\-_]+$', self.service_name):
-            print("Invalid Service Name.")
-            return False
-        # Validate cost
-        try:
-            cost_val = float(self.cost)
-            if cost_val < 0 or cost_val > 5000:
-                print("Cost must be between 0 and 5000.")
-                return False
-        except ValueError:
-            print("Invalid Cost.")
+    def add(self, session=None):
+        # Validate service name and cost
+        values, errors = SERVICE_SCHEMA.validate(self)
+        if errors:
+            print(errors[0].message)
             return False
+        cost_val = values['cost']
 
         try:
-            conn = get_connection()
+            conn = get_connection(session)
             cursor = conn.cursor()
             sql = "INSERT INTO services (service_id, service_name, cost) VALUES (%s, %s, %s)"
             cursor.execute(sql, (self.service_id, self.service_name, cost_val))
@@ -56,23 +48,16 @@ class Service:
             if 'cursor' in locals(): cursor.close()
             if 'conn' in locals(): conn.close()
 
-    def update(self):
-        # Validate service name
-        if not self.service_name or not re.match(r'^[A-Za-z0-9\s\-_]+$', self.service_name):
-            print("Invalid Service Name.")
-            return False
-        # Validate cost
-        try:
-            cost_val = float(self.cost)
-            if cost_val < 0 or cost_val > 5000:
-                print("Cost must be between 0 and 5000.")
-                return False
-        except ValueError:
-            print("Invalid Cost.")
+    def update(self, session=None):
+        # Validate service name and cost
+        values, errors = SERVICE_SCHEMA.validate(self)
+        if errors:
+            print(errors[0].message)
             return False
+        cost_val = values['cost']
 
         try:
-            conn = get_connection()
+            conn = get_connection(session)
             cursor = conn.cursor()
             sql = "UPDATE services SET service_name=%s, cost=%s WHERE service_id=%s"
             cursor.execute(sql, (self.service_name, cost_val, self.service_id))
@@ -82,6 +67,7 @@ class Service:
                 return False
             else:
                 print("Service updated successfully.")
+                reference_cache.services.invalidate(self.service_id, session)
                 return True
         except Error as e:
             print("Database error while updating service:", e)
@@ -93,32 +79,31 @@ class Service:
             if 'cursor' in locals(): cursor.close()
             if 'conn' in locals(): conn.close()
     @staticmethod
-    def get_by_id(service_id):
+    def get_by_id(service_id, session=None):
         try:
-            conn = get_connection()
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM services WHERE service_id = %s", (service_id,))
-            return cursor.fetchone()
+            return reference_cache.services.get(service_id, session)
         except Exception as e:
             print("Error fetching service:", e)
             return None
-        finally:
-            if 'cursor' in locals(): cursor.close()
-            if 'conn' in locals(): conn.close()
         
     @staticmethod
-    def delete(service_id):
+    def delete(service_id, session=None):
         try:
-            conn = get_connection()
+            conn = get_connection(session)
             cursor = conn.cursor()
+            # Billed lines of the service are kept without one
+            bill_ids = rollups.keys(conn, 'billed_services', 'service_id', service_id)
+            before = rollups.bills(conn, bill_ids)
             sql = "DELETE FROM services WHERE service_id=%s"
             cursor.execute(sql, (service_id,))
+            rollups.apply(conn, before, rollups.bills(conn, bill_ids))
             conn.commit()
             if cursor.rowcount == 0:
                 print("Service ID not found.")
                 return False
             else:
                 print("Service deleted successfully.")
+                reference_cache.services.invalidate(service_id, session)
                 return True
         except Error as e:
             print("Database error while deleting service:", e)
@@ -132,49 +117,43 @@ class Service:
 
     @staticmethod
     def view():
+        # Streams every row page by page instead of one fetchall()
         try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM services")
-            rows = cursor.fetchall()
-            print("Service_ID | Service Name | Cost")
-            for row in rows:
+            print(Service.VIEW_HEADER)
+            for row in Service.iter_all(page_size=pagination.BATCH_PAGE_SIZE):
                 print(" | ".join(str(x) for x in row))
         except Error as e:
             print("Database error while viewing services:", e)
         except Exception as e:
             print("Error while viewing services:", e)
-        finally:
-            if 'cursor' in locals(): cursor.close()
-            if 'conn' in locals(): conn.close()
+
+    @staticmethod
+    def iter_pages(page_size=pagination.PAGE_SIZE, filters=None, sort=None, descending=False, session=None):
+        return pagination.iter_pages('services', page_size, filters, sort, descending, session)
+
+    @staticmethod
+    def iter_all(page_size=pagination.PAGE_SIZE, filters=None, sort=None, descending=False, session=None):
+        return pagination.iter_rows('services', page_size, filters, sort, descending, session)
 
 class ServiceUsageDB:
     @staticmethod
-    def add_service_for_patient(patient_id, service):
+    def add_service_for_patient(patient_id, service, session=None):
         # Data validation
-        if not re.match(r'^[A-Za-z0-9]+$', patient_id):
-            print("Invalid Patient ID.")
-            return
-        if not re.match(r'^[A-Za-z0-9]+$', service.service_id):
-            print("Invalid Service ID.")
-            return
-        if not re.match(r'^[A-Za-z0-9\s\-_]+$', service.service_name):
-            print("Invalid Service Name.")
-            return
-        try:
-            cost = float(service.cost)
-            if cost < 0 or cost > 5000:
-                print("Invalid Cost.")
-                return
-        except ValueError:
-            print("Invalid Cost.")
+        values, errors = SERVICE_USAGE_SCHEMA.validate({
+            'patient_id': patient_id, 'service_id': service.service_id,
+            'service_name': service.service_name, 'cost': service.cost,
+        })
+        if errors:
+            print(errors[0].message)
             return
+        cost = values['cost']
 
         try:
-            conn = get_connection()
+            conn = get_connection(session)
             cursor = conn.cursor()
             sql = "INSERT INTO temp_service_usage (patient_id, service_id, service_name, cost) VALUES (%s, %s, %s, %s)"
             cursor.execute(sql, (patient_id, service.service_id, service.service_name, cost))
+            charge_totals.adjust(cursor, patient_id, service_delta=cost)
             conn.commit()
             print(f"Added {service.service_name} (ID: {service.service_id}, Cost: {cost}) for patient {patient_id}")
         except IntegrityError:
@@ -188,9 +167,9 @@ class ServiceUsageDB:
             if 'conn' in locals(): conn.close()
 
     @staticmethod
-    def get_services_for_patient(patient_id):
+    def get_services_for_patient(patient_id, session=None):
         try:
-            conn = get_connection()
+            conn = get_connection(session)
             cursor = conn.cursor()
             sql = "SELECT service_id, service_name, cost FROM temp_service_usage WHERE patient_id=%s"
             cursor.execute(sql, (patient_id,))
@@ -207,12 +186,18 @@ class ServiceUsageDB:
             if 'conn' in locals(): conn.close()
 
     @staticmethod
-    def clear_services_for_patient(patient_id):
+    def clear_services_for_patient(patient_id, session=None):
         try:
-            conn = get_connection()
+            conn = get_connection(session)
             cursor = conn.cursor()
-            sql = "DELETE FROM temp_service_usage WHERE patient_id=%s"
-            cursor.execute(sql, (patient_id,))
+            # Only the lines counted here are cleared, so the running total
+            # stays right if another line is added meanwhile
+            cursor.execute("SELECT COALESCE(SUM(cost), 0), MAX(id) FROM temp_service_usage WHERE patient_id=%s",
+                           (patient_id,))
+            total, last_id = cursor.fetchone()
+            sql = "DELETE FROM temp_service_usage WHERE patient_id=%s AND id <= %s"
+            cursor.execute(sql, (patient_id, last_id))
+            charge_totals.adjust(cursor, patient_id, service_delta=-total)
             conn.commit()
             print(f"Cleared services for patient {patient_id}")
         except Error as e:
@@ -235,17 +220,12 @@ def service_usage_menu(patient_id):
  
         if choice == '1':
             service_id = input("Enter Service ID: ")
-            # Fetch service details from DB
-            conn = get_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT service_id, service_name, cost FROM services WHERE service_id=%s", (service_id,))
-            row = cursor.fetchone()
-            cursor.close()
-            conn.close()
+            # Service details come from the catalog cache
+            row = Service.get_by_id(service_id)
             if not row:
                 print("Service ID not found.")
             else:
-                service = Service(*row)
+                service = Service(row['service_id'], row['service_name'], row['cost'])
                 ServiceUsageDB.add_service_for_patient(patient_id, service)
  
         elif choice == '2':
@@ -0,0 +1,237 @@
+import argparse
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+
+from mysql.connector import Error
+
+import db_config
+from db_config import get_connection
+from exporter import EXPORT_CHUNK_ROWS, encode_rows
+
+# Full-database export from one consistent point in time. Every worker gets
+# its own connection and read transaction, all opened while writers are held
+# off, so the workers see the same snapshot while dumping tables in
+# parallel:
+#   MySQL:  FLUSH TABLES WITH READ LOCK (or LOCK TABLES ... READ without the
+#           RELOAD privilege), then START TRANSACTION WITH CONSISTENT
+#           SNAPSHOT per worker, then UNLOCK TABLES.
+#   SQLite: BEGIN IMMEDIATE on a coordinator connection blocks writers while
+#           each worker begins its read transaction in WAL mode.
+# The dump is one CSV per table plus manifest.json with row counts and
+# sha256 checksums of the files:
+#   python snapshot.py --dir nightly --gzip --workers 4
+#   python snapshot.py --verify nightly
+
+# table: key column, in roughly decreasing size so big tables start first
+SNAPSHOT_TABLES = [
+    ('billed_services', 'id'),
+    ('appointments', 'appt_id'),
+    ('billing', 'bill_id'),
+    ('temp_service_usage', 'id'),
+    ('patients', 'patient_id'),
+    ('services', 'service_id'),
+    ('doctors', 'doctor_id'),
+]
+SNAPSHOT_WORKERS = int(os.environ.get('HMS_SNAPSHOT_WORKERS', 4))
+
+
+def _lock_writers(cursor):
+    # Returns the method used, so the manifest records how consistency was had
+    if db_config.DB_BACKEND == 'sqlite':
+        cursor.execute("BEGIN IMMEDIATE")
+        return 'BEGIN IMMEDIATE'
+    try:
+        cursor.execute("FLUSH TABLES WITH READ LOCK")
+        return 'FLUSH TABLES WITH READ LOCK'
+    except Error:
+        cursor.execute("LOCK TABLES " + ', '.join(f"{t} READ" for t, _ in SNAPSHOT_TABLES))
+        return 'LOCK TABLES'
+
+
+def _unlock_writers(conn, cursor):
+    if db_config.DB_BACKEND == 'sqlite':
+        conn.rollback()
+    else:
+        cursor.execute("UNLOCK TABLES")
+
+
+def _binlog_position(cursor):
+    # Lets the warehouse replay changes made after the snapshot (MySQL only)
+    if db_config.DB_BACKEND != 'mysql':
+        return None
+    for statement in ("SHOW BINARY LOG STATUS", "SHOW MASTER STATUS"):
+        try:
+            cursor.execute(statement)
+            row = cursor.fetchone()
+            cursor.fetchall()
+            return {'file': row[0], 'position': row[1]} if row else None
+        except Error:
+            continue
+    return None
+
+
+def begin_snapshot(conn):
+    if db_config.DB_BACKEND == 'sqlite':
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        # The read snapshot is taken at the first read, not at BEGIN
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master")
+        cursor.fetchall()
+        cursor.close()
+    else:
+        conn.start_transaction(consistent_snapshot=True, isolation_level='REPEATABLE READ', readonly=True)
+
+
+def dump_table(conn, table, key, path, compress=False, chunk_rows=EXPORT_CHUNK_ROWS):
+    digest = hashlib.sha256()
+    rows_written = 0
+    start = time.perf_counter()
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute(f"SELECT * FROM {table} ORDER BY {key}")
+        header = [d[0] for d in cursor.description]
+        with open(path, 'wb') as out:
+            data = encode_rows([], header)
+            while data:
+                if compress:
+                    # mtime=0 keeps identical snapshots byte-identical
+                    data = gzip.compress(data, mtime=0)
+                out.write(data)
+                digest.update(data)
+                rows = cursor.fetchmany(chunk_rows)
+                rows_written += len(rows)
+                data = encode_rows(rows) if rows else None
+            size = out.tell()
+    finally:
+        cursor.close()
+    return {
+        'file': os.path.basename(path),
+        'rows': rows_written,
+        'bytes': size,
+        'sha256': digest.hexdigest(),
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+def _worker(conn, tables, directory, compress, results, errors):
+    try:
+        while True:
+            try:
+                table, key = tables.get_nowait()
+            except queue.Empty:
+                return
+            path = os.path.join(directory, table + ('.csv.gz' if compress else '.csv'))
+            results[table] = dump_table(conn, table, key, path, compress)
+    except Exception as e:
+        errors.append(e)
+
+
+def export_snapshot(directory=None, compress=False, workers=SNAPSHOT_WORKERS):
+    directory = directory or datetime.datetime.now().strftime("snapshot_%Y%m%d_%H%M%S")
+    os.makedirs(directory, exist_ok=True)
+    workers = max(1, min(workers, len(SNAPSHOT_TABLES)))
+    start = time.perf_counter()
+
+    coordinator = get_connection()
+    lock_cursor = coordinator.cursor()
+    connections = []
+    try:
+        method = _lock_writers(lock_cursor)
+        try:
+            binlog = _binlog_position(lock_cursor)
+            for _ in range(workers):
+                conn = get_connection()
+                connections.append(conn)
+                begin_snapshot(conn)
+            taken_at = datetime.datetime.now().isoformat(timespec='seconds')
+        finally:
+            _unlock_writers(coordinator, lock_cursor)
+    finally:
+        lock_cursor.close()
+        coordinator.close()
+
+    tables = queue.Queue()
+    for entry in SNAPSHOT_TABLES:
+        tables.put(entry)
+    results, errors = {}, []
+    try:
+        threads = [threading.Thread(target=_worker, args=(conn, tables, directory, compress, results, errors))
+                   for conn in connections]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        for conn in connections:
+            conn.rollback()
+            conn.close()
+    if errors:
+        raise errors[0]
+
+    manifest = {
+        'taken_at': taken_at,
+        'backend': db_config.DB_BACKEND,
+        'consistency': method,
+        'binlog': binlog,
+        'compressed': compress,
+        'workers': workers,
+        'seconds': round(time.perf_counter() - start, 3),
+        'tables': {table: results[table] for table, _ in SNAPSHOT_TABLES},
+    }
+    with open(os.path.join(directory, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return directory, manifest
+
+
+def verify(directory):
+    # Returns a list of problems; empty when every file matches the manifest
+    with open(os.path.join(directory, 'manifest.json'), encoding='utf-8') as f:
+        manifest = json.load(f)
+    problems = []
+    for table, entry in manifest['tables'].items():
+        path = os.path.join(directory, entry['file'])
+        if not os.path.exists(path):
+            problems.append(f"{table}: {entry['file']} is missing")
+            continue
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        if digest.hexdigest() != entry['sha256']:
+            problems.append(f"{table}: checksum mismatch for {entry['file']}")
+    return problems
+
+
+def print_manifest(directory, manifest):
+    print(f"Snapshot taken at {manifest['taken_at']} ({manifest['consistency']}) -> {directory}")
+    for table, entry in manifest['tables'].items():
+        print(f"  {table:<20} {entry['rows']:>10} rows  {entry['seconds']:>8.2f}s  sha256 {entry['sha256'][:16]}")
+    print(f"Finished in {manifest['seconds']:.2f}s with {manifest['workers']} worker(s).")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Consistent parallel export of every table.")
+    parser.add_argument('--dir', help="output directory (default: snapshot_<timestamp>)")
+    parser.add_argument('--gzip', action='store_true')
+    parser.add_argument('--workers', type=int, default=SNAPSHOT_WORKERS)
+    parser.add_argument('--verify', metavar='DIR', help="check a snapshot against its manifest")
+    args = parser.parse_args()
+
+    if args.verify:
+        problems = verify(args.verify)
+        for problem in problems:
+            print(problem)
+        print("Snapshot OK." if not problems else f"{len(problems)} problem(s) found.")
+        raise SystemExit(1 if problems else 0)
+    directory, manifest = export_snapshot(args.dir, args.gzip, args.workers)
+    print_manifest(directory, manifest)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+import datetime
+import re
+import sqlite3
+import threading
+from functools import lru_cache
+
+from mysql.connector import errors
+
+import migrate
+
+# SQLite translation of HospitalManagementSystem.sql. ENUM becomes a CHECK
+# constraint; ON DELETE SET NULL / CASCADE work once foreign_keys is enabled.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    patient_id INTEGER PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    age INT CHECK (age>0),
+    gender VARCHAR(5) CHECK (gender IN ('M','F','Other')),
+    admission_date DATE,
+    contact_no VARCHAR(15)
+);
+
+CREATE TABLE IF NOT EXISTS doctors (
+    doctor_id VARCHAR(10) PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    specialization VARCHAR(100),
+    contact_no VARCHAR(15),
+    CONSTRAINT unique_contact_no UNIQUE (contact_no)
+);
+
+CREATE TABLE IF NOT EXISTS services (
+    service_id VARCHAR(10) PRIMARY KEY,
+    service_name VARCHAR(100) NOT NULL,
+    cost DECIMAL(7,2)
+);
+
+CREATE TABLE IF NOT EXISTS appointments (
+    appt_id VARCHAR(10) PRIMARY KEY,
+    patient_id INT,
+    doctor_id VARCHAR(10),
+    date DATE,
+    diagnosis VARCHAR(255),
+    consulting_charge DECIMAL(7,2) DEFAULT 0,
+    FOREIGN KEY (patient_id) REFERENCES patients(patient_id) ON DELETE CASCADE,
+    FOREIGN KEY (doctor_id) REFERENCES doctors(doctor_id) ON DELETE SET NULL
+);
+
+CREATE TABLE IF NOT EXISTS billing (
+    bill_id VARCHAR(10) PRIMARY KEY,
+    patient_id INT,
+    total_amount DECIMAL(10,2),
+    billing_date DATE,
+    FOREIGN KEY (patient_id) REFERENCES patients(patient_id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS temp_service_usage (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id VARCHAR(20) NOT NULL,
+    service_id VARCHAR(20) NOT NULL,
+    service_name VARCHAR(100) NOT NULL,
+    cost DECIMAL(10,2) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS billed_services (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    bill_id VARCHAR(10),
+    patient_id INT,
+    service_id VARCHAR(10),
+    service_name VARCHAR(100),
+    cost DECIMAL(10,2),
+    billed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (bill_id) REFERENCES billing(bill_id) ON DELETE CASCADE,
+    FOREIGN KEY (patient_id) REFERENCES patients(patient_id) ON DELETE CASCADE,
+    FOREIGN KEY (service_id) REFERENCES services(service_id) ON DELETE SET NULL
+);
+"""
+
+# Used to phrase sqlite constraint failures the way MySQL reports them, since
+# the entity classes look for "PRIMARY" / constraint names in the message.
+PRIMARY_KEYS = {
+    'patients': 'patient_id',
+    'doctors': 'doctor_id',
+    'services': 'service_id',
+    'appointments': 'appt_id',
+    'billing': 'bill_id',
+    'temp_service_usage': 'id',
+    'billed_services': 'id',
+}
+UNIQUE_KEYS = {
+    'doctors.contact_no': 'unique_contact_no',
+}
+
+
+def _convert_date(value):
+    try:
+        return datetime.date.fromisoformat(value.decode())
+    except ValueError:
+        return value.decode()
+
+
+def _convert_timestamp(value):
+    try:
+        return datetime.datetime.fromisoformat(value.decode())
+    except ValueError:
+        return value.decode()
+
+
+sqlite3.register_adapter(datetime.date, lambda d: d.isoformat())
+sqlite3.register_adapter(datetime.datetime, lambda d: d.isoformat(sep=' '))
+sqlite3.register_converter('DATE', _convert_date)
+sqlite3.register_converter('TIMESTAMP', _convert_timestamp)
+sqlite3.register_converter('DATETIME', _convert_timestamp)
+
+_TOKEN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|%s|%%")
+
+
+@lru_cache(maxsize=512)
+def translate_sql(sql):
+    # %s placeholders -> ?, leaving quoted literals such as LIKE 'D%' alone
+    def replace(match):
+        token = match.group(0)
+        if token == '%s':
+            return '?'
+        if token == '%%':
+            return '%'
+        return token
+    return _TOKEN.sub(replace, sql)
+
+
+def _regexp(pattern, value):
+    if value is None:
+        return None
+    return _compiled(pattern).search(str(value)) is not None
+
+
+@lru_cache(maxsize=64)
+def _compiled(pattern):
+    return re.compile(pattern)
+
+
+def translate_error(exc):
+    message = str(exc)
+    if isinstance(exc, sqlite3.IntegrityError):
+        match = re.search(r'UNIQUE constraint failed: (\w+)\.(\w+)', message)
+        if match:
+            table, column = match.groups()
+            key = 'PRIMARY' if PRIMARY_KEYS.get(table) == column else UNIQUE_KEYS.get(f"{table}.{column}", column)
+            message = f"Duplicate entry for key '{key}' ({message})"
+        return errors.IntegrityError(msg=message)
+    if isinstance(exc, sqlite3.OperationalError):
+        return errors.OperationalError(msg=message)
+    if isinstance(exc, sqlite3.ProgrammingError):
+        return errors.ProgrammingError(msg=message)
+    if isinstance(exc, sqlite3.DataError):
+        return errors.DataError(msg=message)
+    return errors.DatabaseError(msg=message)
+
+
+class SQLiteCursor:
+    # Mimics the subset of the mysql.connector cursor API used by the
+    # entity classes: %s parameters, dictionary rows, rowcount, fetch*.
+    def __init__(self, connection, dictionary=False):
+        self._connection = connection
+        self._cursor = connection.raw.cursor()
+        self._dictionary = dictionary
+
+    def execute(self, operation, params=None):
+        try:
+            self._cursor.execute(translate_sql(operation), tuple(params) if params else ())
+        except sqlite3.Error as e:
+            raise translate_error(e) from e
+
+    def executemany(self, operation, seq_params):
+        try:
+            self._cursor.executemany(translate_sql(operation), [tuple(p) for p in seq_params])
+        except sqlite3.Error as e:
+            raise translate_error(e) from e
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return dict(zip(self.column_names, row))
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany(size or self._cursor.arraysize)
+        return [self._row(r) for r in rows]
+
+    def fetchall(self):
+        return [self._row(r) for r in self._cursor.fetchall()]
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def column_names(self):
+        return tuple(d[0] for d in self._cursor.description or ())
+
+    @property
+    def with_rows(self):
+        return self._cursor.description is not None
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class SQLiteConnection:
+    def __init__(self, raw):
+        self.raw = raw
+
+    def cursor(self, dictionary=False, **kwargs):
+        return SQLiteCursor(self, dictionary=dictionary)
+
+    def commit(self):
+        try:
+            self.raw.commit()
+        except sqlite3.Error as e:
+            raise translate_error(e) from e
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def start_transaction(self):
+        if not self.raw.in_transaction:
+            self.raw.execute("BEGIN")
+
+    @property
+    def in_transaction(self):
+        return self.raw.in_transaction
+
+    def is_connected(self):
+        try:
+            self.raw.execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def ping(self, reconnect=False, **kwargs):
+        if not self.is_connected():
+            raise errors.InterfaceError(msg="SQLite connection is closed.")
+
+    def close(self):
+        self.raw.close()
+
+
+# Paths whose schema and migrations have been applied in this process; the
+# lock keeps two threads from migrating the same file at once
+_initialized = set()
+_init_lock = threading.Lock()
+
+
+def connect(path, cached_statements=128, timeout=30):
+    raw = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False,
+                          timeout=timeout, cached_statements=cached_statements,
+                          uri=path.startswith('file:'))
+    raw.execute("PRAGMA foreign_keys = ON")
+    raw.create_function('REGEXP', 2, _regexp, deterministic=True)
+    with _init_lock:
+        if path not in _initialized:
+            raw.execute("PRAGMA journal_mode = WAL")
+            raw.executescript(SCHEMA)
+            migrate.apply_sqlite(raw)
+            _initialized.add(path)
+    return SQLiteConnection(raw)
+
+
+def is_alive(conn):
+    return conn.is_connected()
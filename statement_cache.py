@@ -0,0 +1,226 @@
+from collections import OrderedDict
+
+from mysql.connector import Error
+
+
+class PreparedStatementCache:
+    # Per-connection registry of server-side prepared statements, keyed by
+    # SQL text. Each statement keeps its own prepared cursor so the server
+    # parses it once per connection; least recently used statements are
+    # deallocated when the registry is full.
+    def __init__(self, connection, capacity=64):
+        self._connection = connection
+        self.capacity = capacity
+        self._statements = OrderedDict()
+        # The cursor whose result is on the connection, and the
+        # CachedStatementCursor that ran it
+        self.active = None
+        self.owner = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def prepared_cursor(self, sql):
+        entry = self._statements.get(sql)
+        if entry is not None:
+            self._statements.move_to_end(sql)
+            self.hits += 1
+            return entry
+        self.misses += 1
+        # mysql.connector only re-uses a prepared statement when it is given
+        # the very same string object, so the key is stored alongside
+        entry = (sql, self._connection.cursor(prepared=True))
+        self._statements[sql] = entry
+        self._evict()
+        return entry
+
+    def _evict(self):
+        while len(self._statements) > self.capacity:
+            sql, (_, cursor) = next(iter(self._statements.items()))
+            if cursor is self.active:
+                self._statements.move_to_end(sql)
+                if len(self._statements) == 1:
+                    return
+                continue
+            del self._statements[sql]
+            self.evictions += 1
+            try:
+                cursor.close()
+            except Error:
+                pass
+
+    def drain(self):
+        # A result set left unread on the connection blocks the next command.
+        # Its rows are handed to the cursor that ran it, which may still read
+        # them: the prepared cursor is shared by every user of the statement,
+        # so its owner is detached from it even when nothing is left unread.
+        if self.active is None:
+            return
+        rows = []
+        if getattr(self._connection, 'unread_result', False):
+            try:
+                rows = self.active.fetchall()
+            except Error:
+                return
+        owner = self.owner
+        if owner is not None and owner._cursor is self.active:
+            owner._cursor = DrainedResult(self.active, rows)
+            owner._rowcount = owner._cursor.rowcount
+
+    def stats(self):
+        return {
+            'statements': len(self._statements),
+            'capacity': self.capacity,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def close(self):
+        for _, cursor in self._statements.values():
+            try:
+                cursor.close()
+            except Error:
+                pass
+        self._statements.clear()
+        self.active = None
+        self.owner = None
+
+
+class DrainedResult:
+    # The rest of a result set read off the connection by drain(), served
+    # to its CachedStatementCursor as if still unread
+    def __init__(self, cursor, rows):
+        self._rows = rows
+        self._next = 0
+        self.description = cursor.description
+        self.column_names = cursor.column_names
+        self.rowcount = cursor.rowcount
+        self.lastrowid = cursor.lastrowid
+        self.with_rows = cursor.with_rows
+
+    def fetchone(self):
+        if self._next >= len(self._rows):
+            return None
+        self._next += 1
+        return self._rows[self._next - 1]
+
+    def fetchmany(self, size=1):
+        rows = self._rows[self._next:self._next + size]
+        self._next += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._rows[self._next:]
+        self._next = len(self._rows)
+        return rows
+
+
+class CachedStatementCursor:
+    # Drop-in for the plain mysql.connector cursor: parameterised statements
+    # run through the connection's PreparedStatementCache (binary protocol),
+    # anything else on an ordinary text-protocol cursor.
+    def __init__(self, connection, cache, dictionary=False):
+        self._connection = connection
+        self._cache = cache
+        self._dictionary = dictionary
+        self._plain = None
+        self._cursor = None
+        # Taken from the cursor when this cursor runs a statement: another
+        # cursor running the same SQL re-uses the prepared cursor
+        self._rowcount = -1
+        self._lastrowid = None
+        self._description = None
+        self._column_names = ()
+
+    def _capture(self, cursor):
+        self._cursor = cursor
+        self._rowcount = cursor.rowcount
+        self._lastrowid = cursor.lastrowid
+        self._description = cursor.description
+        self._column_names = cursor.column_names
+        self._cache.active = cursor
+        self._cache.owner = self
+
+    def execute(self, operation, params=None):
+        self._cache.drain()
+        if params:
+            operation, cursor = self._cache.prepared_cursor(operation)
+            cursor.execute(operation, tuple(params))
+        else:
+            cursor = self._plain_cursor()
+            cursor.execute(operation)
+        self._capture(cursor)
+
+    def executemany(self, operation, seq_params):
+        # Plain executemany batches INSERTs into one multi-row statement
+        self._cache.drain()
+        cursor = self._plain_cursor()
+        cursor.executemany(operation, seq_params)
+        self._capture(cursor)
+
+    def _plain_cursor(self):
+        if self._plain is None:
+            self._plain = self._connection.cursor()
+        return self._plain
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return dict(zip(self._column_names, row))
+
+    # Unbuffered results count their rows as they are read; drain() detaches
+    # this cursor before anyone else runs on its result's cursor
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        self._rowcount = self._cursor.rowcount
+        return self._row(row)
+
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany(size) if size else self._cursor.fetchmany()
+        self._rowcount = self._cursor.rowcount
+        return [self._row(r) for r in rows]
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._rowcount = self._cursor.rowcount
+        return [self._row(r) for r in rows]
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    @property
+    def rowcount(self):
+        return self._rowcount
+
+    @property
+    def lastrowid(self):
+        return self._lastrowid
+
+    @property
+    def description(self):
+        return self._description
+
+    @property
+    def column_names(self):
+        return self._column_names
+
+    @property
+    def with_rows(self):
+        return self._cursor is not None and self._cursor.with_rows
+
+    def close(self):
+        # Prepared cursors belong to the cache and stay open for re-use
+        if self._cursor is not None and self._cursor is self._cache.active:
+            self._cache.drain()
+            self._cache.active = self._cache.owner = None
+        if self._plain is not None:
+            self._plain.close()
+            self._plain = None
+        self._cursor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
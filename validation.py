@@ -0,0 +1,314 @@
+import datetime
+import re
+from collections import namedtuple
+
+# Declarative validation shared by the entity classes and the bulk loader.
+# Fields are compiled once; a Schema checks one record (validate) or whole
+# columns (validate_batch) and returns cleaned values plus structured errors
+# instead of printing. Column checks join the column and let the regex
+# engine find the failing rows in one call, falling back to the per-value
+# check when a column holds non-strings or embedded newlines.
+
+ValidationError = namedtuple('ValidationError', 'row field message')
+
+_INF = float('inf')
+
+
+class _Invalid:
+    __slots__ = ('message',)
+
+    def __init__(self, message):
+        self.message = message
+
+
+def _line_scanner(pattern):
+    # Returns values -> rows not fully matching pattern, or None when the
+    # pattern can match a newline (it could then run across rows)
+    if re.compile(pattern).search('\n'):
+        return None
+    finditer = re.compile(r'^(?!(?:%s)$).*$' % pattern, re.MULTILINE).finditer
+
+    def bad_rows(values):
+        if not values:
+            return []
+        joined = '\n'.join(values)
+        if joined.count('\n') != len(values) - 1:
+            raise ValueError("embedded newline")
+        rows = []
+        row = pos = 0
+        for match in finditer(joined):
+            start = match.start()
+            row += joined.count('\n', pos, start)
+            pos = start
+            rows.append(row)
+        return rows
+    return bad_rows
+
+
+def _split(values, rows, message):
+    # rows are ascending; slices keep the copying in C
+    if not rows:
+        return values, {}
+    good = []
+    prev = 0
+    for row in rows:
+        good.extend(values[prev:row])
+        prev = row + 1
+    good.extend(values[prev:])
+    return good, dict.fromkeys(rows, message)
+
+
+def _merge(values, good, bad):
+    # Puts converted good values back in row order, None for the bad rows
+    if not bad:
+        return list(good), bad
+    cleaned = []
+    taken = prev = 0
+    for row in sorted(bad):
+        n = row - prev
+        cleaned.extend(good[taken:taken + n])
+        cleaned.append(None)
+        taken += n
+        prev = row + 1
+    cleaned.extend(good[taken:])
+    return cleaned, bad
+
+
+class Field:
+    def __init__(self, name, check, message, column=None):
+        self.name = name
+        self.message = message
+        self.check = check
+        # values -> (cleaned, {row: message}); raises TypeError/ValueError to
+        # fall back to check() per value
+        self.column = column
+
+    def check_column(self, values):
+        if self.column is not None:
+            try:
+                return self.column(values)
+            except (TypeError, ValueError):
+                pass
+        check = self.check
+        cleaned = [check(v) for v in values]
+        bad = {}
+        for row, result in enumerate(cleaned):
+            if type(result) is _Invalid:
+                bad[row] = result.message
+                cleaned[row] = None
+        return cleaned, bad
+
+    @classmethod
+    def text(cls, name, message, pattern=None):
+        fullmatch = re.compile(pattern).fullmatch if pattern else None
+        scan = _line_scanner(pattern) if pattern else None
+
+        def check(value):
+            if not value or not isinstance(value, str) or (fullmatch and fullmatch(value) is None):
+                return _Invalid(message)
+            return value
+
+        def column(values):
+            if scan is None:
+                raise TypeError
+            good, bad = _split(values, scan(values), message)
+            return _merge(values, good, bad)
+        return cls(name, check, message, column)
+
+    @classmethod
+    def predicate(cls, name, message, test):
+        def check(value):
+            try:
+                if value is not None and value != '' and test(value):
+                    return value
+            except (TypeError, ValueError):
+                pass
+            return _Invalid(message)
+        return cls(name, check, message)
+
+    @classmethod
+    def integer(cls, name, message, minimum=None, maximum=None, range_message=None):
+        return cls._numeric(name, message, int, r'\s*[+-]?\d+(?:_\d+)*\s*', minimum, maximum, range_message)
+
+    @classmethod
+    def number(cls, name, message, minimum=None, maximum=None, range_message=None):
+        return cls._numeric(name, message, float, None, minimum, maximum, range_message)
+
+    @classmethod
+    def _numeric(cls, name, message, convert, shape, minimum, maximum, range_message):
+        low = -_INF if minimum is None else minimum
+        high = _INF if maximum is None else maximum
+        range_message = range_message or message
+        scan = _line_scanner(shape) if shape else None
+
+        def check(value):
+            try:
+                number = convert(value)
+            except (TypeError, ValueError):
+                return _Invalid(message)
+            if not low <= number <= high:
+                return _Invalid(range_message)
+            return number
+
+        def column(values):
+            good, bad = _split(values, scan(values), message) if scan else (values, {})
+            numbers = list(map(convert, good))
+            cleaned, bad = _merge(values, numbers, bad)
+            if numbers and not (low <= min(numbers) and max(numbers) <= high):
+                for row, number in enumerate(cleaned):
+                    if number is not None and not low <= number <= high:
+                        bad[row] = range_message
+                        cleaned[row] = None
+            return cleaned, bad
+        return cls(name, check, message, column)
+
+    @classmethod
+    def choice(cls, name, message, options):
+        options = frozenset(options)
+
+        def check(value):
+            try:
+                if value in options:
+                    return value
+            except TypeError:
+                pass
+            return _Invalid(message)
+
+        def column(values):
+            found = list(map(options.__contains__, values))
+            if all(found):
+                return list(values), {}
+            rows = [i for i, ok in enumerate(found) if not ok]
+            return _merge(values, *_split(values, rows, message))
+        return cls(name, check, message, column)
+
+    @classmethod
+    def date(cls, name, message):
+        # YYYY-MM-DD string or date object, cleaned to the ISO string
+        shape = r'\d{4}-\d{2}-\d{2}'
+        fullmatch = re.compile(shape).fullmatch
+        scan = _line_scanner(shape)
+
+        def check(value):
+            if isinstance(value, datetime.date):
+                return value.strftime("%Y-%m-%d")
+            if not isinstance(value, str) or fullmatch(value) is None:
+                return _Invalid(message)
+            try:
+                datetime.date(int(value[:4]), int(value[5:7]), int(value[8:]))
+            except ValueError:
+                return _Invalid(message)
+            return value
+
+        def column(values):
+            good, bad = _split(values, scan(values), message)
+            # Shape is settled; this only trips on impossible days (-> fallback)
+            list(map(datetime.date.fromisoformat, good))
+            return _merge(values, good, bad)
+        return cls(name, check, message, column)
+
+    @classmethod
+    def digits(cls, name, message, min_length):
+        scan = _line_scanner(r'\d{%d,}' % min_length)
+
+        def check(value):
+            if not isinstance(value, str) or not value.isdigit() or len(value) < min_length:
+                return _Invalid(message)
+            return value
+
+        def column(values):
+            good, bad = _split(values, scan(values), message)
+            return _merge(values, good, bad)
+        return cls(name, check, message, column)
+
+
+class Schema:
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = list(fields)
+
+    def validate(self, record):
+        # record: dict or object with the field names as attributes
+        get = record.get if isinstance(record, dict) else lambda n: getattr(record, n, None)
+        cleaned = {}
+        errors = []
+        for field in self.fields:
+            result = field.check(get(field.name))
+            if type(result) is _Invalid:
+                errors.append(ValidationError(None, field.name, result.message))
+            else:
+                cleaned[field.name] = result
+        return cleaned, errors
+
+    def validate_batch(self, columns):
+        # columns: {field name: sequence of values}, all the same length.
+        # Returns cleaned columns (None where invalid) and every error, tagged
+        # with its row index, ordered by row.
+        length = len(next(iter(columns.values()))) if columns else 0
+        cleaned = {}
+        errors = []
+        for field in self.fields:
+            values = columns.get(field.name)
+            if values is None:
+                values = [None] * length
+            cleaned[field.name], bad = field.check_column(values)
+            errors.extend(ValidationError(row, field.name, message) for row, message in bad.items())
+        errors.sort(key=lambda e: e.row)
+        return cleaned, errors
+
+    def validate_rows(self, rows):
+        # rows: sequence of dicts, transposed once and checked by column
+        columns = {f.name: [r.get(f.name) for r in rows] for f in self.fields}
+        return self.validate_batch(columns)
+
+
+def errors_by_row(errors):
+    grouped = {}
+    for error in errors:
+        grouped.setdefault(error.row, []).append(error)
+    return grouped
+
+
+NAME_PATTERN = r'[A-Za-z. ]+'
+SERVICE_NAME_PATTERN = r'[A-Za-z0-9\s\-_]+'
+ID_PATTERN = r'[A-Za-z0-9]+'
+
+PATIENT_SCHEMA = Schema('patient', [
+    Field.text('name', "Invalid Name.", NAME_PATTERN),
+    Field.integer('age', "Invalid Age. Must be a number.", 0, 120, "Invalid Age. Must be between 0 and 120."),
+    Field.choice('gender', "Invalid Gender. Choose from M, F, Other.", ['M', 'F', 'Other']),
+    Field.date('admission_date', "Invalid Admission Date. Use YYYY-MM-DD format."),
+    Field.digits('contact_no', "Invalid Contact Number. Must be at least 10 digits.", 10),
+])
+
+DOCTOR_SCHEMA = Schema('doctor', [
+    Field.text('name', "Invalid Name.", NAME_PATTERN),
+    Field.predicate('specialization', "Invalid Specialization.",
+                    lambda v: all(x.isalpha() or x.isspace() for x in v)),
+    Field.digits('contact_no', "Invalid Contact Number.", 10),
+])
+
+SERVICE_SCHEMA = Schema('service', [
+    Field.text('service_name', "Invalid Service Name.", SERVICE_NAME_PATTERN),
+    Field.number('cost', "Invalid Cost.", 0, 5000, "Cost must be between 0 and 5000."),
+])
+
+APPOINTMENT_SCHEMA = Schema('appointment', [
+    Field.predicate('patient_id', "Invalid Patient ID.", lambda v: str(v).isdigit()),
+    Field.text('doctor_id', "Invalid Doctor ID."),
+    Field.date('date', "Invalid Date. Use YYYY-MM-DD format."),
+    Field.text('diagnosis', "Invalid Diagnosis."),
+])
+
+SERVICE_USAGE_SCHEMA = Schema('service_usage', [
+    Field.text('patient_id', "Invalid Patient ID.", ID_PATTERN),
+    Field.text('service_id', "Invalid Service ID.", ID_PATTERN),
+    Field.text('service_name', "Invalid Service Name.", SERVICE_NAME_PATTERN),
+    Field.number('cost', "Invalid Cost.", 0, 5000),
+])
+
+BILL_SCHEMA = Schema('bill', [
+    Field.predicate('bill_id', "Bill ID is required.", bool),
+    Field.predicate('patient_id', "Patient ID is required.", bool),
+    Field.date('billing_date', "Invalid Billing Date. Use YYYY-MM-DD format."),
+])
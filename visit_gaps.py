@@ -0,0 +1,216 @@
+import argparse
+import csv
+import itertools
+import math
+
+import db_config
+from db_config import get_connection
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Days between consecutive appointments, for every patient in one pass:
+# appointments are streamed once ordered by (patient_id, date) and the gaps
+# and per-patient summaries are computed on whole arrays with NumPy (or in
+# plain Python, a patient at a time, when NumPy is not installed).
+# Appointment.days_between_appointments stays the single-patient view;
+# population jobs such as readmission risk should call analyze() instead of
+# looping over it.
+#   python visit_gaps.py                        (population summary)
+#   python visit_gaps.py --patient 1001         (one patient's gaps)
+#   python visit_gaps.py --out visit_gaps.csv   (per-patient summaries)
+GAP_FETCH_ROWS = 50000
+# Dates come back as day numbers, which spares building a date object per
+# row; each backend counts from its own epoch, so only differences are used
+DAY_NUMBER = {'mysql': "TO_DAYS(date)", 'sqlite': "CAST(julianday(date) AS INTEGER)"}
+PERCENTILES = (50, 90)
+SUMMARY_COLUMNS = ('patient_id', 'visits', 'mean', 'median', 'p90', 'min', 'max')
+
+
+def _rows(session=None):
+    # Chunks of (patient_id, day number) ordered by patient, then date
+    conn = get_connection(session)
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute(f"SELECT patient_id, {DAY_NUMBER[db_config.DB_BACKEND]} FROM appointments "
+                       "WHERE date IS NOT NULL AND patient_id IS NOT NULL ORDER BY patient_id, date")
+        while True:
+            rows = cursor.fetchmany(GAP_FETCH_ROWS)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _percentile(values, q):
+    # Linear interpolation between closest ranks, as numpy.percentile
+    rank = (len(values) - 1) * q / 100
+    low = math.floor(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+class VisitGaps:
+    # Gaps for every patient with two or more appointments, in one flat
+    # sequence: patient_ids[i]'s gaps are gaps[offsets[i]:offsets[i + 1]],
+    # in visit order. visits/mean/median/p90/minimum/maximum are aligned
+    # with patient_ids. Arrays under NumPy, lists without it.
+    def __init__(self, patient_ids, offsets, gaps, visits, mean, median, p90, minimum, maximum):
+        self.patient_ids = patient_ids
+        self.offsets = offsets
+        self.gaps = gaps
+        self.visits = visits
+        self.mean = mean
+        self.median = median
+        self.p90 = p90
+        self.minimum = minimum
+        self.maximum = maximum
+        self._index = None
+
+    def __len__(self):
+        return len(self.patient_ids)
+
+    def _position(self, patient_id):
+        if self._index is None:
+            self._index = {int(p): i for i, p in enumerate(self.patient_ids)}
+        return self._index.get(int(patient_id))
+
+    def for_patient(self, patient_id):
+        # The patient's gaps in days, or None with fewer than two visits
+        i = self._position(patient_id)
+        return None if i is None else self.gaps[self.offsets[i]:self.offsets[i + 1]]
+
+    def by_patient(self):
+        # {patient_id: gaps}
+        return {int(p): self.gaps[self.offsets[i]:self.offsets[i + 1]] for i, p in enumerate(self.patient_ids)}
+
+    def summaries(self):
+        # Yields one tuple per patient in SUMMARY_COLUMNS order
+        for row in zip(self.patient_ids, self.visits, self.mean, self.median, self.p90, self.minimum, self.maximum):
+            yield (int(row[0]), int(row[1])) + tuple(float(v) for v in row[2:5]) + (int(row[5]), int(row[6]))
+
+    def population(self):
+        # Distribution of every gap in the population
+        if not len(self.gaps):
+            return {'patients': 0, 'gaps': 0}
+        if not isinstance(self.gaps, list):
+            p50, p90 = np.percentile(self.gaps, PERCENTILES)
+            return {'patients': len(self), 'gaps': int(self.gaps.size), 'mean': float(self.gaps.mean()),
+                    'median': float(p50), 'p90': float(p90), 'max': int(self.gaps.max())}
+        ordered = sorted(self.gaps)
+        return {'patients': len(self), 'gaps': len(ordered), 'mean': sum(ordered) / len(ordered),
+                'median': _percentile(ordered, 50), 'p90': _percentile(ordered, 90), 'max': ordered[-1]}
+
+
+def _analyze_numpy(chunks):
+    rows = [np.fromiter(itertools.chain.from_iterable(rows), dtype=np.int64, count=2 * len(rows)).reshape(-1, 2)
+            for rows in chunks]
+    rows = np.concatenate(rows) if rows else np.empty((0, 2), np.int64)
+    patients, days = rows[:, 0], rows[:, 1]
+
+    # A gap is a pair of neighbouring rows of the same patient
+    same = patients[1:] == patients[:-1]
+    gaps = (days[1:] - days[:-1])[same]
+    owners = patients[1:][same]
+    starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]]) if owners.size else np.empty(0, np.intp)
+    offsets = np.r_[starts, owners.size]
+    counts = np.diff(offsets)
+    patient_ids = owners[starts]
+    if not counts.size:
+        empty = np.empty(0)
+        return VisitGaps(patient_ids, offsets, gaps, counts, empty, empty, empty, counts, counts)
+
+    # Percentiles per patient: sort each patient's gaps in place of the
+    # flat array, then interpolate at offset + q * (count - 1)
+    ordered = gaps[np.lexsort((gaps, owners))].astype(np.float64)
+
+    def percentile(q):
+        rank = starts + (counts - 1) * (q / 100)
+        low = np.floor(rank).astype(np.intp)
+        high = np.minimum(low + 1, offsets[1:] - 1)
+        return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+    mean = np.add.reduceat(gaps, starts) / counts
+    return VisitGaps(patient_ids, offsets, gaps, counts + 1, mean, percentile(50), percentile(90),
+                     np.minimum.reduceat(gaps, starts), np.maximum.reduceat(gaps, starts))
+
+
+def _analyze_python(chunks):
+    patient_ids, offsets, gaps, visits, mean, median, p90, minimum, maximum = [], [0], [], [], [], [], [], [], []
+    current, last, own = None, None, []
+
+    def close():
+        if own:
+            ordered = sorted(own)
+            patient_ids.append(current)
+            gaps.extend(own)
+            offsets.append(len(gaps))
+            visits.append(len(own) + 1)
+            mean.append(sum(own) / len(own))
+            median.append(_percentile(ordered, 50))
+            p90.append(_percentile(ordered, 90))
+            minimum.append(ordered[0])
+            maximum.append(ordered[-1])
+
+    for rows in chunks:
+        for patient_id, day in rows:
+            if patient_id != current:
+                close()
+                current, own = patient_id, []
+            else:
+                own.append(day - last)
+            last = day
+    close()
+    return VisitGaps(patient_ids, offsets, gaps, visits, mean, median, p90, minimum, maximum)
+
+
+def analyze(session=None, use_numpy=True):
+    # VisitGaps for every patient, from one ordered pass over appointments
+    chunks = _rows(session)
+    if use_numpy and np is not None:
+        return _analyze_numpy(chunks)
+    return _analyze_python(chunks)
+
+
+def write_summaries(result, filename):
+    with open(filename, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(SUMMARY_COLUMNS)
+        writer.writerows((p, v, f"{m:.2f}", f"{md:.1f}", f"{p9:.1f}", lo, hi)
+                         for p, v, m, md, p9, lo, hi in result.summaries())
+
+
+def print_population(summary):
+    if not summary['gaps']:
+        print("No patient has two or more appointments.")
+    else:
+        print(f"{summary['patients']:,} patients, {summary['gaps']:,} gaps: mean {summary['mean']:.1f} days, "
+              f"median {summary['median']:.1f}, p90 {summary['p90']:.1f}, max {summary['max']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Days between appointments for every patient.")
+    parser.add_argument('--patient', type=int, help="print one patient's gaps")
+    parser.add_argument('--out', help="write per-patient summaries to this CSV file")
+    parser.add_argument('--no-numpy', action='store_true', help="use the plain Python path")
+    args = parser.parse_args()
+    result = analyze(use_numpy=not args.no_numpy)
+    if args.patient is not None:
+        gaps = result.for_patient(args.patient)
+        if gaps is None:
+            print(f"Patient {args.patient} has fewer than two appointments.")
+        else:
+            print(f"Patient {args.patient}: {', '.join(str(int(g)) for g in gaps)} days")
+        return
+    print_population(result.population())
+    if args.out:
+        write_summaries(result, args.out)
+        print(f"Per-patient summaries written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()